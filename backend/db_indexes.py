@@ -0,0 +1,203 @@
+"""Declared MongoDB indexes for every query path in server.py
+
+Applied idempotently at startup and available as a CLI:
+
+    python db_indexes.py            # report missing/extra indexes
+    python db_indexes.py --apply    # create missing indexes, then report
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from mongo_dates import CODEC_OPTIONS
+from retention import RetentionPolicy
+
+logger = logging.getLogger(__name__)
+
+# Options compared between declared and existing indexes
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        # Login, registration and password reset look users up by email
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "training_sessions": [
+        IndexModel([("session_id", ASCENDING)], unique=True),
+        # Latest session for a scenario: find_one(user_id, scenario_id).sort(created_at, -1)
+        IndexModel([("user_id", ASCENDING), ("scenario_id", ASCENDING), ("created_at", DESCENDING)]),
+        # Retention sweep for abandoned sessions
+        IndexModel([("status", ASCENDING), ("last_message_at", ASCENDING)]),
+    ],
+    "training_message_buckets": [
+        IndexModel([("session_id", ASCENDING), ("bucket", ASCENDING)], unique=True),
+    ],
+    "training_late_responses": [
+        IndexModel([("session_id", ASCENDING)]),
+    ],
+    "payment_transactions": [
+        IndexModel([("session_id", ASCENDING)]),
+    ],
+    # Keyset pagination pages through (user_id, _id) ranges
+    "progress": [
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)]),
+        # Lets /progress/batch report re-sent records as duplicates
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "dialog_sessions": [
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("id", ASCENDING)]),
+    ],
+    "weekly_progress": [
+        IndexModel([("user_id", ASCENDING), ("week_number", ASCENDING)]),
+    ],
+    "community_cases": [
+        # Most helpful first, paged on (helpful_count, _id)
+        IndexModel([("helpful_count", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("id", ASCENDING)]),
+    ],
+    # Owned by llm_cache / llm_metrics, which also create them on gateway start
+    "llm_response_cache": [
+        IndexModel([("key", ASCENDING)], unique=True),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "llm_usage_daily": [
+        IndexModel(
+            [("day", ASCENDING), ("endpoint", ASCENDING), ("tier", ASCENDING), ("model", ASCENDING)],
+            unique=True
+        ),
+    ],
+}
+
+
+def declared_indexes(policy: Optional[RetentionPolicy] = None) -> Dict[str, List[IndexModel]]:
+    """INDEXES plus the TTL indexes whose retention comes from the environment"""
+    indexes = {collection: list(models) for collection, models in INDEXES.items()}
+    for collection, models in (policy or RetentionPolicy.from_env()).ttl_indexes().items():
+        indexes.setdefault(collection, []).extend(models)
+    return indexes
+
+
+def _options(index: dict) -> dict:
+    return {option: index[option] for option in INDEX_OPTIONS if option in index}
+
+
+async def index_report(db, indexes: Optional[Dict[str, List[IndexModel]]] = None) -> dict:
+    """Compare declared indexes with the database, per collection"""
+    indexes = indexes or declared_indexes()
+    report = {}
+    for collection, models in indexes.items():
+        existing = {}
+        async for index in db[collection].list_indexes():
+            if index["name"] != "_id_":
+                existing[index["name"]] = index
+
+        declared = {model.document["name"]: model.document for model in models}
+        mismatched = [
+            name for name, document in declared.items()
+            if name in existing and _options(existing[name]) != _options(document)
+        ]
+        report[collection] = {
+            "missing": sorted(set(declared) - set(existing)),
+            "extra": sorted(set(existing) - set(declared)),
+            "mismatched": sorted(mismatched),
+        }
+    return report
+
+
+async def ensure_indexes(db, indexes: Optional[Dict[str, List[IndexModel]]] = None) -> dict:
+    """Create every declared index that is missing and return the resulting report
+
+    Indexes are never dropped; extra and mismatched ones are only reported,
+    except that a changed TTL retention is applied in place with collMod.
+    A failing collection (e.g. duplicate emails blocking the unique index) is
+    logged and recorded under "error" without stopping the others.
+    """
+    indexes = indexes or declared_indexes()
+    errors = {}
+    for collection, models in indexes.items():
+        try:
+            await _sync_ttl(db, collection, models)
+            await db[collection].create_indexes(models)
+        except Exception as e:
+            errors[collection] = str(e)
+            logger.error(f"Index creation failed for {collection}: {str(e)}")
+
+    report = await index_report(db, indexes)
+    for collection, error in errors.items():
+        report[collection]["error"] = error
+    return report
+
+
+async def _sync_ttl(db, collection: str, models: List[IndexModel]):
+    """Update expireAfterSeconds of existing TTL indexes whose retention was reconfigured"""
+    existing = {}
+    async for index in db[collection].list_indexes():
+        existing[index["name"]] = index
+    for model in models:
+        document = model.document
+        current = existing.get(document["name"])
+        if (
+            current is not None
+            and "expireAfterSeconds" in document
+            and current.get("expireAfterSeconds") != document["expireAfterSeconds"]
+        ):
+            await db.command("collMod", collection, index={
+                "keyPattern": document["key"],
+                "expireAfterSeconds": document["expireAfterSeconds"]
+            })
+            logger.info(f"{collection}: TTL of {document['name']} set to {document['expireAfterSeconds']}s")
+
+
+def has_problems(report: dict) -> bool:
+    return any(
+        entry["missing"] or entry["mismatched"] or entry.get("error")
+        for entry in report.values()
+    )
+
+
+def log_report(report: dict):
+    for collection, entry in report.items():
+        if entry["missing"]:
+            logger.warning(f"{collection}: missing indexes {entry['missing']}")
+        if entry["mismatched"]:
+            logger.warning(f"{collection}: indexes with different options {entry['mismatched']}")
+        if entry["extra"]:
+            logger.info(f"{collection}: undeclared indexes {entry['extra']}")
+
+
+async def _main(apply: bool) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    mongo_url = os.environ.get('MONGO_URL')
+    if not mongo_url:
+        print("MONGO_URL environment variable is required", file=sys.stderr)
+        return 2
+
+    client = AsyncIOMotorClient(mongo_url, **CODEC_OPTIONS)
+    try:
+        db = client.get_database(os.environ.get('MONGO_DB_NAME', 'app_database'))
+        report = await (ensure_indexes(db) if apply else index_report(db))
+    finally:
+        client.close()
+
+    print(json.dumps(report, indent=2))
+    return 1 if has_problems(report) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check or apply the declared MongoDB indexes")
+    parser.add_argument("--apply", action="store_true", help="create missing indexes before reporting")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(args.apply)))
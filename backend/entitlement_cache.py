@@ -0,0 +1,52 @@
+"""In-process TTL/LRU cache of user entitlements for PRO feature gating"""
+import os
+from typing import Any, Awaitable, Callable, Optional
+
+from cachetools import TTLCache
+
+
+class EntitlementCache:
+    """Caches subscription fields per user id
+
+    Entries hold subscription_expires_at, so an expired subscription is
+    detected at check time without going back to Mongo. The TTL only bounds
+    how long a change made by another process (or directly in the database)
+    can go unnoticed; payment and admin paths in this process invalidate
+    explicitly.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Bumped on every invalidation so a lookup that raced with one is not stored
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @classmethod
+    def from_env(cls) -> "EntitlementCache":
+        """Build the cache from ENTITLEMENT_CACHE_* environment variables"""
+        return cls(
+            maxsize=int(os.environ.get("ENTITLEMENT_CACHE_SIZE", 10000)),
+            ttl=float(os.environ.get("ENTITLEMENT_CACHE_TTL_SECONDS", 300)),
+        )
+
+    async def get(self, user_id: str, load: Callable[[str], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        """Return the cached entitlement or load and cache it; unknown users are not cached"""
+        entitlement = self._entries.get(user_id)
+        if entitlement is not None:
+            self._stats["hits"] += 1
+            return entitlement
+
+        self._stats["misses"] += 1
+        generation = self._generation
+        entitlement = await load(user_id)
+        if entitlement is not None and generation == self._generation:
+            self._entries[user_id] = entitlement
+        return entitlement
+
+    def invalidate(self, user_id: str):
+        self._generation += 1
+        self._stats["invalidations"] += 1
+        self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {**self._stats, "size": len(self._entries), "maxsize": self._entries.maxsize, "ttl_seconds": self._entries.ttl}
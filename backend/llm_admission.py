@@ -0,0 +1,131 @@
+"""Admission control for outgoing LLM calls"""
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+from fastapi import HTTPException
+
+# Priority classes, lower value is served first
+PRIORITY_INTERACTIVE = 0  # Live training turns
+PRIORITY_PRO_ANALYSIS = 1  # PRO analysis features (dialog coaching, community cases)
+PRIORITY_BATCH = 2  # Background and bulk generation
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_PRO_ANALYSIS: "pro_analysis",
+    PRIORITY_BATCH: "batch",
+}
+
+
+class LlmOverloadedError(HTTPException):
+    """Raised when an LLM call cannot be admitted; surfaces as 429"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail="AI service is busy, please retry shortly",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+class AdmissionController:
+    """Caps in-flight LLM calls with a bounded, prioritized wait queue
+
+    When the queue is full, a new request evicts the newest waiter of a
+    lower priority class if there is one, otherwise it is rejected.
+    """
+
+    def __init__(self, max_in_flight: int = 16, max_queue: int = 64, queue_timeout: float = 30.0, retry_after: int = 5):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self._waiters: Dict[int, Deque[asyncio.Future]] = {priority: deque() for priority in PRIORITY_NAMES}
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "evicted": 0, "timed_out": 0}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Build the controller from LLM_* environment variables"""
+        return cls(
+            max_in_flight=int(os.environ.get("LLM_MAX_IN_FLIGHT", 16)),
+            max_queue=int(os.environ.get("LLM_MAX_QUEUE", 64)),
+            queue_timeout=float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", 30)),
+            retry_after=int(os.environ.get("LLM_RETRY_AFTER_SECONDS", 5)),
+        )
+
+    def _queue_length(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _evict_lower_priority(self, priority: int) -> bool:
+        for lower in sorted(self._waiters, reverse=True):
+            if lower <= priority:
+                return False
+            waiters = self._waiters[lower]
+            while waiters:
+                waiter = waiters.pop()
+                if not waiter.done():
+                    waiter.set_exception(LlmOverloadedError(self.retry_after))
+                    self._stats["evicted"] += 1
+                    return True
+        return False
+
+    async def acquire(self, priority: int):
+        """Wait for an in-flight slot or raise LlmOverloadedError"""
+        if self.in_flight < self.max_in_flight and self._queue_length() == 0:
+            self.in_flight += 1
+            self._stats["admitted"] += 1
+            return
+
+        if self._queue_length() >= self.max_queue and not self._evict_lower_priority(priority):
+            self._stats["rejected"] += 1
+            raise LlmOverloadedError(self.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(waiter)
+        self._stats["queued"] += 1
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._stats["timed_out"] += 1
+            raise LlmOverloadedError(self.retry_after)
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before cancellation
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters[priority]:
+                self._waiters[priority].remove(waiter)
+        self._stats["admitted"] += 1
+
+    def release(self):
+        """Free a slot, handing it directly to the best waiting request"""
+        for priority in sorted(self._waiters):
+            waiters = self._waiters[priority]
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    # in_flight stays the same: the slot changes owner
+                    waiter.set_result(None)
+                    return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "queue": {PRIORITY_NAMES[priority]: len(waiters) for priority, waiters in self._waiters.items()}
+        }
@@ -0,0 +1,122 @@
+"""Two-tier (in-process LRU + MongoDB) cache for LLM responses"""
+import hashlib
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, Optional
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Endpoints whose prompts repeat often enough to be worth caching
+DEFAULT_CACHED_ENDPOINTS = ["generate_scenario", "weekly_plan", "training_summary", "ai_feedback"]
+
+
+def prompt_key(provider: str, model: str, system_message: str, text: str) -> str:
+    """Stable hash of everything that determines a completion"""
+    payload = json.dumps([provider, model, system_message, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LlmResponseCache:
+    """LRU memory tier in front of a TTL-indexed MongoDB collection"""
+
+    def __init__(
+        self,
+        collection,
+        endpoints: Iterable[str],
+        memory_size: int = 1024,
+        memory_ttl: float = 3600.0,
+        mongo_ttl: float = 7 * 24 * 3600.0,
+    ):
+        self.collection = collection
+        self.endpoints = set(endpoints)
+        self.mongo_ttl = mongo_ttl
+        self._memory = TTLCache(maxsize=memory_size, ttl=memory_ttl)
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "stores": 0, "errors": 0}
+        )
+
+    @classmethod
+    def from_env(cls, collection) -> "LlmResponseCache":
+        """Build the cache from LLM_CACHE_* environment variables"""
+        endpoints = os.environ.get("LLM_CACHE_ENDPOINTS")
+        return cls(
+            collection=collection,
+            endpoints=endpoints.split(",") if endpoints is not None else DEFAULT_CACHED_ENDPOINTS,
+            memory_size=int(os.environ.get("LLM_CACHE_MEMORY_SIZE", 1024)),
+            memory_ttl=float(os.environ.get("LLM_CACHE_MEMORY_TTL_SECONDS", 3600)),
+            mongo_ttl=float(os.environ.get("LLM_CACHE_MONGO_TTL_SECONDS", 7 * 24 * 3600)),
+        )
+
+    def enabled_for(self, endpoint: str) -> bool:
+        return endpoint in self.endpoints
+
+    async def ensure_indexes(self):
+        """Create the unique key and TTL indexes for the Mongo tier"""
+        await self.collection.create_index("key", unique=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, endpoint: str, key: str) -> Optional[str]:
+        """Look up a response, promoting Mongo hits into memory"""
+        stats = self._stats[endpoint]
+
+        response = self._memory.get(key)
+        if response is not None:
+            stats["memory_hits"] += 1
+            return response
+
+        try:
+            doc = await self.collection.find_one(
+                {"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+                {"_id": 0, "response": 1}
+            )
+        except Exception as e:
+            stats["errors"] += 1
+            logger.warning(f"LLM cache lookup failed: {str(e)}")
+            doc = None
+
+        if doc:
+            stats["mongo_hits"] += 1
+            self._memory[key] = doc["response"]
+            return doc["response"]
+
+        stats["misses"] += 1
+        return None
+
+    async def set(self, endpoint: str, key: str, response: str):
+        """Store a response in both tiers"""
+        self._memory[key] = response
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.update_one(
+                {"key": key},
+                {"$set": {
+                    "key": key,
+                    "endpoint": endpoint,
+                    "response": response,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=self.mongo_ttl)
+                }},
+                upsert=True
+            )
+            self._stats[endpoint]["stores"] += 1
+        except Exception as e:
+            self._stats[endpoint]["errors"] += 1
+            logger.warning(f"LLM cache store failed: {str(e)}")
+
+    def stats(self) -> dict:
+        """Per-endpoint hit/miss counters plus hit rate"""
+        endpoints = {}
+        for endpoint, counts in self._stats.items():
+            lookups = counts["memory_hits"] + counts["mongo_hits"] + counts["misses"]
+            hits = counts["memory_hits"] + counts["mongo_hits"]
+            endpoints[endpoint] = {**counts, "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+        return {
+            "enabled_endpoints": sorted(self.endpoints),
+            "memory_entries": len(self._memory),
+            "endpoints": endpoints
+        }
@@ -0,0 +1,190 @@
+"""Per-model circuit breakers for upstream LLM calls"""
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(HTTPException):
+    """Raised instead of calling a model whose circuit is open; surfaces as 503"""
+
+    def __init__(self, model: str, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail="AI service is temporarily unavailable, please retry shortly",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.model = model
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over a sliding window of recent calls
+
+    The circuit opens once at least min_calls are in the window and either
+    the error rate or the share of calls slower than slow_call_seconds
+    reaches its threshold. After open_seconds it lets half_open_calls probe
+    calls through; if they all succeed it closes, any failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 10,
+        error_rate: float = 0.5,
+        slow_call_seconds: float = 20.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1,
+    ):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = STATE_CLOSED
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window)  # (failed, slow)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._stats = {"opened": 0, "rejected": 0}
+
+    def available(self) -> bool:
+        """Whether allow() could let a call through, without claiming anything"""
+        if self.state == STATE_OPEN:
+            return time.monotonic() - self._opened_at >= self.open_seconds
+        if self.state == STATE_HALF_OPEN:
+            return self._probes_in_flight < self.half_open_calls
+        return True
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now (claims a probe slot when half-open)"""
+        if self.state == STATE_OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self._stats["rejected"] += 1
+                return False
+            self.state = STATE_HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+
+        if self.state == STATE_HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_calls:
+                self._stats["rejected"] += 1
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def release(self):
+        """A claimed call ended without an upstream outcome (e.g. it was never admitted)"""
+        if self.state == STATE_HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def retry_after(self) -> int:
+        remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+        return max(1, math.ceil(remaining))
+
+    def record(self, failed: bool, latency: float):
+        slow = latency >= self.slow_call_seconds
+        if self.state == STATE_HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if failed or slow:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_calls:
+                self.state = STATE_CLOSED
+                self._outcomes.clear()
+            return
+
+        self._outcomes.append((failed, slow))
+        if self.state == STATE_CLOSED and len(self._outcomes) >= self.min_calls:
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, slow in self._outcomes if slow)
+            if failures / len(self._outcomes) >= self.error_rate or slow_calls / len(self._outcomes) >= self.slow_call_rate:
+                self._open()
+
+    def _open(self):
+        self.state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._stats["opened"] += 1
+
+    def stats(self) -> dict:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            **self._stats,
+            "window_calls": calls,
+            "window_error_rate": round(sum(1 for failed, _ in self._outcomes if failed) / calls, 4) if calls else 0.0,
+            "window_slow_rate": round(sum(1 for _, slow in self._outcomes if slow) / calls, 4) if calls else 0.0
+        }
+
+
+class ModelCircuits:
+    """One CircuitBreaker per model, created on first use with shared settings"""
+
+    def __init__(self, enabled: bool = True, **settings):
+        self.enabled = enabled
+        self.settings = settings
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    @classmethod
+    def from_env(cls) -> "ModelCircuits":
+        return cls(
+            enabled=os.environ.get("LLM_CIRCUIT_ENABLED", "true").lower() == "true",
+            window=int(os.environ.get("LLM_CIRCUIT_WINDOW", 20)),
+            min_calls=int(os.environ.get("LLM_CIRCUIT_MIN_CALLS", 10)),
+            error_rate=float(os.environ.get("LLM_CIRCUIT_ERROR_RATE", 0.5)),
+            slow_call_seconds=float(os.environ.get("LLM_CIRCUIT_SLOW_CALL_SECONDS", 20)),
+            slow_call_rate=float(os.environ.get("LLM_CIRCUIT_SLOW_CALL_RATE", 0.8)),
+            open_seconds=float(os.environ.get("LLM_CIRCUIT_OPEN_SECONDS", 30)),
+            half_open_calls=int(os.environ.get("LLM_CIRCUIT_HALF_OPEN_CALLS", 1)),
+        )
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker(**self.settings)
+        return self._breakers[model]
+
+    def check(self, models: List[str]):
+        """Raise CircuitOpenError if none of the models may take a call right now"""
+        if not self.enabled or any(self.breaker(model).available() for model in models):
+            return
+        raise self.open_error(models)
+
+    def open_error(self, models: List[str]) -> CircuitOpenError:
+        retry_after = min(self.breaker(model).retry_after() for model in models)
+        return CircuitOpenError(", ".join(models), retry_after)
+
+    def acquire(self, model: str) -> bool:
+        """Claim a call to the model; False while its circuit is open"""
+        return not self.enabled or self.breaker(model).allow()
+
+    def record(self, model: str, failed: bool, latency: float):
+        if not self.enabled:
+            return
+        breaker = self.breaker(model)
+        previous = breaker.state
+        breaker.record(failed, latency)
+        if breaker.state != previous:
+            logger.warning(f"LLM circuit for {model}: {previous} -> {breaker.state}")
+
+    def release(self, model: str):
+        if self.enabled:
+            self.breaker(model).release()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "models": {model: breaker.stats() for model, breaker in self._breakers.items()}
+        }
@@ -0,0 +1,60 @@
+"""Single-flight coalescing of identical concurrent LLM requests"""
+import asyncio
+import os
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Iterable
+
+# Endpoints where identical prompts commonly arrive concurrently
+DEFAULT_COALESCED_ENDPOINTS = [
+    "generate_scenario",
+    "weekly_plan",
+    "training_summary",
+    "training_evaluate",
+    "ai_feedback",
+    "analyze_dialog",
+    "community_case",
+]
+
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share one upstream call"""
+
+    def __init__(self, endpoints: Iterable[str]):
+        self.endpoints = set(endpoints)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"upstream": 0, "coalesced": 0})
+
+    @classmethod
+    def from_env(cls) -> "SingleFlight":
+        endpoints = os.environ.get("LLM_COALESCE_ENDPOINTS")
+        return cls(endpoints.split(",") if endpoints is not None else DEFAULT_COALESCED_ENDPOINTS)
+
+    def enabled_for(self, endpoint: str) -> bool:
+        return endpoint in self.endpoints
+
+    async def do(self, endpoint: str, key: str, call: Callable[[], Awaitable[str]]) -> str:
+        """Run call() once per key; concurrent callers await the same result"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self._stats[endpoint]["upstream"] += 1
+        else:
+            self._stats[endpoint]["coalesced"] += 1
+
+        # Shield so one caller disconnecting does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved even if every caller went away
+
+    def stats(self) -> dict:
+        return {
+            "enabled_endpoints": sorted(self.endpoints),
+            "in_flight_keys": len(self._inflight),
+            "endpoints": dict(self._stats)
+        }
@@ -0,0 +1,121 @@
+"""Token-budgeted conversation context for multi-turn training sessions"""
+import logging
+import os
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count via tiktoken when available, otherwise ~4 characters per token"""
+    global _encoding
+    if not text:
+        return 0
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def chunk_by_token_budget(texts: List[str], token_budget: int, overhead_per_item: int = 0) -> List[List[int]]:
+    """Group item indices into chunks whose texts (plus per-item overhead) fit the budget
+
+    An item larger than the budget on its own gets a chunk to itself.
+    """
+    chunks: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for index, text in enumerate(texts):
+        cost = count_tokens(text) + overhead_per_item
+        if current and used + cost > token_budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def format_message(message: dict) -> str:
+    return f"{message.get('speaker', '')}: {message.get('message', '')}"
+
+
+class ConversationContext:
+    """Rebuilds a session's conversation for the LLM under a token budget
+
+    Older turns are folded into a rolling summary (stored on the session) and
+    only the newest turns are sent verbatim.
+    """
+
+    def __init__(self, token_budget: int = 3000, keep_recent: int = 6, summarize_ratio: float = 0.5):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summarize_ratio = summarize_ratio
+
+    @classmethod
+    def from_env(cls) -> "ConversationContext":
+        return cls(
+            token_budget=int(os.environ.get("TRAINING_CONTEXT_TOKEN_BUDGET", 3000)),
+            keep_recent=int(os.environ.get("TRAINING_CONTEXT_KEEP_RECENT", 6)),
+            summarize_ratio=float(os.environ.get("TRAINING_CONTEXT_SUMMARIZE_RATIO", 0.5)),
+        )
+
+    def build_prompt(
+        self,
+        system_message: str,
+        messages: List[dict],
+        summary: Optional[str],
+        summarized_count: int,
+        user_name: str,
+        partner_name: str,
+        user_response: str,
+    ) -> str:
+        """User prompt carrying the summary, the newest turns and the new response"""
+        latest = f"{user_name}: {user_response}"
+        instruction = f"Reply as {partner_name} to {user_name}'s latest message."
+        summary_block = f"Summary of the earlier conversation:\n{summary}\n\n" if summary else ""
+
+        remaining = self.token_budget - sum(
+            count_tokens(part) for part in (system_message, summary_block, latest, instruction)
+        )
+
+        # Newest unsummarized turns first, until the budget is used up
+        history: List[str] = []
+        for message in reversed(messages[summarized_count:]):
+            line = format_message(message)
+            cost = count_tokens(line) + 1
+            if cost > remaining:
+                break
+            history.append(line)
+            remaining -= cost
+        history.reverse()
+
+        history_block = "Conversation so far:\n" + "\n".join(history) + "\n\n" if history else ""
+        return f"{summary_block}{history_block}{latest}\n\n{instruction}"
+
+    def messages_to_summarize(self, messages: List[dict], summarized_count: int) -> List[dict]:
+        """Older turns that should be folded into the summary, if any"""
+        unsummarized = messages[summarized_count:]
+        if len(unsummarized) <= self.keep_recent:
+            return []
+        history_tokens = sum(count_tokens(format_message(message)) for message in unsummarized)
+        if history_tokens <= self.token_budget * self.summarize_ratio:
+            return []
+        return unsummarized[:-self.keep_recent]
+
+    @staticmethod
+    def summary_prompt(previous_summary: Optional[str], messages: List[dict]) -> str:
+        transcript = "\n".join(format_message(message) for message in messages)
+        previous = f"Existing summary:\n{previous_summary}\n\n" if previous_summary else ""
+        return f"""{previous}New conversation turns:
+{transcript}
+
+Update the summary so it covers everything above in at most 120 words. Keep the emotional state of each person, what was said that helped or hurt, and any open topics. Return only the summary."""
@@ -0,0 +1,79 @@
+"""Per-endpoint latency budgets for LLM calls"""
+import math
+import os
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional
+
+# Default deadlines in seconds; override with LLM_DEADLINES="training_start=4,training_respond=4"
+DEFAULT_DEADLINES = {
+    "training_start": 4.0,
+    "training_respond": 4.0,
+}
+
+
+def parse_deadlines(spec: Optional[str]) -> Dict[str, float]:
+    """Parse 'endpoint=seconds,...' into a dict (0 disables an endpoint)"""
+    if spec is None:
+        return dict(DEFAULT_DEADLINES)
+    deadlines = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        endpoint, seconds = item.split("=", 1)
+        if float(seconds) > 0:
+            deadlines[endpoint.strip()] = float(seconds)
+    return deadlines
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(q / 100.0 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class DeadlineTracker:
+    """Call latency percentiles and deadline hit counts per endpoint"""
+
+    def __init__(self, deadlines: Dict[str, float], window: int = 1000):
+        self.deadlines = deadlines
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "deadline_fired": 0, "late_completions": 0})
+
+    @classmethod
+    def from_env(cls) -> "DeadlineTracker":
+        return cls(
+            deadlines=parse_deadlines(os.environ.get("LLM_DEADLINES")),
+            window=int(os.environ.get("LLM_LATENCY_WINDOW", 1000)),
+        )
+
+    def deadline_for(self, endpoint: str) -> Optional[float]:
+        return self.deadlines.get(endpoint)
+
+    def record_call(self, endpoint: str):
+        self._counts[endpoint]["calls"] += 1
+
+    def record_fired(self, endpoint: str):
+        """The deadline passed before the call finished and a fallback was served"""
+        self._counts[endpoint]["deadline_fired"] += 1
+
+    def record_latency(self, endpoint: str, latency: float, late: bool = False):
+        """Record how long a call really took, including calls that finished late"""
+        self._latencies[endpoint].append(latency)
+        if late:
+            self._counts[endpoint]["late_completions"] += 1
+
+    def stats(self) -> dict:
+        endpoints = {}
+        for endpoint, counts in self._counts.items():
+            latencies = list(self._latencies[endpoint])
+            endpoints[endpoint] = {
+                **counts,
+                "deadline_seconds": self.deadlines.get(endpoint),
+                "p50_seconds": percentile(latencies, 50),
+                "p95_seconds": percentile(latencies, 95),
+                "deadline_fired_rate": round(counts["deadline_fired"] / counts["calls"], 4) if counts["calls"] else 0.0
+            }
+        return {"deadlines": self.deadlines, "endpoints": endpoints}
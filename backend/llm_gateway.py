@@ -0,0 +1,377 @@
+"""Process-wide LLM gateway shared by all AI endpoints"""
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+from llm_admission import AdmissionController, PRIORITY_BATCH, PRIORITY_INTERACTIVE, PRIORITY_PRO_ANALYSIS
+from llm_cache import LlmResponseCache, prompt_key
+from llm_circuit import CircuitOpenError, ModelCircuits
+from llm_coalescing import SingleFlight
+from llm_context import count_tokens
+from llm_deadline import DeadlineTracker
+from llm_metrics import LlmUsageMetrics
+from llm_providers import LlmProvider, provider_from_env
+from llm_router import (
+    ModelRouter, TASK_CONVERSATION, TASK_DEEP, TASK_SHORT, TASK_STRUCTURED, model_name
+)
+
+logger = logging.getLogger(__name__)
+
+# Endpoint names used by server.py with their admission priority and task
+# class. The task class picks the model tiers (see llm_router); an endpoint
+# can still be pinned with LLM_MODEL_<ENDPOINT>=provider/model
+LLM_ENDPOINTS = {
+    "training_start": (PRIORITY_INTERACTIVE, TASK_CONVERSATION),
+    "training_respond": (PRIORITY_INTERACTIVE, TASK_CONVERSATION),
+    "training_evaluate": (PRIORITY_INTERACTIVE, TASK_STRUCTURED),
+    "training_evaluate_batch": (PRIORITY_BATCH, TASK_STRUCTURED),
+    "training_summary": (PRIORITY_INTERACTIVE, TASK_SHORT),
+    "training_context_summary": (PRIORITY_BATCH, TASK_SHORT),
+    "ai_feedback": (PRIORITY_INTERACTIVE, TASK_DEEP),
+    "analyze_dialog": (PRIORITY_PRO_ANALYSIS, TASK_DEEP),
+    "community_case": (PRIORITY_PRO_ANALYSIS, TASK_SHORT),
+    "weekly_plan": (PRIORITY_BATCH, TASK_DEEP),
+    "generate_scenario": (PRIORITY_BATCH, TASK_SHORT),
+}
+
+ENDPOINT_TASK_CLASSES = {endpoint: task_class for endpoint, (_, task_class) in LLM_ENDPOINTS.items()}
+
+
+class AdmittedStream:
+    """Chunk iterator that owns an admission slot until it is exhausted or closed
+
+    Once iteration starts, the wrapped generator's finally releases the slot.
+    A stream that is never iterated (client gone before the response body
+    was sent) releases it on aclose(), or when garbage collected as a last
+    resort, since an unstarted generator never runs its finally.
+    """
+
+    def __init__(self, chunks: AsyncIterator[str], release: Callable[[], None]):
+        self._chunks = chunks
+        self._release = release
+        self._started = False
+        self._released = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        self._started = True
+        return await self._chunks.__anext__()
+
+    def _release_unstarted(self):
+        if not self._started and not self._released:
+            self._released = True
+            self._release()
+
+    async def aclose(self):
+        self._release_unstarted()
+        await self._chunks.aclose()
+
+    def __del__(self):
+        self._release_unstarted()
+
+
+class LlmGateway:
+    """Shared LLM client in front of the configured provider backend"""
+
+    def __init__(
+        self,
+        provider: LlmProvider,
+        router: Optional[ModelRouter] = None,
+        cache: Optional[LlmResponseCache] = None,
+        admission: Optional[AdmissionController] = None,
+        single_flight: Optional[SingleFlight] = None,
+        deadlines: Optional[DeadlineTracker] = None,
+        usage: Optional[LlmUsageMetrics] = None,
+        circuits: Optional[ModelCircuits] = None,
+    ):
+        self.provider = provider
+        self.router = router or ModelRouter(ENDPOINT_TASK_CLASSES)
+        self.cache = cache
+        self.admission = admission or AdmissionController()
+        self.single_flight = single_flight
+        self.deadlines = deadlines or DeadlineTracker({})
+        self.usage = usage
+        self.circuits = circuits or ModelCircuits(enabled=False)
+
+    @classmethod
+    def from_env(
+        cls,
+        api_key: Optional[str],
+        cache: Optional[LlmResponseCache] = None,
+        usage: Optional[LlmUsageMetrics] = None,
+    ) -> "LlmGateway":
+        """Build the gateway from LLM_* environment variables"""
+        return cls(
+            provider=provider_from_env(api_key),
+            router=ModelRouter.from_env(ENDPOINT_TASK_CLASSES),
+            cache=cache,
+            admission=AdmissionController.from_env(),
+            single_flight=SingleFlight.from_env(),
+            deadlines=DeadlineTracker.from_env(),
+            usage=usage,
+            circuits=ModelCircuits.from_env(),
+        )
+
+    async def start(self):
+        """Start the provider and the metrics/cache background work"""
+        await self.provider.start()
+        for component in (self.cache, self.usage):
+            if component is None:
+                continue
+            try:
+                await component.ensure_indexes()
+            except Exception as e:
+                logger.warning(f"LLM {type(component).__name__} index setup failed: {str(e)}")
+        if self.usage is not None:
+            await self.usage.start()
+        tiers = ", ".join(f"{tier}={model_name(model)}" for tier, model in self.router.tiers.items())
+        logger.info(f"LLM gateway started (provider={self.provider.name}, tiers: {tiers})")
+
+    async def close(self):
+        """Flush usage counters and shut the provider down"""
+        if self.usage is not None:
+            await self.usage.close()
+        await self.provider.close()
+
+    def model_for(self, endpoint: str) -> Tuple[str, str]:
+        """Return the endpoint's primary (provider, model)"""
+        return self.router.primary_model(endpoint)
+
+    def route_for(self, endpoint: str) -> List[str]:
+        """Names of the models tried for an endpoint, in order"""
+        return [model_name(model) for model in self.router.models_for(endpoint)]
+
+    async def send_message(
+        self,
+        endpoint: str,
+        session_id: str,
+        system_message: str,
+        text: str,
+        priority: Optional[int] = None,
+        user_tier: str = "anonymous",
+    ) -> str:
+        """Send a single user message and return the completion text
+
+        Cache hits are answered without an admission slot. Identical prompts
+        already in flight are coalesced onto one upstream call. Everything
+        else waits for a slot and may raise LlmOverloadedError (429), or
+        CircuitOpenError (503) while every model on the route is open. A
+        failing model is retried on the next tier of the endpoint's route.
+        Only answers from the primary model are cached, since the cache key
+        names the primary model.
+        """
+        use_cache = self.cache is not None and self.cache.enabled_for(endpoint)
+        use_single_flight = self.single_flight is not None and self.single_flight.enabled_for(endpoint)
+
+        key = None
+        if use_cache or use_single_flight:
+            provider, model = self.model_for(endpoint)
+            key = prompt_key(provider, model, system_message, text)
+
+        if use_cache:
+            cached = await self.cache.get(endpoint, key)
+            if cached is not None:
+                return cached
+
+        async def call_upstream() -> str:
+            self.circuits.check(self.route_for(endpoint))
+            async with self.admission.slot(self.priority_for(endpoint, priority)):
+                response, answered_by = await self._complete(endpoint, session_id, system_message, text, user_tier)
+            if use_cache and response and answered_by == (provider, model):
+                await self.cache.set(endpoint, key, response)
+            return response
+
+        if use_single_flight:
+            return await self.single_flight.do(endpoint, key, call_upstream)
+        return await call_upstream()
+
+    async def send_with_deadline(
+        self,
+        endpoint: str,
+        session_id: str,
+        system_message: str,
+        text: str,
+        on_late_result: Optional[Callable[[str], Awaitable[None]]] = None,
+        priority: Optional[int] = None,
+        user_tier: str = "anonymous",
+    ) -> Optional[str]:
+        """Like send_message, but give up after the endpoint's deadline
+
+        Returns None when the deadline fires or the route's circuits are open
+        so the caller can serve its fallback. The call keeps running; if it
+        later succeeds, its result is handed to on_late_result for reuse.
+        """
+        deadline = self.deadlines.deadline_for(endpoint)
+        started = time.monotonic()
+        self.deadlines.record_call(endpoint)
+        task = asyncio.ensure_future(self.send_message(
+            endpoint, session_id, system_message, text, priority=priority, user_tier=user_tier
+        ))
+
+        done, _ = await asyncio.wait({task}, timeout=deadline)
+        if task in done:
+            if isinstance(task.exception(), CircuitOpenError):
+                logger.info(f"LLM circuit open for {endpoint}, serving fallback")
+                return None
+            self.deadlines.record_latency(endpoint, time.monotonic() - started)
+            return task.result()
+
+        self.deadlines.record_fired(endpoint)
+        logger.info(f"LLM deadline of {deadline}s fired for {endpoint}, serving fallback")
+        task.add_done_callback(lambda late: self._handle_late_result(endpoint, started, late, on_late_result))
+        return None
+
+    def _handle_late_result(self, endpoint: str, started: float, task: asyncio.Future, on_late_result):
+        self.deadlines.record_latency(endpoint, time.monotonic() - started, late=True)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning(f"Late LLM call for {endpoint} failed: {task.exception()}")
+            return
+        if on_late_result is not None and task.result():
+            asyncio.ensure_future(on_late_result(task.result()))
+
+    async def stream_message(
+        self,
+        endpoint: str,
+        session_id: str,
+        system_message: str,
+        text: str,
+        priority: Optional[int] = None,
+        user_tier: str = "anonymous",
+    ) -> AdmittedStream:
+        """Admit a streaming call and return an iterator of completion chunks
+
+        Admission and the circuit check happen before this returns so a 429
+        or 503 can still be sent as a normal HTTP response; the slot is held
+        until the stream finishes or is closed, so callers must aclose() it.
+        """
+        self.circuits.check(self.route_for(endpoint))
+        await self.admission.acquire(self.priority_for(endpoint, priority))
+        return AdmittedStream(
+            self._stream_admitted(endpoint, session_id, system_message, text, user_tier),
+            self.admission.release
+        )
+
+    def priority_for(self, endpoint: str, priority: Optional[int] = None) -> int:
+        if priority is not None:
+            return priority
+        return LLM_ENDPOINTS.get(endpoint, (PRIORITY_BATCH, TASK_DEEP))[0]
+
+    async def _complete(
+        self, endpoint: str, session_id: str, system_message: str, text: str, user_tier: str
+    ) -> Tuple[str, Tuple[str, str]]:
+        """Try the endpoint's route in order, moving to the next tier on errors or open circuits
+
+        Returns the completion text and the (provider, model) that produced it.
+        """
+        last_error = None
+        for attempt, model in enumerate(self.router.models_for(endpoint)):
+            if not self.circuits.acquire(model_name(model)):
+                continue
+            started = time.monotonic()
+            try:
+                response = await self.provider.complete(endpoint, model, session_id, system_message, text)
+            except asyncio.CancelledError:
+                self.circuits.release(model_name(model))
+                raise
+            except Exception as e:
+                self._record_outcome(endpoint, model, attempt, user_tier, system_message, text, "", started, type(e).__name__)
+                logger.warning(f"LLM call for {endpoint} failed on {model_name(model)}: {str(e)}")
+                last_error = e
+                continue
+            self._record_outcome(endpoint, model, attempt, user_tier, system_message, text, response, started, None)
+            return response, model
+
+        if last_error is not None:
+            raise last_error
+        raise self.circuits.open_error(self.route_for(endpoint))
+
+    async def _stream_admitted(
+        self,
+        endpoint: str,
+        session_id: str,
+        system_message: str,
+        text: str,
+        user_tier: str,
+    ) -> AsyncIterator[str]:
+        # Streams from the first route model whose circuit allows it. If no
+        # stream can be opened, _complete serves the full reply as one chunk
+        # (and does its own routing and bookkeeping).
+        try:
+            attempt, model = next(
+                (attempt, model)
+                for attempt, model in enumerate(self.router.models_for(endpoint))
+                if self.circuits.acquire(model_name(model))
+            )
+        except StopIteration:
+            attempt, model = None, None
+
+        started = time.monotonic()
+        chunks = []
+        settled = model is None
+        try:
+            stream = None
+            if model is not None:
+                try:
+                    stream = await self.provider.open_stream(endpoint, model, session_id, system_message, text)
+                except Exception as stream_error:
+                    logger.warning(f"LLM streaming unavailable for {endpoint}, falling back to single response: {stream_error}")
+                    self.circuits.release(model_name(model))
+                    settled = True
+
+            if stream is None:
+                if model is None:
+                    logger.warning(f"No model circuit admits streaming for {endpoint}, falling back to single response")
+                response, _ = await self._complete(endpoint, session_id, system_message, text, user_tier)
+                yield response
+                return
+
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+            self._record_outcome(endpoint, model, attempt, user_tier, system_message, text, "".join(chunks), started, None)
+            settled = True
+        except Exception as e:
+            if not settled:
+                self._record_outcome(endpoint, model, attempt, user_tier, system_message, text, "".join(chunks), started, type(e).__name__)
+                settled = True
+            raise
+        finally:
+            if not settled:
+                # Client went away mid-stream
+                self.circuits.release(model_name(model))
+            self.admission.release()
+
+    def _record_outcome(self, endpoint, model, attempt, user_tier, system_message, text, response, started, error_class):
+        latency = time.monotonic() - started
+        failed = error_class is not None
+        self.circuits.record(model_name(model), failed=failed, latency=latency)
+        self.router.record(endpoint, model, latency, failed=failed, attempt=attempt)
+        if self.usage is None:
+            return
+        self.usage.record(
+            endpoint=endpoint,
+            tier=user_tier,
+            model=model[1],
+            prompt_tokens=count_tokens(system_message) + count_tokens(text),
+            completion_tokens=count_tokens(response),
+            latency=latency,
+            error_class=error_class,
+        )
+
+    def metrics(self) -> dict:
+        """Snapshot of gateway metrics for the metrics endpoint"""
+        return {
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "admission": self.admission.stats(),
+            "coalescing": self.single_flight.stats() if self.single_flight is not None else None,
+            "latency": self.deadlines.stats(),
+            "usage": self.usage.stats() if self.usage is not None else None,
+            "provider": self.provider.stats(),
+            "circuits": self.circuits.stats(),
+            "routing": self.router.stats()
+        }
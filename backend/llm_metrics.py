@@ -0,0 +1,134 @@
+"""Per-endpoint LLM token, latency and cost accounting"""
+import asyncio
+import logging
+import os
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Optional, Tuple
+
+from llm_deadline import percentile
+
+logger = logging.getLogger(__name__)
+
+# USD per 1M tokens (prompt, completion)
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class LlmUsageMetrics:
+    """In-memory usage aggregates with a periodic daily rollup to MongoDB"""
+
+    def __init__(self, collection, flush_interval: float = 60.0, window: int = 1000):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.window = window
+        self._totals: Dict[Tuple[str, str], dict] = {}
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._pending: Dict[Tuple[str, str, str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._flusher: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, collection) -> "LlmUsageMetrics":
+        return cls(
+            collection=collection,
+            flush_interval=float(os.environ.get("LLM_USAGE_FLUSH_SECONDS", 60)),
+            window=int(os.environ.get("LLM_LATENCY_WINDOW", 1000)),
+        )
+
+    def record(
+        self,
+        endpoint: str,
+        tier: str,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency: float,
+        error_class: Optional[str] = None,
+    ):
+        """Record one upstream LLM call"""
+        key = (endpoint, tier)
+        totals = self._totals.setdefault(key, {
+            "calls": 0, "errors": {}, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0
+        })
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["completion_tokens"] += completion_tokens
+        totals["cost_usd"] += cost
+        if error_class:
+            totals["errors"][error_class] = totals["errors"].get(error_class, 0) + 1
+        self._latencies[key].append(latency)
+
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        pending = self._pending[(day, endpoint, tier, model)]
+        pending["calls"] += 1
+        pending["errors"] += 1 if error_class else 0
+        pending["prompt_tokens"] += prompt_tokens
+        pending["completion_tokens"] += completion_tokens
+        pending["latency_ms_total"] += latency * 1000
+        pending["cost_usd"] += cost
+
+    def stats(self) -> dict:
+        endpoints: Dict[str, dict] = {}
+        for (endpoint, tier), totals in self._totals.items():
+            latencies = list(self._latencies[(endpoint, tier)])
+            endpoints.setdefault(endpoint, {})[tier] = {
+                **totals,
+                "cost_usd": round(totals["cost_usd"], 6),
+                "p50_latency_seconds": percentile(latencies, 50),
+                "p95_latency_seconds": percentile(latencies, 95)
+            }
+        return {"endpoints": endpoints}
+
+    async def ensure_indexes(self):
+        await self.collection.create_index(
+            [("day", 1), ("endpoint", 1), ("tier", 1), ("model", 1)], unique=True
+        )
+
+    async def start(self):
+        if self._flusher is None and self.flush_interval > 0:
+            self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self):
+        """Write pending counters into the llm_usage_daily rollup"""
+        pending, self._pending = self._pending, defaultdict(lambda: defaultdict(float))
+        for (day, endpoint, tier, model), counters in pending.items():
+            try:
+                await self.collection.update_one(
+                    {"day": day, "endpoint": endpoint, "tier": tier, "model": model},
+                    {
+                        "$inc": dict(counters),
+                        "$set": {"updated_at": datetime.now(timezone.utc)}
+                    },
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"LLM usage rollup failed for {day}/{endpoint}: {str(e)}")
+                # Keep the counters for the next flush
+                for field, value in counters.items():
+                    self._pending[(day, endpoint, tier, model)][field] += value
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
@@ -0,0 +1,402 @@
+"""LLM provider backends used by the gateway
+
+LLM_PROVIDER selects the backend: "emergent" (default) talks to the real
+provider through emergentintegrations/litellm, "fake" answers locally with
+deterministic canned responses for offline load and soak tests.
+
+LlmChat has no streaming API, so the emergent backend streams through litellm
+directly. It sends the same key to the same integration proxy LlmChat uses,
+INTEGRATION_PROXY_URL (default https://integrations.emergentagent.com) plus
+"/llm". Set LLM_API_BASE to stream from a different OpenAI-compatible base URL.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+from string import Template
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+import litellm
+from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTEGRATION_PROXY_URL = "https://integrations.emergentagent.com"
+
+
+def default_api_base() -> str:
+    """Streaming base URL: LLM_API_BASE, else the proxy LlmChat sends its calls to"""
+    if os.environ.get("LLM_API_BASE"):
+        return os.environ["LLM_API_BASE"]
+    proxy_url = os.environ.get("INTEGRATION_PROXY_URL", DEFAULT_INTEGRATION_PROXY_URL)
+    return f"{proxy_url.rstrip('/')}/llm"
+
+
+class LlmProvider:
+    """Interface every provider backend implements"""
+
+    name = "base"
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def complete(
+        self,
+        endpoint: str,
+        model: Tuple[str, str],
+        session_id: str,
+        system_message: str,
+        text: str,
+    ) -> str:
+        """Return the full completion text"""
+        raise NotImplementedError
+
+    async def open_stream(
+        self,
+        endpoint: str,
+        model: Tuple[str, str],
+        session_id: str,
+        system_message: str,
+        text: str,
+    ) -> AsyncIterator[str]:
+        """Open a stream of completion chunks; raising means streaming is unavailable"""
+        raise NotImplementedError(f"{self.name} provider does not stream")
+
+    def stats(self) -> dict:
+        return {"name": self.name}
+
+
+class EmergentProvider(LlmProvider):
+    """Real provider via LlmChat, sharing one pooled keep-alive HTTP client"""
+
+    name = "emergent"
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        pool_size: int = 20,
+        keepalive_expiry: float = 60.0,
+        request_timeout: float = 60.0,
+        api_base: Optional[str] = None,
+    ):
+        self.api_key = api_key
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self.request_timeout = request_timeout
+        self.api_base = api_base or default_api_base()
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_env(cls, api_key: Optional[str]) -> "EmergentProvider":
+        return cls(
+            api_key=api_key,
+            pool_size=int(os.environ.get("LLM_POOL_SIZE", 20)),
+            keepalive_expiry=float(os.environ.get("LLM_KEEPALIVE_SECONDS", 60)),
+            request_timeout=float(os.environ.get("LLM_TIMEOUT_SECONDS", 60)),
+        )
+
+    async def start(self):
+        """Open the shared connection pool and hand it to litellm"""
+        if self._http_client is not None:
+            return
+
+        limits = httpx.Limits(
+            max_connections=self.pool_size,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        self._http_client = httpx.AsyncClient(
+            limits=limits,
+            timeout=httpx.Timeout(self.request_timeout, connect=10.0),
+        )
+        # LlmChat goes through litellm, which reuses this client for every
+        # OpenAI-compatible call instead of opening a new connection per request
+        litellm.aclient_session = self._http_client
+
+    async def close(self):
+        """Close the shared connection pool"""
+        if self._http_client is None:
+            return
+        if litellm.aclient_session is self._http_client:
+            litellm.aclient_session = None
+        await self._http_client.aclose()
+        self._http_client = None
+
+    async def complete(self, endpoint, model, session_id, system_message, text) -> str:
+        provider, model_name = model
+        chat = LlmChat(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model(provider, model_name)
+        return response_text(await chat.send_message(UserMessage(text=text)))
+
+    async def open_stream(self, endpoint, model, session_id, system_message, text) -> AsyncIterator[str]:
+        # LlmChat has no streaming API, so this talks to litellm directly over
+        # the same pooled connection
+        provider, model_name = model
+        stream = await litellm.acompletion(
+            model=f"{provider}/{model_name}",
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": text},
+            ],
+            api_key=self.api_key,
+            api_base=self.api_base,
+            stream=True,
+        )
+        return _litellm_chunks(stream)
+
+    def stats(self) -> dict:
+        return {"name": self.name, "pool_size": self.pool_size, "api_base": self.api_base}
+
+
+async def _litellm_chunks(stream) -> AsyncIterator[str]:
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+def response_text(response) -> str:
+    """Normalize an LlmChat response to a plain string"""
+    if hasattr(response, 'content'):
+        return response.content
+    if hasattr(response, 'text'):
+        return response.text
+    return str(response)
+
+
+class FakeProviderError(Exception):
+    """Injected upstream failure from the fake provider"""
+
+
+# Default fake responses per endpoint. Strings are string.Template templates
+# ($endpoint, $model, $excerpt); dicts/lists are returned as JSON.
+FAKE_RESPONSES: Dict[str, list] = {
+    "training_start": [
+        "Ich hatte heute wirklich einen schweren Tag und weiß gar nicht, wo ich anfangen soll.",
+        "Kannst du kurz zuhören? Mir geht gerade so viel durch den Kopf.",
+    ],
+    "training_respond": [
+        "Danke, dass du fragst. Ich fühle mich gerade etwas überfordert.",
+        "Das tut gut zu hören. Ich glaube, ich brauche einfach etwas Verständnis.",
+        "Hm, ich weiß nicht. Irgendwie fühle ich mich nicht ganz verstanden.",
+    ],
+    "training_context_summary": [
+        "Die Partnerin ist gestresst und fühlt sich teilweise verstanden. Offenes Thema: Überforderung im Alltag.",
+    ],
+    "training_evaluate": [
+        {
+            "empathy_score": 7.0,
+            "feedback": "Du bist auf die Gefühle deines Partners eingegangen.",
+            "improvements": ["Spiegle die Gefühle noch konkreter", "Stelle eine offene Frage"],
+            "alternative_responses": ["Das klingt wirklich anstrengend. Magst du mir mehr erzählen?"],
+            "emotional_awareness": "Du hast die Erschöpfung deines Partners wahrgenommen.",
+            "next_level_tip": "Benenne das Bedürfnis hinter dem Gefühl.",
+        },
+    ],
+    "training_summary": [
+        "Du hast heute aufmerksam zugehört und Gefühle gespiegelt. Bleib dran - jede Übung stärkt eure Verbindung.",
+    ],
+    "ai_feedback": [
+        "Gut: Du hast Verständnis gezeigt. Verbesserung: Frage nach, bevor du Lösungen anbietest.",
+    ],
+    "analyze_dialog": [
+        {
+            "communication_scores": {
+                "overall_score": 7.0,
+                "empathy_level": 6.5,
+                "conflict_potential": 4.0,
+                "emotional_safety": 7.5,
+            },
+            "detailed_analysis": {
+                "communication_patterns": ["Beide Partner reagieren schnell auf Vorwürfe."],
+                "emotional_dynamics": ["Hinter der Kritik steht der Wunsch nach Nähe."],
+            },
+            "specific_improvements": [
+                {
+                    "category": "Aktives Zuhören",
+                    "problem": "Unterbrechungen",
+                    "solution": "Erst zusammenfassen, dann antworten",
+                    "example": "Wenn ich dich richtig verstehe, ...",
+                },
+            ],
+            "alternative_formulations": [
+                {
+                    "original_statement": "Du hörst mir nie zu.",
+                    "speaker": "Partner A",
+                    "improved_version": "Ich fühle mich gerade nicht gehört.",
+                    "why_better": "Ich-Botschaft statt Vorwurf",
+                    "emotional_impact": "Weniger Abwehr beim Gegenüber",
+                },
+            ],
+            "strengths": [
+                {
+                    "aspect": "Offenheit",
+                    "description": "Beide sprechen ihre Gefühle an.",
+                    "how_to_build_on": "Regelmäßige Check-ins einplanen",
+                },
+            ],
+            "next_steps": [
+                {"timeframe": "Diese Woche", "action": "Täglich 10 Minuten Zuhören üben", "goal": "Mehr Sicherheit"},
+            ],
+        },
+    ],
+    "community_case": [
+        "Situation: Ein Paar streitet über Hausarbeit.\n- Ich-Botschaften nutzen\n- Pausen vereinbaren\n- Bedürfnisse benennen\nMuster: Kritik und Rechtfertigung\nSchwierigkeitsgrad: Mittel",
+    ],
+    "weekly_plan": [
+        "WOCHE: Achtsames Zuhören\nTag 1-7: Täglich 10 Minuten ungestörtes Gespräch.\nChallenge: Drei Wertschätzungen pro Tag.",
+    ],
+    "generate_scenario": [
+        "Situation: Abendessen nach einem langen Tag\nKontext: $excerpt\nFalsche Reaktion: Ablenken\nIdeale Reaktion: Nachfragen und zuhören\nWirkung: Nähe und Vertrauen",
+    ],
+}
+
+DEFAULT_FAKE_RESPONSE = ["Dies ist eine Testantwort ($endpoint)."]
+
+
+def fake_batch_evaluation(text: str) -> str:
+    """One canned evaluation per '[index] ...' line of a batch evaluation prompt"""
+    indices = [int(index) for index in re.findall(r"^\[(\d+)\]", text, re.MULTILINE)]
+    evaluation = FAKE_RESPONSES["training_evaluate"][0]
+    return json.dumps({"evaluations": [{"index": index, **evaluation} for index in indices]}, ensure_ascii=False)
+
+
+# Endpoints whose fake response has to be derived from the prompt
+FAKE_BUILDERS = {
+    "training_evaluate_batch": fake_batch_evaluation,
+}
+
+
+def parse_latency_spec(spec: str) -> Tuple[str, List[float]]:
+    """Parse 'fixed:S', 'uniform:MIN,MAX' or 'lognormal:MEDIAN,SIGMA' (seconds)"""
+    kind, _, params = spec.partition(":")
+    kind = kind.strip().lower()
+    values = [float(value) for value in params.split(",") if value.strip()]
+    expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+    if kind not in expected or len(values) != expected[kind]:
+        raise ValueError(f"Invalid fake latency spec: {spec!r}")
+    return kind, values
+
+
+class FakeProvider(LlmProvider):
+    """Local stand-in with configurable latency, canned responses and error injection
+
+    Responses are picked deterministically from the prompt, latencies and
+    injected errors come from a seeded random generator.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: str = "lognormal:1.5,0.5",
+        error_rate: float = 0.0,
+        seed: int = 0,
+        responses: Optional[Dict[str, list]] = None,
+        stream_chunk_words: int = 3,
+        failing_models: Optional[List[str]] = None,
+    ):
+        self.latency_kind, self.latency_params = parse_latency_spec(latency)
+        self.error_rate = error_rate
+        self.responses = {**FAKE_RESPONSES, **(responses or {})}
+        self.stream_chunk_words = max(1, stream_chunk_words)
+        self.failing_models = set(failing_models or [])
+        self._random = random.Random(seed)
+        self._stats = {"calls": 0, "streams": 0, "injected_errors": 0}
+
+    @classmethod
+    def from_env(cls) -> "FakeProvider":
+        responses = None
+        responses_file = os.environ.get("LLM_FAKE_RESPONSES_FILE")
+        if responses_file:
+            with open(responses_file, encoding="utf-8") as f:
+                responses = json.load(f)
+        return cls(
+            latency=os.environ.get("LLM_FAKE_LATENCY", "lognormal:1.5,0.5"),
+            error_rate=float(os.environ.get("LLM_FAKE_ERROR_RATE", 0)),
+            seed=int(os.environ.get("LLM_FAKE_SEED", 0)),
+            responses=responses,
+            stream_chunk_words=int(os.environ.get("LLM_FAKE_STREAM_CHUNK_WORDS", 3)),
+            failing_models=[model for model in os.environ.get("LLM_FAKE_FAILING_MODELS", "").split(",") if model],
+        )
+
+    def sample_latency(self) -> float:
+        if self.latency_kind == "fixed":
+            return self.latency_params[0]
+        if self.latency_kind == "uniform":
+            return self._random.uniform(*self.latency_params)
+        median, sigma = self.latency_params
+        return self._random.lognormvariate(0, sigma) * median
+
+    def render(self, endpoint: str, model: Tuple[str, str], system_message: str, text: str) -> str:
+        """Pick and fill the canned response for this prompt"""
+        if endpoint in FAKE_BUILDERS and endpoint not in self.responses:
+            return FAKE_BUILDERS[endpoint](text)
+        variants = self.responses.get(endpoint) or DEFAULT_FAKE_RESPONSE
+        digest = hashlib.sha256(f"{endpoint}\n{system_message}\n{text}".encode("utf-8")).digest()
+        variant = variants[digest[0] % len(variants)]
+        if not isinstance(variant, str):
+            return json.dumps(variant, ensure_ascii=False)
+        excerpt = " ".join(text.split())[:80]
+        return Template(variant).safe_substitute(endpoint=endpoint, model="/".join(model), excerpt=excerpt)
+
+    def _maybe_fail(self, endpoint: str, model: Tuple[str, str]):
+        if "/".join(model) in self.failing_models or (self.error_rate and self._random.random() < self.error_rate):
+            self._stats["injected_errors"] += 1
+            raise FakeProviderError(f"Injected failure for {endpoint}")
+
+    async def complete(self, endpoint, model, session_id, system_message, text) -> str:
+        self._stats["calls"] += 1
+        await asyncio.sleep(self.sample_latency())
+        self._maybe_fail(endpoint, model)
+        return self.render(endpoint, model, system_message, text)
+
+    async def open_stream(self, endpoint, model, session_id, system_message, text) -> AsyncIterator[str]:
+        self._stats["streams"] += 1
+        self._maybe_fail(endpoint, model)
+        return self._stream(endpoint, model, system_message, text)
+
+    async def _stream(self, endpoint, model, system_message, text) -> AsyncIterator[str]:
+        words = self.render(endpoint, model, system_message, text).split(" ")
+        chunks = [
+            " ".join(words[i:i + self.stream_chunk_words])
+            for i in range(0, len(words), self.stream_chunk_words)
+        ]
+        # First token after a fifth of the sampled latency, the rest spread evenly
+        latency = self.sample_latency()
+        await asyncio.sleep(latency * 0.2)
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(latency * 0.8 / len(chunks))
+            yield chunk if index == 0 else " " + chunk
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            **self._stats,
+            "latency": f"{self.latency_kind}:{','.join(str(p) for p in self.latency_params)}",
+            "error_rate": self.error_rate,
+        }
+
+
+def provider_from_env(api_key: Optional[str]) -> LlmProvider:
+    """Build the provider selected by LLM_PROVIDER"""
+    name = os.environ.get("LLM_PROVIDER", "emergent").strip().lower()
+    if name == "fake":
+        logger.warning("LLM_PROVIDER=fake - AI endpoints return canned responses")
+        return FakeProvider.from_env()
+    if name != "emergent":
+        raise ValueError(f"Unknown LLM_PROVIDER: {name}")
+    return EmergentProvider.from_env(api_key)
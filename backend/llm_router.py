@@ -0,0 +1,154 @@
+"""Task-class based model routing across latency/cost tiers"""
+import os
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from llm_deadline import percentile
+
+DEFAULT_MODEL = ("openai", "gpt-4o")
+
+# Task classes declared for every gateway endpoint
+TASK_SHORT = "short"  # A few sentences of plain text
+TASK_CONVERSATION = "conversation"  # Live role-play turns
+TASK_STRUCTURED = "structured"  # JSON output that must follow a schema
+TASK_DEEP = "deep"  # Long-form analysis and plans
+
+# Tiers from fastest/cheapest to most capable; override with
+# LLM_TIERS="fast=openai/gpt-4o-mini,standard=openai/gpt-4o"
+DEFAULT_TIERS = {
+    "fast": ("openai", "gpt-4o-mini"),
+    "standard": DEFAULT_MODEL,
+}
+
+# Tiers tried in order for each task class; the next one is used when a call
+# fails or the model's circuit is open. Override with
+# LLM_ROUTES="short=fast>standard,deep=standard>fast"
+DEFAULT_ROUTES = {
+    TASK_SHORT: ["fast", "standard"],
+    TASK_CONVERSATION: ["standard", "fast"],
+    TASK_STRUCTURED: ["standard", "fast"],
+    TASK_DEEP: ["standard", "fast"],
+}
+
+
+def parse_model_spec(spec: str) -> Tuple[str, str]:
+    """Parse 'provider/model' into a (provider, model) tuple"""
+    if "/" not in spec:
+        return DEFAULT_MODEL[0], spec.strip()
+    provider, model = spec.split("/", 1)
+    return provider.strip(), model.strip()
+
+
+def parse_tiers(spec: str) -> Dict[str, Tuple[str, str]]:
+    """Parse 'tier=provider/model,...'"""
+    tiers = {}
+    for item in spec.split(","):
+        if "=" in item:
+            tier, model = item.split("=", 1)
+            tiers[tier.strip()] = parse_model_spec(model)
+    return tiers
+
+
+def parse_routes(spec: str) -> Dict[str, List[str]]:
+    """Parse 'task_class=tier>tier,...'"""
+    routes = {}
+    for item in spec.split(","):
+        if "=" in item:
+            task_class, tiers = item.split("=", 1)
+            routes[task_class.strip()] = [tier.strip() for tier in tiers.split(">") if tier.strip()]
+    return routes
+
+
+def model_name(model: Tuple[str, str]) -> str:
+    return "/".join(model)
+
+
+class ModelRouter:
+    """Picks the ordered list of models to try for an endpoint's task class"""
+
+    def __init__(
+        self,
+        endpoint_classes: Dict[str, str],
+        tiers: Optional[Dict[str, Tuple[str, str]]] = None,
+        routes: Optional[Dict[str, List[str]]] = None,
+        pinned: Optional[Dict[str, Tuple[str, str]]] = None,
+        window: int = 1000,
+    ):
+        self.endpoint_classes = endpoint_classes
+        self.tiers = tiers or dict(DEFAULT_TIERS)
+        self.routes = {**DEFAULT_ROUTES, **(routes or {})}
+        self.pinned = pinned or {}
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._counts: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: {"calls": 0, "errors": 0})
+        self._fallbacks: Dict[str, int] = defaultdict(int)
+
+    @classmethod
+    def from_env(cls, endpoint_classes: Dict[str, str]) -> "ModelRouter":
+        """Build the router from LLM_TIERS, LLM_ROUTES and LLM_MODEL_<ENDPOINT>"""
+        tiers = dict(DEFAULT_TIERS)
+        # LLM_DEFAULT_MODEL keeps configuring the standard tier
+        if os.environ.get("LLM_DEFAULT_MODEL"):
+            tiers["standard"] = parse_model_spec(os.environ["LLM_DEFAULT_MODEL"])
+        tiers.update(parse_tiers(os.environ.get("LLM_TIERS", "")))
+
+        pinned = {}
+        for endpoint in endpoint_classes:
+            spec = os.environ.get(f"LLM_MODEL_{endpoint.upper()}")
+            if spec:
+                pinned[endpoint] = parse_model_spec(spec)
+
+        return cls(
+            endpoint_classes=endpoint_classes,
+            tiers=tiers,
+            routes=parse_routes(os.environ.get("LLM_ROUTES", "")),
+            pinned=pinned,
+            window=int(os.environ.get("LLM_LATENCY_WINDOW", 1000)),
+        )
+
+    def task_class(self, endpoint: str) -> str:
+        return self.endpoint_classes.get(endpoint, TASK_DEEP)
+
+    def models_for(self, endpoint: str) -> List[Tuple[str, str]]:
+        """Models to try in order; a pinned endpoint model goes first"""
+        route = self.routes.get(self.task_class(endpoint), ["standard"])
+        models = [self.pinned[endpoint]] if endpoint in self.pinned else []
+        for tier in route:
+            model = self.tiers.get(tier)
+            if model is not None and model not in models:
+                models.append(model)
+        return models or [DEFAULT_MODEL]
+
+    def primary_model(self, endpoint: str) -> Tuple[str, str]:
+        return self.models_for(endpoint)[0]
+
+    def record(self, endpoint: str, model: Tuple[str, str], latency: float, failed: bool, attempt: int):
+        """Record one upstream attempt; attempt > 0 means a fallback tier served it"""
+        key = (self.task_class(endpoint), model_name(model))
+        self._counts[key]["calls"] += 1
+        if failed:
+            self._counts[key]["errors"] += 1
+        else:
+            self._latencies[key].append(latency)
+        if attempt > 0:
+            self._fallbacks[self.task_class(endpoint)] += 1
+
+    def stats(self) -> dict:
+        routes = {}
+        for task_class, route in self.routes.items():
+            routes[task_class] = {
+                "tiers": route,
+                "fallbacks": self._fallbacks.get(task_class, 0),
+                "models": {}
+            }
+        for (task_class, model), counts in self._counts.items():
+            latencies = list(self._latencies[(task_class, model)])
+            routes.setdefault(task_class, {"tiers": [], "fallbacks": 0, "models": {}})["models"][model] = {
+                **counts,
+                "p50_seconds": percentile(latencies, 50),
+                "p95_seconds": percentile(latencies, 95)
+            }
+        return {
+            "tiers": {tier: model_name(model) for tier, model in self.tiers.items()},
+            "pinned": {endpoint: model_name(model) for endpoint, model in self.pinned.items()},
+            "routes": routes
+        }
@@ -0,0 +1,179 @@
+"""Native BSON dates for every collection, plus a migration for ISO strings
+
+Clients are created with CODEC_OPTIONS so stored dates come back as aware
+UTC datetimes. Writers pass datetimes straight through (to_mongo only makes
+naive ones explicit UTC). Older documents stored timestamps as isoformat
+strings; rewrite them online with:
+
+    python mongo_dates.py            # count documents still holding strings
+    python mongo_dates.py --apply    # rewrite them in batches
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Keyword arguments for AsyncIOMotorClient
+CODEC_OPTIONS = {"tz_aware": True, "tzinfo": timezone.utc}
+
+# Date fields per collection; "array.field" is a field inside each element of an array of subdocuments
+DATE_FIELDS: Dict[str, List[str]] = {
+    "users": ["created_at", "updated_at", "subscription_expires_at"],
+    "training_sessions": [
+        "created_at", "completed_at", "last_message_at", "messages.timestamp", "late_responses.timestamp",
+    ],
+    "training_message_buckets": ["messages.timestamp"],
+    "training_late_responses": ["timestamp"],
+    "training_evaluations": ["created_at"],
+    "progress": ["completed_at"],
+    "dialog_sessions": ["created_at"],
+    "weekly_progress": ["updated_at"],
+    "community_cases": ["created_at"],
+    "payment_transactions": ["created_at", "updated_at"],
+    "contact_messages": ["created_at"],
+}
+
+
+def utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def parse_datetime(value: Any) -> Optional[datetime]:
+    """Aware datetime from a stored value that may still be an ISO string"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return utc(value)
+
+
+def to_mongo(data: Any) -> Any:
+    """Make every datetime in a document aware (UTC) so it is stored as a BSON date"""
+    if isinstance(data, datetime):
+        return utc(data)
+    if isinstance(data, dict):
+        return {key: to_mongo(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [to_mongo(value) for value in data]
+    return data
+
+
+def _convert(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return parse_datetime(value)
+        except ValueError:
+            return value
+    return value
+
+
+def converted_fields(doc: dict, fields: List[str]) -> dict:
+    """$set payload replacing string dates in doc; empty when nothing changes"""
+    updates = {}
+    for field in fields:
+        if "." in field:
+            array, subfield = field.split(".", 1)
+            items = updates.get(array, doc.get(array))
+            if not isinstance(items, list):
+                continue
+            new_items = [
+                {**item, subfield: _convert(item[subfield])} if isinstance(item, dict) and subfield in item else item
+                for item in items
+            ]
+            if new_items != items:
+                updates[array] = new_items
+        elif field in doc:
+            value = _convert(doc[field])
+            if value is not doc[field]:
+                updates[field] = value
+    return updates
+
+
+def string_date_filter(fields: List[str]) -> dict:
+    return {"$or": [{field: {"$type": "string"}} for field in fields]}
+
+
+async def count_string_dates(db) -> Dict[str, int]:
+    return {
+        collection: await db[collection].count_documents(string_date_filter(fields))
+        for collection, fields in DATE_FIELDS.items()
+    }
+
+
+async def migrate_collection(collection, fields: List[str], batch_size: int = 500) -> int:
+    """Rewrite string dates in one collection, batch by batch
+
+    Each update is conditional on the converted fields still holding the
+    values that were read, so documents written concurrently are never
+    clobbered; they are picked up by a later pass instead.
+    """
+    rewritten = 0
+    last_id = None
+    while True:
+        query = string_date_filter(fields)
+        if last_id is not None:
+            query = {"$and": [query, {"_id": {"$gt": last_id}}]}
+        docs = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not docs:
+            return rewritten
+        last_id = docs[-1]["_id"]
+
+        operations = []
+        for doc in docs:
+            updates = converted_fields(doc, fields)
+            if updates:
+                guard = {"_id": doc["_id"], **{field: doc[field] for field in updates}}
+                operations.append(UpdateOne(guard, {"$set": updates}))
+        if operations:
+            result = await collection.bulk_write(operations, ordered=False)
+            rewritten += result.modified_count
+        logger.info(f"{collection.name}: rewrote {rewritten} documents so far")
+
+
+async def migrate_all(db, batch_size: int = 500) -> Dict[str, int]:
+    return {
+        collection: await migrate_collection(db[collection], fields, batch_size)
+        for collection, fields in DATE_FIELDS.items()
+    }
+
+
+async def _main(apply: bool, batch_size: int) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    mongo_url = os.environ.get('MONGO_URL')
+    if not mongo_url:
+        print("MONGO_URL environment variable is required", file=sys.stderr)
+        return 2
+
+    client = AsyncIOMotorClient(mongo_url, **CODEC_OPTIONS)
+    try:
+        db = client.get_database(os.environ.get('MONGO_DB_NAME', 'app_database'))
+        if apply:
+            for collection, count in (await migrate_all(db, batch_size)).items():
+                print(f"{collection}: rewrote {count} documents")
+        remaining = await count_string_dates(db)
+    finally:
+        client.close()
+
+    for collection, count in remaining.items():
+        print(f"{collection}: {count} documents with string dates")
+    return 1 if any(remaining.values()) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert ISO string timestamps to native BSON dates")
+    parser.add_argument("--apply", action="store_true", help="rewrite documents instead of only counting them")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(args.apply, args.batch_size)))
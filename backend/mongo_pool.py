@@ -0,0 +1,178 @@
+"""Motor connection pool settings, read routing and pool wait metrics"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from pymongo import monitoring
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+from llm_deadline import percentile
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def parse_read_preference(mode: str, max_staleness: int = -1):
+    """Read preference for a mode name; staleness applies to non-primary modes only"""
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {mode!r}; expected one of {sorted(READ_PREFERENCES)}")
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+
+class PoolWaitMetrics(monitoring.ConnectionPoolListener):
+    """Measures how long operations wait to check a connection out of the pool
+
+    PyMongo runs each checkout synchronously on one Motor executor thread, so
+    the started and finished events of a checkout share a thread.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._waits: Deque[float] = deque(maxlen=window)
+        self._stats = {"checkouts": 0, "checkout_failures": 0, "timeouts": 0, "checked_out": 0, "pools_cleared": 0}
+
+    def _finish_wait(self) -> Optional[float]:
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return time.monotonic() - started if started is not None else None
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.monotonic()
+
+    def connection_checked_out(self, event):
+        wait = self._finish_wait()
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["checked_out"] += 1
+            if wait is not None:
+                self._waits.append(wait)
+
+    def connection_check_out_failed(self, event):
+        wait = self._finish_wait()
+        with self._lock:
+            self._stats["checkout_failures"] += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self._stats["timeouts"] += 1
+            if wait is not None:
+                self._waits.append(wait)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._stats["checked_out"] -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._stats["pools_cleared"] += 1
+        logger.warning(f"MongoDB connection pool cleared for {event.address}")
+
+    # Remaining pool events are not needed for wait metrics
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = list(self._waits)
+            stats = dict(self._stats)
+        return {
+            **stats,
+            "wait_p50_seconds": percentile(waits, 50),
+            "wait_p95_seconds": percentile(waits, 95),
+            "wait_max_seconds": max(waits) if waits else None,
+        }
+
+
+class MongoPoolConfig:
+    """Client pool options plus the read preference for read-mostly history endpoints
+
+    Writes, payment and session paths always use the client default (primary);
+    only the history database handle routes reads elsewhere.
+    """
+
+    def __init__(
+        self,
+        max_pool_size: int = 100,
+        min_pool_size: int = 0,
+        max_idle_time_ms: Optional[int] = None,
+        wait_queue_timeout_ms: Optional[int] = None,
+        compressors: Optional[str] = None,
+        history_read_preference: str = "primary",
+        max_staleness_seconds: int = -1,
+    ):
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.max_idle_time_ms = max_idle_time_ms
+        self.wait_queue_timeout_ms = wait_queue_timeout_ms
+        self.compressors = compressors
+        self.history_read_preference = parse_read_preference(history_read_preference, max_staleness_seconds)
+        self.pool_metrics = PoolWaitMetrics()
+
+    @classmethod
+    def from_env(cls) -> "MongoPoolConfig":
+        """Build the config from MONGO_* environment variables"""
+        def optional_int(name: str) -> Optional[int]:
+            value = os.environ.get(name)
+            return int(value) if value else None
+
+        return cls(
+            max_pool_size=int(os.environ.get("MONGO_MAX_POOL_SIZE", 100)),
+            min_pool_size=int(os.environ.get("MONGO_MIN_POOL_SIZE", 0)),
+            max_idle_time_ms=optional_int("MONGO_MAX_IDLE_TIME_MS"),
+            wait_queue_timeout_ms=optional_int("MONGO_WAIT_QUEUE_TIMEOUT_MS"),
+            compressors=os.environ.get("MONGO_COMPRESSORS") or None,
+            history_read_preference=os.environ.get("MONGO_HISTORY_READ_PREFERENCE", "primary"),
+            max_staleness_seconds=int(os.environ.get("MONGO_MAX_STALENESS_SECONDS", -1)),
+        )
+
+    def client_options(self) -> dict:
+        """Keyword arguments for AsyncIOMotorClient"""
+        options = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "event_listeners": [self.pool_metrics],
+        }
+        if self.max_idle_time_ms is not None:
+            options["maxIdleTimeMS"] = self.max_idle_time_ms
+        if self.wait_queue_timeout_ms is not None:
+            options["waitQueueTimeoutMS"] = self.wait_queue_timeout_ms
+        if self.compressors:
+            options["compressors"] = self.compressors
+        return options
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "max_pool_size": self.max_pool_size,
+            "min_pool_size": self.min_pool_size,
+            "max_idle_time_ms": self.max_idle_time_ms,
+            "wait_queue_timeout_ms": self.wait_queue_timeout_ms,
+            "compressors": self.compressors,
+            "history_read_preference": self.history_read_preference.document,
+            "pool": self.pool_metrics.stats(),
+        }
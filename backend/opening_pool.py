@@ -0,0 +1,147 @@
+"""Background-warmed pool of pre-generated training scenario openings"""
+import asyncio
+import logging
+import os
+import re
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+USER_NAME_PLACEHOLDER = "{user_name}"
+PARTNER_NAME_PLACEHOLDER = "{partner_name}"
+
+# Shorter names match too much ordinary text to be templated back out safely
+MIN_TEMPLATE_NAME_LENGTH = 3
+
+
+def render_names(template: str, user_name: str, partner_name: str) -> str:
+    """Substitute the name placeholders in an opening template"""
+    return template.replace(USER_NAME_PLACEHOLDER, user_name).replace(PARTNER_NAME_PLACEHOLDER, partner_name)
+
+
+def to_template(text: str, user_name: str, partner_name: str) -> Optional[str]:
+    """Turn a rendered opening back into a name-templated one
+
+    Only whole-word occurrences of the names are replaced. Returns None when
+    either name is empty or too short to tell apart from ordinary words.
+    """
+    names = ((user_name or "").strip(), (partner_name or "").strip())
+    if any(len(name) < MIN_TEMPLATE_NAME_LENGTH for name in names):
+        return None
+    for name, placeholder in zip(names, (USER_NAME_PLACEHOLDER, PARTNER_NAME_PLACEHOLDER)):
+        text = re.sub(rf"\b{re.escape(name)}\b", lambda _: placeholder, text)
+    return text
+
+
+def is_valid_template(template: Optional[str]) -> bool:
+    """An opening is usable if it has content and no stray braces"""
+    if not template or len(template.strip()) < 10:
+        return False
+    stripped = template.replace(USER_NAME_PLACEHOLDER, "").replace(PARTNER_NAME_PLACEHOLDER, "")
+    return "{" not in stripped and "}" not in stripped
+
+
+class OpeningPool:
+    """Keeps N name-templated openings per scenario, refilled asynchronously"""
+
+    def __init__(
+        self,
+        generate: Callable[[int], Awaitable[Optional[str]]],
+        scenario_ids: Iterable[int],
+        target_size: int = 3,
+        concurrency: int = 2,
+    ):
+        self.generate = generate
+        self.scenario_ids = list(scenario_ids)
+        self.target_size = target_size
+        self.concurrency = concurrency
+        self._pools: Dict[int, Deque[str]] = defaultdict(deque)
+        self._refill_needed = asyncio.Event()
+        self._warmer: Optional[asyncio.Task] = None
+        self._stats = {"hits": 0, "misses": 0, "generated": 0, "rejected": 0, "errors": 0}
+
+    @classmethod
+    def from_env(cls, generate, scenario_ids) -> "OpeningPool":
+        """Build the pool from OPENING_POOL_* environment variables"""
+        return cls(
+            generate=generate,
+            scenario_ids=scenario_ids,
+            target_size=int(os.environ.get("OPENING_POOL_SIZE", 3)),
+            concurrency=int(os.environ.get("OPENING_POOL_CONCURRENCY", 2)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.target_size > 0
+
+    async def start(self):
+        """Start the background warmer"""
+        if not self.enabled or self._warmer is not None:
+            return
+        self._refill_needed.set()
+        self._warmer = asyncio.create_task(self._run_warmer())
+
+    async def close(self):
+        """Stop the background warmer"""
+        if self._warmer is None:
+            return
+        self._warmer.cancel()
+        try:
+            await self._warmer
+        except asyncio.CancelledError:
+            pass
+        self._warmer = None
+
+    def pop(self, scenario_id: int) -> Optional[str]:
+        """Take a template for the scenario, or None if the pool is empty"""
+        pool = self._pools.get(scenario_id)
+        self._refill_needed.set()
+        if not pool:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        return pool.popleft()
+
+    def offer(self, scenario_id: int, template: Optional[str]) -> bool:
+        """Add a template to the pool if it is valid and there is room"""
+        if not is_valid_template(template):
+            self._stats["rejected"] += 1
+            return False
+        pool = self._pools[scenario_id]
+        if len(pool) >= self.target_size:
+            return False
+        pool.append(template.strip())
+        return True
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "target_size": self.target_size,
+            "sizes": {scenario_id: len(self._pools[scenario_id]) for scenario_id in self.scenario_ids}
+        }
+
+    async def _run_warmer(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while True:
+            await self._refill_needed.wait()
+            self._refill_needed.clear()
+
+            missing = [
+                scenario_id
+                for scenario_id in self.scenario_ids
+                for _ in range(self.target_size - len(self._pools[scenario_id]))
+            ]
+            if missing:
+                await asyncio.gather(*(self._fill_one(scenario_id, semaphore) for scenario_id in missing))
+
+    async def _fill_one(self, scenario_id: int, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            try:
+                template = await self.generate(scenario_id)
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning(f"Opening pool generation failed for scenario {scenario_id}: {str(e)}")
+                return
+            if self.offer(scenario_id, template):
+                self._stats["generated"] += 1
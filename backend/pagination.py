@@ -0,0 +1,108 @@
+"""Keyset (cursor) pagination for MongoDB list endpoints
+
+Pages are ordered by the requested sort fields with _id as the final tie
+breaker, so the order is stable and each page is one indexed range scan no
+matter how deep the client pages. The cursor is an opaque URL-safe token
+holding the sort values of the last document returned, so sort fields
+must hold JSON values (numbers or strings).
+
+Sort fields should not change while a client pages: a document whose sort
+value moves past the cursor between requests is skipped or returned twice.
+"""
+import base64
+import json
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+# Response header carrying the cursor for the next page; absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(values: List) -> str:
+    payload = json.dumps(values, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def sort_order(sort: Sequence[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    """The sort fields with _id appended as tie breaker unless it is already last"""
+    if sort and sort[-1][0] == "_id":
+        return list(sort)
+    return list(sort) + [("_id", sort[-1][1] if sort else 1)]
+
+
+def decode_cursor(cursor: str, sort: Sequence[Tuple[str, int]]) -> List:
+    """Sort values plus the _id of the last document of the previous page"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(sort_order(sort)):
+            raise ValueError("wrong number of values")
+        return values[:-1] + [ObjectId(values[-1])]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(sort: Sequence[Tuple[str, int]], values: List) -> dict:
+    """Match documents strictly after values in (sort..., _id) order"""
+    keys = sort_order(sort)
+    branches = []
+    for position, (field, direction) in enumerate(keys):
+        branch = {prior: values[index] for index, (prior, _) in enumerate(keys[:position])}
+        branch[field] = {"$gt" if direction > 0 else "$lt": values[position]}
+        branches.append(branch)
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[dict]:
+    """Projection for a comma-separated field list, or None for whole documents"""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = sorted(set(requested) - set(allowed))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return {field: 1 for field in requested}
+
+
+async def fetch_page(
+    collection,
+    query: dict,
+    limit: int,
+    cursor: Optional[str] = None,
+    sort: Sequence[Tuple[str, int]] = (),
+    projection: Optional[dict] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of documents and the cursor for the next page (None when done)
+
+    _id is always read for the cursor but removed from the returned documents.
+    """
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort, decode_cursor(cursor, sort))]}
+    requested = None
+    if projection is not None:
+        # Sort fields and _id are read for the cursor even when not requested
+        requested = set(projection)
+        projection = {**projection, **{field: 1 for field, _ in sort}, "_id": 1}
+
+    order = sort_order(sort)
+    docs = await collection.find(query, projection).sort(order).limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor([last.get(field) for field, _ in order[:-1]] + [str(last["_id"])])
+
+    for doc in docs:
+        doc.pop("_id", None)
+        if requested is not None:
+            for field in set(doc) - requested:
+                del doc[field]
+    return docs, next_cursor
@@ -0,0 +1,163 @@
+"""Retention for transient documents: TTL indexes plus a sweeper
+
+TTL indexes (declared through db_indexes) expire:
+    password_reset_tokens     at their expires_at
+    connection_test           probe documents after CONNECTION_TEST_RETENTION_SECONDS
+    payment_transactions      still-pending checkouts after PENDING_PAYMENT_RETENTION_HOURS
+
+Abandoned training sessions need their message buckets and late responses
+removed too, which a TTL index cannot do, so RetentionSweeper deletes them periodically.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy:
+    """Retention periods for each transient data class"""
+
+    def __init__(
+        self,
+        reset_token_hours: float = 1.0,
+        connection_test_seconds: int = 3600,
+        pending_payment_hours: float = 7 * 24,
+        abandoned_session_hours: float = 48,
+        sweep_interval: float = 3600.0,
+        sweep_batch_size: int = 500,
+    ):
+        self.reset_token_hours = reset_token_hours
+        self.connection_test_seconds = connection_test_seconds
+        self.pending_payment_hours = pending_payment_hours
+        self.abandoned_session_hours = abandoned_session_hours
+        self.sweep_interval = sweep_interval
+        self.sweep_batch_size = sweep_batch_size
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        return cls(
+            reset_token_hours=float(os.environ.get("PASSWORD_RESET_TOKEN_HOURS", 1)),
+            connection_test_seconds=int(os.environ.get("CONNECTION_TEST_RETENTION_SECONDS", 3600)),
+            pending_payment_hours=float(os.environ.get("PENDING_PAYMENT_RETENTION_HOURS", 7 * 24)),
+            abandoned_session_hours=float(os.environ.get("ABANDONED_SESSION_RETENTION_HOURS", 48)),
+            sweep_interval=float(os.environ.get("RETENTION_SWEEP_SECONDS", 3600)),
+            sweep_batch_size=int(os.environ.get("RETENTION_SWEEP_BATCH_SIZE", 500)),
+        )
+
+    def ttl_indexes(self) -> Dict[str, List[IndexModel]]:
+        """TTL indexes for the classes MongoDB can expire on its own"""
+        return {
+            "password_reset_tokens": [
+                IndexModel([("token_hash", ASCENDING)], unique=True),
+                IndexModel([("user_id", ASCENDING)]),
+                IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+            ],
+            "connection_test": [
+                IndexModel([("timestamp", ASCENDING)], expireAfterSeconds=self.connection_test_seconds),
+            ],
+            "payment_transactions": [
+                # Paid and failed transactions fall outside the filter and are kept
+                IndexModel(
+                    [("created_at", ASCENDING)],
+                    expireAfterSeconds=int(self.pending_payment_hours * 3600),
+                    partialFilterExpression={"payment_status": "pending"}
+                ),
+            ],
+        }
+
+
+class RetentionSweeper:
+    """Periodically deletes abandoned training sessions together with their message buckets and late responses"""
+
+    def __init__(self, db, policy: RetentionPolicy):
+        self.db = db
+        self.policy = policy
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"sweeps": 0, "sessions_deleted": 0, "buckets_deleted": 0, "errors": 0, "last_sweep_at": None}
+
+    async def start(self):
+        if self._task is None and self.policy.sweep_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def sweep(self):
+        """Delete active sessions with no activity within the retention period
+
+        Headers go first so buckets are only removed for sessions actually
+        deleted; a crash in between can leave buckets without a header, never
+        a live session without its transcript.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=self.policy.abandoned_session_hours)
+        query = {
+            "status": "active",
+            "$or": [
+                {"last_message_at": {"$lt": cutoff}},
+                {"last_message_at": {"$exists": False}, "created_at": {"$lt": cutoff}},
+            ]
+        }
+        while True:
+            sessions = await self.db.training_sessions.find(query, {"_id": 0, "session_id": 1}).to_list(
+                length=self.policy.sweep_batch_size
+            )
+            if not sessions:
+                break
+            for session in sessions:
+                # The cutoff is re-checked in the delete itself, so a session that
+                # got a new turn since the find is kept along with its buckets
+                deleted = await self.db.training_sessions.find_one_and_delete(
+                    {**query, "session_id": session["session_id"]}, {"_id": 0, "session_id": 1}
+                )
+                if deleted is None:
+                    continue
+                buckets = await self.db.training_message_buckets.delete_many({"session_id": session["session_id"]})
+                await self.db.training_late_responses.delete_many({"session_id": session["session_id"]})
+                self._stats["buckets_deleted"] += buckets.deleted_count
+                self._stats["sessions_deleted"] += 1
+            if len(sessions) < self.policy.sweep_batch_size:
+                break
+        self._stats["sweeps"] += 1
+        self._stats["last_sweep_at"] = datetime.now(timezone.utc)
+
+    async def clear_legacy_reset_tokens(self):
+        """Drop reset tokens left on user documents from before password_reset_tokens existed"""
+        result = await self.db.users.update_many(
+            {"password_reset_token": {"$exists": True}},
+            {"$unset": {"password_reset_token": "", "password_reset_expires": ""}}
+        )
+        if result.modified_count:
+            logger.info(f"Removed legacy reset tokens from {result.modified_count} users")
+
+    async def _run(self):
+        try:
+            await self.clear_legacy_reset_tokens()
+        except Exception as e:
+            logger.warning(f"Legacy reset token cleanup failed: {str(e)}")
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning(f"Retention sweep failed: {str(e)}")
+            await asyncio.sleep(self.policy.sweep_interval)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "abandoned_session_hours": self.policy.abandoned_session_hours,
+            "pending_payment_hours": self.policy.pending_payment_hours,
+            "connection_test_seconds": self.policy.connection_test_seconds,
+            "reset_token_hours": self.policy.reset_token_hours,
+        }
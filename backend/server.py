@@ -1,15 +1,18 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, BackgroundTasks, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, BackgroundTasks, UploadFile, File
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
+import json
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Union
 import uuid
 from datetime import datetime, timezone, timedelta
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 from emergentintegrations.payments.stripe.checkout import StripeCheckout
 import stripe
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
@@ -19,6 +22,24 @@ import base64
 from passlib.context import CryptContext
 from passlib.hash import bcrypt
 import secrets
+import hashlib
+
+from db_indexes import declared_indexes, ensure_indexes, has_problems, log_report
+from entitlement_cache import EntitlementCache
+from llm_gateway import LlmGateway
+from llm_admission import PRIORITY_BATCH
+from llm_cache import LlmResponseCache
+from llm_circuit import CircuitOpenError
+from llm_context import ConversationContext, chunk_by_token_budget
+from llm_metrics import LlmUsageMetrics
+from mongo_dates import CODEC_OPTIONS, parse_datetime, to_mongo
+from mongo_pool import MongoPoolConfig
+from prompt_templates import PROMPTS
+from retention import RetentionPolicy, RetentionSweeper
+from training_messages import TrainingMessageStore
+from write_behind import IMMEDIATE, WriteBehindBuffer
+from opening_pool import OpeningPool, render_names, to_template, USER_NAME_PLACEHOLDER, PARTNER_NAME_PLACEHOLDER
+from pagination import NEXT_CURSOR_HEADER, fetch_page, parse_fields
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -51,6 +72,10 @@ def generate_reset_token() -> str:
     """Generate a secure reset token"""
     return secrets.token_urlsafe(32)
 
+def hash_reset_token(token: str) -> str:
+    """Reset tokens are stored hashed so a database leak does not expose usable tokens"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
 # MongoDB Connection with improved error handling
 mongo_url = os.environ.get('MONGO_URL')
 if not mongo_url:
@@ -58,8 +83,11 @@ if not mongo_url:
 
 print(f"🔍 MONGO_URL: {mongo_url}")
 
+# Pool sizing, compression and read routing come from MONGO_* settings
+mongo_pool = MongoPoolConfig.from_env()
+
 try:
-    client = AsyncIOMotorClient(mongo_url)
+    client = AsyncIOMotorClient(mongo_url, **CODEC_OPTIONS, **mongo_pool.client_options())
     
     # Use environment variable for database name - CRITICAL for managed deployments
     db_name = os.environ.get('MONGO_DB_NAME')
@@ -71,6 +99,9 @@ try:
     
     print(f"🔍 Using database: {db_name}")
     db = client.get_database(db_name)
+    # Read-mostly history lists may be served by secondaries (MONGO_HISTORY_READ_PREFERENCE);
+    # everything else, including payments and writes, stays on primary via db
+    history_db = client.get_database(db_name, read_preference=mongo_pool.history_read_preference)
     print("✅ MongoDB connection initialized successfully")
     
     # Test database permissions
@@ -140,6 +171,23 @@ class EmpathyFeedback(BaseModel):
     emotional_awareness: str
     next_level_tip: str
 
+class BatchEmpathyEvaluation(BaseModel):
+    scenario_id: int
+    user_id: str
+    user_responses: List[str] = Field(..., min_length=1, max_length=100)
+
+class IndexedEmpathyFeedback(EmpathyFeedback):
+    index: int
+
+class EmpathyFeedbackBatch(BaseModel):
+    evaluations: List[IndexedEmpathyFeedback]
+
+class BatchEvaluationItem(BaseModel):
+    index: int
+    user_response: str
+    feedback: EmpathyFeedback
+    fallback: bool = False
+
 # Training Scenarios Data
 TRAINING_SCENARIOS = {
     1: {
@@ -271,6 +319,116 @@ TRAINING_SCENARIOS = {
     }
 }
 
+# Partner prompts used to generate each scenario's opening line. Names are
+# left as {user_name}/{partner_name} placeholders and filled in with render_names.
+SCENARIO_OPENING_PROMPTS = {
+    # Stufe 1: Grundlagen
+    1: "Du bist {partner_name} und kommst erschöpft von einem stressigen Arbeitstag heim. Du fühlst dich überlastet und brauchst emotionale Unterstützung von {user_name}. Antworte in 2-3 Sätzen wie du dich fühlst.",
+    2: "Du bist {partner_name} und machst dir Sorgen um deine Jobsuche. Du fühlst dich unsicher und ängstlich. Teile deine Bedenken mit {user_name} in 2-3 Sätzen.",
+    3: "Du bist {partner_name} und hattest Probleme mit einer Freundin namens Sarah. Du bist frustriert und brauchst jemanden zum Reden. Erkläre {user_name} kurz was passiert ist.",
+    4: "Du bist {partner_name} und versuchst zu verbergen, dass du gestresst bist, aber deine Körpersprache verrät dich. Antworte defensiv aber lass durchblicken, dass doch etwas nicht stimmt.",
+    5: "Du bist {partner_name} und hast eine wichtige Beförderung nicht bekommen. Du bist enttäuscht und verletzt. Teile deine Gefühle mit {user_name}.",
+    
+    # Stufe 2: Konfliktlösung
+    6: "Du bist {partner_name} und frustriert über die Urlaubsplanung. Du willst in die Berge, aber es ist immer Strand. Drücke deine Frustration aus und erkläre warum dir das so wichtig ist.",
+    7: "Du bist {partner_name} und fühlst dich überlastet mit dem Haushalt. Du bist verletzt von der gestrigen Kritik. Erkläre wie du dich fühlst und was du brauchst.",
+    8: "Du bist {partner_name} und verteidigst spontane Familienverpflichtungen. Du fühlst dich zwischen Familie und Partner hin- und hergerissen. Erkläre deine Position emotional.",
+    
+    # Stufe 3: Emotionale Intelligenz  
+    9: "Du bist {partner_name} und kämpfst mit Selbstzweifeln bezüglich deines Körperbildes. Du fühlst dich unattraktiv und zweifelst an dir selbst. Teile deine verletzlichen Gefühle mit {user_name}.",
+    10: "Du bist {partner_name} und leidest unter Ängsten, die dich nachts wach halten. Du schämst dich für deine Schwäche und brauchst Unterstützung von {user_name}.",
+    11: "Du bist {partner_name} und hast Angst vor Nähe nach einer schlechten Erfahrung. Du ziehst dich zurück aber sehnst dich nach Verbindung mit {user_name}.",
+    
+    # Stufe 4: Vertrauen & Intimität
+    12: "Du bist {partner_name} und fühlst dich emotional vernachlässigt in der Beziehung. Du sehnst dich nach mehr emotionaler Intimität mit {user_name}.",
+    13: "Du bist {partner_name} und hast Vertrauensprobleme nach einer Enttäuschung. Du willst vertrauen, aber hast Angst vor erneuter Verletzung.",
+    14: "Du bist {partner_name} und fühlst dich nicht genug wertgeschätzt. Du brauchst mehr Anerkennung und Aufmerksamkeit von {user_name}.",
+    
+    # Stufe 5: Lebenskrisen
+    15: "Du bist {partner_name} und durchlebst eine Midlife-Crisis. Du zweifelst an deinen Lebensentscheidungen und brauchst Unterstützung von {user_name}.",
+    16: "Du bist {partner_name} und trauerst um einen Verlust. Du bist überwältigt von Emotionen und brauchst {user_name} zum Halt finden.",
+    17: "Du bist {partner_name} und stehst vor einer großen Lebensveränderung. Du hast Angst vor der Ungewissheit und brauchst Rückhalt von {user_name}."
+}
+
+# Scenario-specific fallback openings used when the AI opening is unavailable
+SCENARIO_FALLBACK_OPENINGS = {
+    # Stufe 1: Grundlagen
+    1: "Puh, {user_name}, ich bin heute wirklich am Ende. Die Arbeit wird immer mehr und ich weiß nicht, wie ich das alles schaffen soll. Ich fühle mich so erschöpft...",
+    2: "{user_name}, ich mache mir wirklich Sorgen wegen der Jobsuche. Was ist, wenn ich nichts Passendes finde? Die Ungewissheit macht mir richtig Angst.",
+    3: "Ach {user_name}, Sarah und ich hatten wieder so eine Diskussion. Es ist echt kompliziert zwischen uns geworden und ich weiß nicht mehr, was ich machen soll.",
+    4: "Mir geht's schon gut, {user_name}... nur ein bisschen müde heute. *seufzt und wirkt angespannt* Wirklich, es ist nichts Besonderes.",
+    5: "{user_name}, ich hab die Beförderung nicht bekommen. Sie haben jemand anderen genommen. Ich bin so enttäuscht... ich hatte mir so viele Hoffnungen gemacht.",
+    
+    # Stufe 2: Konfliktlösung
+    6: "{user_name}, du verstehst einfach nicht was ich brauche! Ich möchte endlich mal in die Berge, Ruhe haben. Warum muss es denn immer Strand sein?",
+    7: "Ich fühle mich, als würde ich alles alleine machen, {user_name}. Deine Kritik von gestern hat mich richtig getroffen. Siehst du denn nicht, wie viel ich tue?",
+    8: "Das ist meine Familie, {user_name}! Ich kann doch nicht nein sagen, wenn sie Hilfe brauchen. Warum verstehst du das nicht?",
+    
+    # Stufe 3: Emotionale Intelligenz
+    9: "Ich kann das einfach nicht mehr ertragen, {user_name}. Du findest mich bestimmt nicht mehr attraktiv... ich erkenne mich selbst nicht mehr.",
+    10: "{user_name}, diese Ängste lassen mich nicht schlafen. Ich schäme mich so dafür, aber ich kann sie einfach nicht abstellen. Bin ich schwach?",
+    11: "Ich weiß, ich ziehe mich zurück, {user_name}. Nach dem was passiert ist, fällt es mir so schwer, dir zu vertrauen. Aber ich vermisse unsere Nähe so sehr.",
+    
+    # Stufe 4: Vertrauen & Intimität  
+    12: "{user_name}, ich fühle mich so einsam in unserer Beziehung. Wir reden zwar, aber ich spüre keine echte Verbindung mehr. Liebst du mich noch?",
+    13: "Ich will dir vertrauen, {user_name}, ich will es wirklich. Aber nach dem was passiert ist, habe ich solche Angst vor erneuter Enttäuschung.",
+    14: "Manchmal frage ich mich, {user_name}, ob du überhaupt noch siehst, was ich alles für uns tue. Ich fühle mich so unsichtbar und unwichtig.",
+    
+    # Stufe 5: Lebenskrisen
+    15: "{user_name}, ich frage mich, ob ich die richtigen Entscheidungen in meinem Leben getroffen habe. Ist das alles hier wirklich das, was ich wollte?",
+    16: "Seit dem Verlust fühle ich mich wie betäubt, {user_name}. Die Trauer überwältigt mich und ich weiß nicht, wie ich damit umgehen soll.",
+    17: "{user_name}, diese ganze Veränderung macht mir Angst. Was ist, wenn wir das nicht schaffen? Was ist, wenn alles schief geht?"
+}
+
+OPENING_TEMPLATE_INSTRUCTION = """
+When you mention names, write the literal placeholders {user_name} and {partner_name} instead of real names. Do not use any other curly braces."""
+
+def build_training_system_message(scenario: dict, user_name: str, partner_name: str) -> str:
+    """System prompt for playing the partner in a training scenario"""
+    return PROMPTS["training_partner"].render(
+        partner_name=partner_name,
+        user_name=user_name,
+        title=scenario['title'],
+        context=scenario['context'],
+        learning_goals=', '.join(scenario['learning_goals'])
+    )
+
+def build_opening_prompt(scenario_id: int, user_name: str, partner_name: str) -> str:
+    """Scenario-specific prompt for the partner's opening line"""
+    scenario = TRAINING_SCENARIOS[scenario_id]
+    template = SCENARIO_OPENING_PROMPTS.get(
+        scenario_id,
+        f"Du bist {{partner_name}} in der Situation: {scenario['context']}. Antworte emotinal wie beschrieben in 2-3 Sätzen."
+    )
+    return render_names(template, user_name, partner_name)
+
+async def generate_opening_template(scenario_id: int) -> str:
+    """Generate a name-templated opening for the opening pool"""
+    scenario = TRAINING_SCENARIOS[scenario_id]
+    return await llm_gateway.send_message(
+        "training_start",
+        session_id=f"opening_pool_{scenario_id}_{uuid.uuid4()}",
+        system_message=build_training_system_message(scenario, USER_NAME_PLACEHOLDER, PARTNER_NAME_PLACEHOLDER) + OPENING_TEMPLATE_INSTRUCTION,
+        text=build_opening_prompt(scenario_id, USER_NAME_PLACEHOLDER, PARTNER_NAME_PLACEHOLDER),
+        priority=PRIORITY_BATCH,
+        user_tier="system"
+    )
+
+opening_pool = OpeningPool.from_env(generate_opening_template, TRAINING_SCENARIOS.keys())
+
+# Token-budgeted conversation history for multi-turn training sessions
+training_context = ConversationContext.from_env()
+
+# Retention for transient documents: TTL indexes (via db_indexes) and the abandoned-session sweeper
+retention_policy = RetentionPolicy.from_env()
+retention_sweeper = RetentionSweeper(db, retention_policy)
+
+# Buffered counter increments and appends, flushed in bulk (see write_behind.py)
+write_behind = WriteBehindBuffer.from_env(db)
+
+# Training transcripts in fixed-size bucket documents next to the session header
+training_messages = TrainingMessageStore.from_env(db.training_sessions, db.training_message_buckets)
+
 # Real AI-Powered Training Endpoints
 @api_router.post("/training/start-scenario")
 async def start_training_scenario(request: TrainingScenarioRequest):
@@ -281,128 +439,52 @@ async def start_training_scenario(request: TrainingScenarioRequest):
         
         scenario = TRAINING_SCENARIOS[request.scenario_id]
         
-        # Initialize AI chat for this scenario
         session_id = f"training_{request.user_id}_{request.scenario_id}_{datetime.now().isoformat()}"
         
-        system_message = f"""You are {request.partner_name} in an empathy training scenario. You are experiencing the situation described and need to express YOUR feelings and concerns to {request.user_name}.
-
-SCENARIO: {scenario['title']}
-CONTEXT: {scenario['context']}
-LEARNING GOALS: {', '.join(scenario['learning_goals'])}
-
-IMPORTANT: You are NOT being empathetic - you are the one who NEEDS empathy from {request.user_name}.
-
-Your role as {request.partner_name}:
-- Express YOUR emotions and frustrations from the scenario
-- Share YOUR perspective and feelings honestly
-- Be vulnerable and authentic about what YOU are experiencing  
-- You are stressed/upset/frustrated (as described in the context)
-- Don't be empathetic back - you need support from {request.user_name}
-- Keep responses conversational (2-3 sentences max)
-- Show the emotional state described in the scenario context
-- Wait for {request.user_name} to show empathy to YOU
-
-Current emotional state: You are feeling the stress/frustration described in the context and need {request.user_name}'s empathy and support.
-"""
-
-        # Initialize the AI chat
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=session_id,
-            system_message=system_message
-        ).with_model("openai", "gpt-4o")
-
-        # Generate individual opening message for this specific scenario
-        try:
-            # Create scenario-specific prompts
-            scenario_prompts = {
-                # Stufe 1: Grundlagen
-                1: f"Du bist {request.partner_name} und kommst erschöpft von einem stressigen Arbeitstag heim. Du fühlst dich überlastet und brauchst emotionale Unterstützung von {request.user_name}. Antworte in 2-3 Sätzen wie du dich fühlst.",
-                2: f"Du bist {request.partner_name} und machst dir Sorgen um deine Jobsuche. Du fühlst dich unsicher und ängstlich. Teile deine Bedenken mit {request.user_name} in 2-3 Sätzen.",
-                3: f"Du bist {request.partner_name} und hattest Probleme mit einer Freundin namens Sarah. Du bist frustriert und brauchst jemanden zum Reden. Erkläre {request.user_name} kurz was passiert ist.",
-                4: f"Du bist {request.partner_name} und versuchst zu verbergen, dass du gestresst bist, aber deine Körpersprache verrät dich. Antworte defensiv aber lass durchblicken, dass doch etwas nicht stimmt.",
-                5: f"Du bist {request.partner_name} und hast eine wichtige Beförderung nicht bekommen. Du bist enttäuscht und verletzt. Teile deine Gefühle mit {request.user_name}.",
-                
-                # Stufe 2: Konfliktlösung
-                6: f"Du bist {request.partner_name} und frustriert über die Urlaubsplanung. Du willst in die Berge, aber es ist immer Strand. Drücke deine Frustration aus und erkläre warum dir das so wichtig ist.",
-                7: f"Du bist {request.partner_name} und fühlst dich überlastet mit dem Haushalt. Du bist verletzt von der gestrigen Kritik. Erkläre wie du dich fühlst und was du brauchst.",
-                8: f"Du bist {request.partner_name} und verteidigst spontane Familienverpflichtungen. Du fühlst dich zwischen Familie und Partner hin- und hergerissen. Erkläre deine Position emotional.",
-                
-                # Stufe 3: Emotionale Intelligenz  
-                9: f"Du bist {request.partner_name} und kämpfst mit Selbstzweifeln bezüglich deines Körperbildes. Du fühlst dich unattraktiv und zweifelst an dir selbst. Teile deine verletzlichen Gefühle mit {request.user_name}.",
-                10: f"Du bist {request.partner_name} und leidest unter Ängsten, die dich nachts wach halten. Du schämst dich für deine Schwäche und brauchst Unterstützung von {request.user_name}.",
-                11: f"Du bist {request.partner_name} und hast Angst vor Nähe nach einer schlechten Erfahrung. Du ziehst dich zurück aber sehnst dich nach Verbindung mit {request.user_name}.",
-                
-                # Stufe 4: Vertrauen & Intimität
-                12: f"Du bist {request.partner_name} und fühlst dich emotional vernachlässigt in der Beziehung. Du sehnst dich nach mehr emotionaler Intimität mit {request.user_name}.",
-                13: f"Du bist {request.partner_name} und hast Vertrauensprobleme nach einer Enttäuschung. Du willst vertrauen, aber hast Angst vor erneuter Verletzung.",
-                14: f"Du bist {request.partner_name} und fühlst dich nicht genug wertgeschätzt. Du brauchst mehr Anerkennung und Aufmerksamkeit von {request.user_name}.",
-                
-                # Stufe 5: Lebenskrisen
-                15: f"Du bist {request.partner_name} und durchlebst eine Midlife-Crisis. Du zweifelst an deinen Lebensentscheidungen und brauchst Unterstützung von {request.user_name}.",
-                16: f"Du bist {request.partner_name} und trauerst um einen Verlust. Du bist überwältigt von Emotionen und brauchst {request.user_name} zum Halt finden.",
-                17: f"Du bist {request.partner_name} und stehst vor einer großen Lebensveränderung. Du hast Angst vor der Ungewissheit und brauchst Rückhalt von {request.user_name}."
-            }
-            
-            # Use scenario-specific prompt or general one
-            scenario_prompt = scenario_prompts.get(request.scenario_id, 
-                f"Du bist {request.partner_name} in der Situation: {scenario['context']}. Antworte emotinal wie beschrieben in 2-3 Sätzen.")
-            
-            opening_message = UserMessage(text=scenario_prompt)
-            response = await chat.send_message(opening_message)
+        # Serve a pre-generated opening when the pool has one
+        response_text = ""
+        template = opening_pool.pop(request.scenario_id)
+        if template:
+            response_text = render_names(template, request.user_name, request.partner_name)
+            print(f"🎭 TRAINING: Served pooled opening for scenario {request.scenario_id}")
+        
+        # Pool empty - generate the opening message for this specific scenario
+        if not response_text:
+            async def keep_late_opening(late_text: str):
+                # A reply that missed the deadline still makes a good pooled opening,
+                # unless the names are too short to be templated back out reliably
+                template = to_template(late_text, request.user_name, request.partner_name)
+                if template is not None:
+                    opening_pool.offer(request.scenario_id, template)
             
-            print(f"🎭 TRAINING: AI response for scenario {request.scenario_id}: '{response}' (type: {type(response)})")
-            
-            # Ensure response is converted to string properly
-            if hasattr(response, 'content'):
-                response_text = response.content
-            elif hasattr(response, 'text'):
-                response_text = response.text  
-            else:
-                response_text = str(response)
+            try:
+                response_text = await llm_gateway.send_with_deadline(
+                    "training_start",
+                    session_id=session_id,
+                    system_message=build_training_system_message(scenario, request.user_name, request.partner_name),
+                    text=build_opening_prompt(request.scenario_id, request.user_name, request.partner_name),
+                    on_late_result=keep_late_opening,
+                    user_tier=await resolve_user_tier(request.user_id)
+                ) or ""
+                
+                print(f"🎭 TRAINING: AI response for scenario {request.scenario_id}: '{response_text}'")
                 
-        except Exception as ai_error:
-            print(f"⚠️ TRAINING: AI generation failed for scenario {request.scenario_id}: {str(ai_error)}")
-            response_text = ""
+            except Exception as ai_error:
+                print(f"⚠️ TRAINING: AI generation failed for scenario {request.scenario_id}: {str(ai_error)}")
+                response_text = ""
             
         # Enhanced fallback logic - use different openings for each scenario
         if not response_text or response_text.strip() == "" or len(response_text.strip()) < 10:
-            # Scenario-specific fallback messages to ensure variety
-            fallback_messages = {
-                # Stufe 1: Grundlagen
-                1: f"Puh, {request.user_name}, ich bin heute wirklich am Ende. Die Arbeit wird immer mehr und ich weiß nicht, wie ich das alles schaffen soll. Ich fühle mich so erschöpft...",
-                2: f"{request.user_name}, ich mache mir wirklich Sorgen wegen der Jobsuche. Was ist, wenn ich nichts Passendes finde? Die Ungewissheit macht mir richtig Angst.",
-                3: f"Ach {request.user_name}, Sarah und ich hatten wieder so eine Diskussion. Es ist echt kompliziert zwischen uns geworden und ich weiß nicht mehr, was ich machen soll.",
-                4: f"Mir geht's schon gut, {request.user_name}... nur ein bisschen müde heute. *seufzt und wirkt angespannt* Wirklich, es ist nichts Besonderes.",
-                5: f"{request.user_name}, ich hab die Beförderung nicht bekommen. Sie haben jemand anderen genommen. Ich bin so enttäuscht... ich hatte mir so viele Hoffnungen gemacht.",
-                
-                # Stufe 2: Konfliktlösung
-                6: f"{request.user_name}, du verstehst einfach nicht was ich brauche! Ich möchte endlich mal in die Berge, Ruhe haben. Warum muss es denn immer Strand sein?",
-                7: f"Ich fühle mich, als würde ich alles alleine machen, {request.user_name}. Deine Kritik von gestern hat mich richtig getroffen. Siehst du denn nicht, wie viel ich tue?",
-                8: f"Das ist meine Familie, {request.user_name}! Ich kann doch nicht nein sagen, wenn sie Hilfe brauchen. Warum verstehst du das nicht?",
-                
-                # Stufe 3: Emotionale Intelligenz
-                9: f"Ich kann das einfach nicht mehr ertragen, {request.user_name}. Du findest mich bestimmt nicht mehr attraktiv... ich erkenne mich selbst nicht mehr.",
-                10: f"{request.user_name}, diese Ängste lassen mich nicht schlafen. Ich schäme mich so dafür, aber ich kann sie einfach nicht abstellen. Bin ich schwach?",
-                11: f"Ich weiß, ich ziehe mich zurück, {request.user_name}. Nach dem was passiert ist, fällt es mir so schwer, dir zu vertrauen. Aber ich vermisse unsere Nähe so sehr.",
-                
-                # Stufe 4: Vertrauen & Intimität  
-                12: f"{request.user_name}, ich fühle mich so einsam in unserer Beziehung. Wir reden zwar, aber ich spüre keine echte Verbindung mehr. Liebst du mich noch?",
-                13: f"Ich will dir vertrauen, {request.user_name}, ich will es wirklich. Aber nach dem was passiert ist, habe ich solche Angst vor erneuter Enttäuschung.",
-                14: f"Manchmal frage ich mich, {request.user_name}, ob du überhaupt noch siehst, was ich alles für uns tue. Ich fühle mich so unsichtbar und unwichtig.",
-                
-                # Stufe 5: Lebenskrisen
-                15: f"{request.user_name}, ich frage mich, ob ich die richtigen Entscheidungen in meinem Leben getroffen habe. Ist das alles hier wirklich das, was ich wollte?",
-                16: f"Seit dem Verlust fühle ich mich wie betäubt, {request.user_name}. Die Trauer überwältigt mich und ich weiß nicht, wie ich damit umgehen soll.",
-                17: f"{request.user_name}, diese ganze Veränderung macht mir Angst. Was ist, wenn wir das nicht schaffen? Was ist, wenn alles schief geht?"
-            }
-            
-            response_text = fallback_messages.get(request.scenario_id, scenario['partner_opening'])
+            response_text = render_names(
+                SCENARIO_FALLBACK_OPENINGS.get(request.scenario_id, scenario['partner_opening']),
+                request.user_name,
+                request.partner_name
+            )
             print(f"🔄 TRAINING: Using enhanced fallback for scenario {request.scenario_id}: {response_text[:50]}...")
         
         print(f"✅ TRAINING: Final message for scenario {request.scenario_id}: {response_text[:100]}...")
         
-        # Store scenario session in database
+        # Store scenario session header and its opening message
         scenario_session = {
             "session_id": session_id,
             "user_id": request.user_id,
@@ -410,18 +492,17 @@ Current emotional state: You are feeling the stress/frustration described in the
             "scenario_title": scenario['title'],
             "user_name": request.user_name,
             "partner_name": request.partner_name,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "messages": [
-                {
-                    "speaker": request.partner_name,
-                    "message": response_text,
-                    "timestamp": datetime.now(timezone.utc).isoformat()
-                }
-            ],
+            "created_at": datetime.now(timezone.utc),
             "status": "active"
         }
         
-        await db.training_sessions.insert_one(scenario_session)
+        await training_messages.create(scenario_session, [
+            {
+                "speaker": request.partner_name,
+                "message": response_text,
+                "timestamp": datetime.now(timezone.utc)
+            }
+        ])
         
         return {
             "session_id": session_id,
@@ -435,78 +516,270 @@ Current emotional state: You are feeling the stress/frustration described in the
             "partner_name": request.partner_name
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error starting training scenario: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error starting scenario: {str(e)}")
 
-@api_router.post("/training/respond")
-async def respond_to_scenario(request: dict):
-    """Send user response and get AI partner's reply"""
+# Served when the partner's reply misses the training_respond deadline
+TRAINING_RESPOND_FALLBACK = "{user_name}, ich muss kurz sacken lassen, was du gerade gesagt hast... Es ist im Moment einfach alles ein bisschen viel für mich."
+
+def build_partner_system_message(session: dict) -> str:
+    """System prompt for continuing a training conversation as the partner"""
+    return PROMPTS["training_partner_continue"].render(
+        partner_name=session['partner_name'],
+        user_name=session['user_name']
+    )
+
+async def load_training_turn(request: dict):
+    """Validate a training turn request and load its session and unsummarized messages"""
+    session_id = request.get('session_id')
+    user_response = request.get('user_response')
+    
+    if not session_id or not user_response:
+        raise HTTPException(status_code=400, detail="session_id and user_response required")
+    
+    # Get session from database
+    session = await db.training_sessions.find_one({"session_id": session_id})
+    if not session:
+        raise HTTPException(status_code=404, detail="Training session not found")
+    
+    # Only turns not yet folded into the summary are needed for the prompt
+    messages = await training_messages.load(session, start=session.get('context_summarized_count', 0))
+    return session, messages, user_response
+
+async def store_training_turn(session: dict, user_response: str, partner_response: str):
+    """Append the user's response and the partner's reply to the session"""
+    new_messages = [
+        {
+            "speaker": session['user_name'],
+            "message": user_response,
+            "timestamp": datetime.now(timezone.utc)
+        },
+        {
+            "speaker": session['partner_name'],
+            "message": partner_response, 
+            "timestamp": datetime.now(timezone.utc)
+        }
+    ]
+    
+    await training_messages.append(session, new_messages)
+
+def build_training_turn_prompt(session: dict, messages: List[dict], user_response: str) -> str:
+    """Conversation so far (summary + newest turns) followed by the new response
+
+    messages are the turns after the summarized ones, as load_training_turn returns them.
+    """
+    return training_context.build_prompt(
+        system_message=build_partner_system_message(session),
+        messages=messages,
+        summary=session.get('context_summary'),
+        summarized_count=0,
+        user_name=session['user_name'],
+        partner_name=session['partner_name'],
+        user_response=user_response
+    )
+
+async def refresh_training_summary(session_id: str):
+    """Fold older turns of a long session into its rolling summary"""
     try:
-        session_id = request.get('session_id')
-        user_response = request.get('user_response')
-        
-        if not session_id or not user_response:
-            raise HTTPException(status_code=400, detail="session_id and user_response required")
-        
-        # Get session from database
         session = await db.training_sessions.find_one({"session_id": session_id})
         if not session:
-            raise HTTPException(status_code=404, detail="Training session not found")
+            return
+        
+        summarized_count = session.get('context_summarized_count', 0)
+        unsummarized = await training_messages.load(session, start=summarized_count)
+        to_fold = training_context.messages_to_summarize(unsummarized, 0)
+        if not to_fold:
+            return
+        
+        summary = await llm_gateway.send_message(
+            "training_context_summary",
+            session_id=f"context_summary_{session_id}",
+            system_message="You maintain concise running summaries of empathy training conversations.",
+            text=ConversationContext.summary_prompt(session.get('context_summary'), to_fold),
+            user_tier="system"
+        )
         
-        # Reinitialize chat with session history
-        partner_system_message = f"""Continue as {session['partner_name']} in this empathy training conversation. 
+        # Only apply if no other refresh moved the summary on in the meantime
+        await db.training_sessions.update_one(
+            {"session_id": session_id, "context_summarized_count": session.get('context_summarized_count')},
+            {"$set": {
+                "context_summary": summary,
+                "context_summarized_count": summarized_count + len(to_fold)
+            }}
+        )
+    except Exception as e:
+        logging.warning(f"Training context summary failed for {session_id}: {str(e)}")
 
-IMPORTANT: You are the one experiencing problems/stress and need empathy from {session['user_name']}. 
+def sse_event(event: str, data) -> str:
+    """Format a single Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
 
-Your role:
-- Continue expressing YOUR feelings and concerns as {session['partner_name']}
-- React authentically to {session['user_name']}'s responses
-- You are still dealing with your emotional situation 
-- Don't suddenly become empathetic - you still need support
-- Show whether {session['user_name']}'s response helped you feel understood or not
-- Keep responses natural and conversational (2-3 sentences)
-- Stay in character as someone who needs empathy, not someone giving it
-"""
-        
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=session_id,
-            system_message=partner_system_message
-        ).with_model("openai", "gpt-4o")
-        
-        # Send user's response to AI
-        user_message = UserMessage(text=user_response)
-        partner_response = await chat.send_message(user_message)
+async def single_chunk(text: str):
+    """Stand-in stream that yields a fallback text in one piece"""
+    yield text
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"  # Disable proxy buffering so tokens reach the client immediately
+}
+
+@api_router.post("/training/respond")
+async def respond_to_scenario(request: dict, background_tasks: BackgroundTasks):
+    """Send user response and get AI partner's reply"""
+    try:
+        session, messages, user_response = await load_training_turn(request)
+        
+        async def keep_late_reply(late_response: str):
+            # Keep the real reply next to the fallback that stood in for it. One
+            # document per reply, so the session header does not grow with them
+            await write_behind.insert("training_late_responses", {
+                "session_id": session['session_id'],
+                "user_response": user_response,
+                "partner_response": late_response,
+                "timestamp": datetime.now(timezone.utc)
+            })
+        
+        # Send user's response to AI, bounded by the endpoint's latency budget
+        partner_response = await llm_gateway.send_with_deadline(
+            "training_respond",
+            session_id=session['session_id'],
+            system_message=build_partner_system_message(session),
+            text=build_training_turn_prompt(session, messages, user_response),
+            on_late_result=keep_late_reply,
+            user_tier=await resolve_user_tier(session.get('user_id'))
+        )
+        if not partner_response:
+            partner_response = render_names(TRAINING_RESPOND_FALLBACK, session['user_name'], session['partner_name'])
         
         # Update session with new messages
-        new_messages = [
-            {
-                "speaker": session['user_name'],
-                "message": user_response,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            },
-            {
-                "speaker": session['partner_name'],
-                "message": partner_response, 
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-        ]
-        
-        await db.training_sessions.update_one(
-            {"session_id": session_id},
-            {"$push": {"messages": {"$each": new_messages}}}
-        )
+        await store_training_turn(session, user_response, partner_response)
+        background_tasks.add_task(refresh_training_summary, session['session_id'])
         
         return {
             "partner_response": partner_response,
             "session_continues": True
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error in training response: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing response: {str(e)}")
 
+@api_router.post("/training/respond/stream")
+async def respond_to_scenario_stream(request: dict, background_tasks: BackgroundTasks):
+    """Stream the AI partner's reply as Server-Sent Events"""
+    session, messages, user_response = await load_training_turn(request)
+    
+    # Admission happens up front so an overload is still a plain 429
+    try:
+        stream = await llm_gateway.stream_message(
+            "training_respond",
+            session_id=session['session_id'],
+            system_message=build_partner_system_message(session),
+            text=build_training_turn_prompt(session, messages, user_response),
+            user_tier=await resolve_user_tier(session.get('user_id'))
+        )
+    except CircuitOpenError:
+        stream = single_chunk(render_names(TRAINING_RESPOND_FALLBACK, session['user_name'], session['partner_name']))
+    
+    async def event_stream():
+        chunks = []
+        try:
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield sse_event("token", {"text": chunk})
+            
+            partner_response = "".join(chunks)
+            await store_training_turn(session, user_response, partner_response)
+            background_tasks.add_task(refresh_training_summary, session['session_id'])
+            
+            yield sse_event("done", {
+                "partner_response": partner_response,
+                "session_continues": True
+            })
+        except Exception as e:
+            logging.error(f"Error in streamed training response: {str(e)}")
+            yield sse_event("error", {"detail": f"Error processing response: {str(e)}"})
+        finally:
+            # Frees the admission slot even if the client left before streaming began
+            await stream.aclose()
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS, background=background_tasks)
+
+# Canned feedback used when the evaluation cannot be parsed into EmpathyFeedback
+FALLBACK_EMPATHY_FEEDBACK = {
+    "empathy_score": 7.5,
+    "improvements": [
+        "Verwenden Sie mehr 'Ich verstehe'-Aussagen",
+        "Stellen Sie offene Fragen um mehr zu erfahren", 
+        "Bestätigen Sie die Gefühle Ihres Partners"
+    ],
+    "alternative_responses": [
+        "Das hört sich wirklich frustrierend an. Magst du mir mehr davon erzählen?",
+        "Ich kann verstehen, dass dich das belastet. Du bist nicht allein damit."
+    ],
+    "emotional_awareness": "Sie zeigen gutes Verständnis für die Situation. Arbeiten Sie daran, die Emotionen noch direkter anzusprechen.",
+    "next_level_tip": "Versuchen Sie, die spezifischen Gefühle zu benennen, die Sie bei Ihrem Partner wahrnehmen."
+}
+
+# Shown when the AI evaluation is unavailable altogether
+FALLBACK_EMPATHY_FEEDBACK_TEXT = "Die ausführliche KI-Bewertung ist gerade nicht verfügbar. Hier sind allgemeine Hinweise zu Ihrer Antwort."
+
+EMPATHY_FEEDBACK_SCHEMA = json.dumps(EmpathyFeedback.model_json_schema(), ensure_ascii=False)
+EMPATHY_FEEDBACK_BATCH_SCHEMA = json.dumps(EmpathyFeedbackBatch.model_json_schema(), ensure_ascii=False)
+EVALUATION_PROMPT = PROMPTS["training_evaluation"].bind(schema=EMPATHY_FEEDBACK_SCHEMA)
+BATCH_EVALUATION_PROMPT = PROMPTS["training_evaluation_batch"].bind(schema=EMPATHY_FEEDBACK_BATCH_SCHEMA)
+
+# Batch evaluation packs responses into one LLM call up to this many tokens,
+# counting each response plus the feedback it will produce
+EVALUATION_BATCH_TOKEN_BUDGET = int(os.environ.get('EVALUATION_BATCH_TOKEN_BUDGET', 6000))
+EVALUATION_FEEDBACK_TOKENS = int(os.environ.get('EVALUATION_FEEDBACK_TOKENS', 400))
+# Chunks of one batch request evaluated at the same time
+EVALUATION_BATCH_CONCURRENCY = int(os.environ.get('EVALUATION_BATCH_CONCURRENCY', 2))
+
+def parse_structured_response(text: str, model_cls):
+    """Parse an LLM reply into model_cls, repairing common formatting issues
+
+    Tries the raw text, then the body of a ```json fence, then the outermost
+    {...} span. Only the parse is retried - the LLM is never called again.
+    """
+    candidates = [text.strip()]
+    if "```" in text:
+        fenced = text.split("```")[1]
+        candidates.append(fenced[4:] if fenced.startswith("json") else fenced)
+    if "{" in text and "}" in text:
+        candidates.append(text[text.index("{"):text.rindex("}") + 1])
+    
+    last_error = None
+    for candidate in candidates:
+        try:
+            return model_cls(**json.loads(candidate))
+        except (ValueError, TypeError) as parse_error:
+            last_error = parse_error
+    raise ValueError(f"Could not parse {model_cls.__name__}: {last_error}")
+
+def build_evaluation_prompt(scenario: dict, user_response: str) -> str:
+    """Prompt asking for an EmpathyFeedback JSON object"""
+    return EVALUATION_PROMPT.render(
+        title=scenario['title'],
+        context=scenario['context'],
+        learning_goals=', '.join(scenario['learning_goals']),
+        user_response=user_response
+    )
+
+def build_batch_evaluation_prompt(scenario: dict, responses: List[tuple]) -> str:
+    """Prompt asking for one EmpathyFeedback per (index, response) pair"""
+    return BATCH_EVALUATION_PROMPT.render(
+        title=scenario['title'],
+        context=scenario['context'],
+        learning_goals=', '.join(scenario['learning_goals']),
+        numbered_responses="\n".join(f'[{index}] "{response}"' for index, response in responses)
+    )
+
 @api_router.post("/training/evaluate", response_model=EmpathyFeedback)
 async def evaluate_empathy_response(request: EmpathyEvaluation):
     """AI-powered evaluation of user's empathic response"""
@@ -527,52 +800,30 @@ async def evaluate_empathy_response(request: EmpathyEvaluation):
         # Initialize AI for evaluation
         evaluation_session = f"eval_{request.user_id}_{request.scenario_id}_{datetime.now().isoformat()}"
         
-        evaluation_prompt = f"""You are an expert empathy coach evaluating a response in a couples communication training scenario.
-
-SCENARIO: {scenario['title']}
-CONTEXT: {scenario['context']}
-LEARNING GOALS: {', '.join(scenario['learning_goals'])}
-
-USER'S RESPONSE: "{request.user_response}"
-
-Please evaluate this response on empathy and provide:
-1. Empathy score (0-10, where 10 is perfectly empathetic)
-2. Detailed feedback on what was good and what could improve
-3. Specific improvement suggestions (3-4 points)
-4. Alternative response examples (2-3 better ways to respond)
-5. Emotional awareness assessment
-6. One tip for reaching the next empathy level
-
-Be encouraging but honest. Focus on practical improvements."""
-
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=evaluation_session,
-            system_message="You are an expert empathy and communication coach."
-        ).with_model("openai", "gpt-4o")
-        
-        evaluation_message = UserMessage(text=evaluation_prompt)
-        evaluation_response = await chat.send_message(evaluation_message)
-        
-        # Parse AI response to extract structured feedback
-        # For now, we'll create a structured response based on the scenario
-        empathy_score = 7.5  # This would be extracted from AI response
+        try:
+            evaluation_response = await llm_gateway.send_message(
+                "training_evaluate",
+                session_id=evaluation_session,
+                system_message="You are an expert empathy and communication coach. You always answer with valid JSON.",
+                text=build_evaluation_prompt(scenario, request.user_response),
+                user_tier=await resolve_user_tier(request.user_id)
+            )
+        except CircuitOpenError:
+            evaluation_response = ""
         
-        feedback_data = {
-            "empathy_score": empathy_score,
-            "feedback": evaluation_response[:300] + "..." if len(evaluation_response) > 300 else evaluation_response,
-            "improvements": [
-                "Verwenden Sie mehr 'Ich verstehe'-Aussagen",
-                "Stellen Sie offene Fragen um mehr zu erfahren", 
-                "Bestätigen Sie die Gefühle Ihres Partners"
-            ],
-            "alternative_responses": [
-                "Das hört sich wirklich frustrierend an. Magst du mir mehr davon erzählen?",
-                "Ich kann verstehen, dass dich das belastet. Du bist nicht allein damit."
-            ],
-            "emotional_awareness": "Sie zeigen gutes Verständnis für die Situation. Arbeiten Sie daran, die Emotionen noch direkter anzusprechen.",
-            "next_level_tip": "Versuchen Sie, die spezifischen Gefühle zu benennen, die Sie bei Ihrem Partner wahrnehmen."
-        }
+        # One LLM call yields the full structured result
+        try:
+            if not evaluation_response:
+                feedback = EmpathyFeedback(feedback=FALLBACK_EMPATHY_FEEDBACK_TEXT, **FALLBACK_EMPATHY_FEEDBACK)
+            else:
+                feedback = parse_structured_response(evaluation_response, EmpathyFeedback)
+        except ValueError as parse_error:
+            logging.warning(f"Empathy evaluation was not valid JSON, using canned feedback: {str(parse_error)}")
+            feedback = EmpathyFeedback(
+                feedback=evaluation_response[:300] + "..." if len(evaluation_response) > 300 else evaluation_response,
+                **FALLBACK_EMPATHY_FEEDBACK
+            )
+        feedback_data = feedback.dict()
         
         # Store evaluation in database
         evaluation_record = {
@@ -581,17 +832,120 @@ Be encouraging but honest. Focus on practical improvements."""
             "user_response": request.user_response,
             "evaluation": feedback_data,
             "ai_full_response": evaluation_response,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         
         await db.training_evaluations.insert_one(evaluation_record)
         
-        return EmpathyFeedback(**feedback_data)
+        return feedback
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error evaluating empathy response: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error evaluating response: {str(e)}")
 
+async def evaluate_batch_chunk(scenario: dict, request: BatchEmpathyEvaluation, indices: List[int], user_tier: str):
+    """Evaluate one chunk of a batch in a single LLM call
+
+    Returns ({index: EmpathyFeedback}, raw_response); indices the model left
+    out, or an unparseable reply, simply have no entry. A failed call raises,
+    so overload (429) and open circuits (503) reach the client as a signal to
+    retry instead of being stored as canned feedback.
+    """
+    pairs = [(index, request.user_responses[index]) for index in indices]
+    response = await llm_gateway.send_message(
+        "training_evaluate_batch",
+        session_id=f"eval_batch_{request.user_id}_{request.scenario_id}_{uuid.uuid4()}",
+        system_message="You are an expert empathy and communication coach. You always answer with valid JSON.",
+        text=build_batch_evaluation_prompt(scenario, pairs),
+        user_tier=user_tier
+    )
+    
+    try:
+        parsed = parse_structured_response(response, EmpathyFeedbackBatch)
+    except ValueError as parse_error:
+        logging.warning(f"Batch evaluation was not valid JSON, using canned feedback: {str(parse_error)}")
+        return {}, response
+    
+    feedback_by_index = {
+        entry.index: EmpathyFeedback(**entry.dict(exclude={"index"}))
+        for entry in parsed.evaluations
+        if entry.index in indices
+    }
+    return feedback_by_index, response
+
+@api_router.post("/training/evaluate/batch")
+async def evaluate_empathy_responses_batch(request: BatchEmpathyEvaluation):
+    """Evaluate many responses to one scenario, packing them into as few LLM calls as the token budget allows"""
+    try:
+        scenario = TRAINING_SCENARIOS.get(request.scenario_id)
+        if not scenario:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+        
+        user_tier = await resolve_user_tier(request.user_id)
+        chunks = chunk_by_token_budget(request.user_responses, EVALUATION_BATCH_TOKEN_BUDGET, EVALUATION_FEEDBACK_TOKENS)
+        
+        # A few chunks at a time, so one large request does not fill the shared admission queue
+        chunk_slots = asyncio.Semaphore(EVALUATION_BATCH_CONCURRENCY)
+        
+        async def evaluate_chunk(chunk: List[int]):
+            async with chunk_slots:
+                return await evaluate_batch_chunk(scenario, request, chunk, user_tier)
+        
+        chunk_tasks = [asyncio.ensure_future(evaluate_chunk(chunk)) for chunk in chunks]
+        try:
+            chunk_results = await asyncio.gather(*chunk_tasks)
+        except Exception:
+            # Nothing is stored for a failed batch, so the remaining calls are wasted
+            for task in chunk_tasks:
+                task.cancel()
+            raise
+        
+        batch_id = str(uuid.uuid4())
+        created_at = datetime.now(timezone.utc)
+        items = []
+        evaluation_records = []
+        for chunk, (feedback_by_index, raw_response) in zip(chunks, chunk_results):
+            for index in chunk:
+                feedback = feedback_by_index.get(index)
+                item = BatchEvaluationItem(
+                    index=index,
+                    user_response=request.user_responses[index],
+                    feedback=feedback or EmpathyFeedback(feedback=FALLBACK_EMPATHY_FEEDBACK_TEXT, **FALLBACK_EMPATHY_FEEDBACK),
+                    fallback=feedback is None
+                )
+                items.append(item)
+                evaluation_records.append({
+                    "user_id": request.user_id,
+                    "scenario_id": request.scenario_id,
+                    "user_response": item.user_response,
+                    "evaluation": item.feedback.dict(),
+                    "ai_full_response": raw_response,
+                    "batch_id": batch_id,
+                    "fallback": item.fallback,
+                    "created_at": created_at
+                })
+        
+        # Store all evaluations in one round trip
+        await db.training_evaluations.insert_many(evaluation_records)
+        
+        return {
+            "batch_id": batch_id,
+            "scenario_id": request.scenario_id,
+            "evaluations": items,
+            "llm_calls": len(chunks),
+            "fallback_count": sum(1 for item in items if item.fallback)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error evaluating empathy responses in batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error evaluating responses: {str(e)}")
+
+TRAINING_SUMMARY_FALLBACK = "Gut gemacht! Sie haben sich Zeit genommen, empathisches Zuhören zu üben. Jede Übung stärkt Ihre Verbindung - bleiben Sie dran."
+
 @api_router.post("/training/end-scenario")
 async def end_training_scenario(request: dict):
     """End a training scenario and provide final summary"""
@@ -609,44 +963,48 @@ async def end_training_scenario(request: dict):
         # Update session status
         await db.training_sessions.update_one(
             {"session_id": session_id},
-            {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc).isoformat()}}
+            {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc)}}
         )
         
         # Generate final summary with AI
-        summary_prompt = f"""Provide a brief, encouraging summary for the completed empathy training session:
-
-SCENARIO: {session.get('scenario_title', 'Training')}
-TOTAL MESSAGES: {len(session.get('messages', []))}
-
-Give 2-3 sentences highlighting:
-1. What the user practiced well
-2. Key learning from this session  
-3. Encouragement for continued growth
-
-Keep it positive and motivating."""
+        summary_prompt = PROMPTS["training_summary"].render(
+            scenario_title=session.get('scenario_title', 'Training'),
+            message_count=training_messages.message_count(session)
+        )
 
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"summary_{session_id}",
-            system_message="You are an encouraging empathy coach providing session summaries."
-        ).with_model("openai", "gpt-4o")
-        
-        summary_message = UserMessage(text=summary_prompt)
-        summary_response = await chat.send_message(summary_message)
+        try:
+            summary_response = await llm_gateway.send_message(
+                "training_summary",
+                session_id=f"summary_{session_id}",
+                system_message="You are an encouraging empathy coach providing session summaries.",
+                text=summary_prompt,
+                user_tier=await resolve_user_tier(session.get('user_id'))
+            )
+        except CircuitOpenError:
+            summary_response = TRAINING_SUMMARY_FALLBACK
         
         return {
             "session_completed": True,
             "summary": summary_response,
-            "messages_exchanged": len(session.get('messages', [])),
+            "messages_exchanged": training_messages.message_count(session),
             "scenario_title": session.get('scenario_title')
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error ending training scenario: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error ending scenario: {str(e)}")
 
 # AI Chat Configuration
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
+
+# Shared LLM gateway (pooled connections, per-endpoint model selection)
+llm_gateway = LlmGateway.from_env(
+    EMERGENT_LLM_KEY,
+    cache=LlmResponseCache.from_env(db.llm_response_cache),
+    usage=LlmUsageMetrics.from_env(db.llm_usage_daily)
+)
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
 
 # Email Configuration
@@ -680,10 +1038,17 @@ class User(BaseModel):
     subscription_status: str = "free"  # free, active, cancelled, expired
     subscription_type: Optional[str] = None  # monthly, yearly
     subscription_expires_at: Optional[datetime] = None
-    password_reset_token: Optional[str] = None  # For password reset
-    password_reset_expires: Optional[datetime] = None  # Token expiration
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class Entitlement(BaseModel):
+    """Subscription fields needed for feature gating, without the avatar"""
+    user_id: str
+    subscription_status: str = "free"
+    subscription_expires_at: Optional[datetime] = None
+
+# Only the fields check_premium_access reads
+ENTITLEMENT_PROJECTION = {"_id": 0, "subscription_status": 1, "subscription_expires_at": 1}
+
 class UserCreate(BaseModel):
     name: str
     email: str
@@ -737,6 +1102,16 @@ class UserProgress(BaseModel):
     score: Optional[int] = None
     completed_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class UserProgressBatch(BaseModel):
+    # Items are validated one by one so a bad record does not reject the batch
+    records: List[dict] = Field(..., min_length=1, max_length=500)
+
+class ProgressBatchItem(BaseModel):
+    index: int
+    id: Optional[str] = None
+    status: str  # created, duplicate, invalid, failed
+    error: Optional[str] = None
+
 class ScenarioResponse(BaseModel):
     scenario_id: str
     user_response: str
@@ -832,12 +1207,12 @@ class ContactFormRequest(BaseModel):
     message: str
 
 # Helper functions
+# Page size for user history endpoints when the client does not pass limit
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', 100))
+
 def prepare_for_mongo(data):
-    if isinstance(data, dict):
-        for key, value in data.items():
-            if isinstance(value, datetime):
-                data[key] = value.isoformat()
-    return data
+    """Datetimes are stored as native BSON dates (aware UTC)"""
+    return to_mongo(data)
 
 # Training Stages Data
 TRAINING_STAGES_DATA = [
@@ -1083,7 +1458,10 @@ TRAINING_STAGES_DATA = [
 async def create_user(user_data: UserCreate):
     user = User(**user_data.dict())
     user_dict = prepare_for_mongo(user.dict())
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     return user
 
 @api_router.get("/users/{user_id}", response_model=User)
@@ -1106,10 +1484,9 @@ async def get_training_stage(stage_number: int, user_id: Optional[str] = None):
     # Check if user has premium access
     has_premium = False
     if user_id:
-        user = await db.users.find_one({"id": user_id})
-        if user:
-            user_obj = User(**user)
-            has_premium = check_premium_access(user_obj)
+        entitlement = await get_entitlement(user_id)
+        if entitlement:
+            has_premium = check_premium_access(entitlement)
     
     # Limit scenarios for free users
     if not has_premium:
@@ -1129,147 +1506,135 @@ async def get_ai_feedback(request: AIFeedbackRequest):
     """Get AI feedback for user's response to a scenario"""
     try:
         # Initialize AI chat
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"feedback_{uuid.uuid4()}",
-            system_message=f"""Du bist ein Experte für Empathie und Beziehungskommunikation. 
-            Du hilfst Paaren dabei, bessere Kommunikation zu lernen.
-            
-            Analysiere die Antwort des Nutzers auf das Szenario und gib konstruktives Feedback:
-            1. Was war gut an der Antwort?
-            2. Was könnte verbessert werden?
-            3. Konkrete Verbesserungsvorschläge
-            4. Bewertung von 1-10 (10 = perfekt empathisch)
-            
-            Sei unterstützend und ermutigend, aber ehrlich. Fokussiere auf Stufe {request.stage_number} des Trainings."""
-        ).with_model("openai", "gpt-4o")
+        chat_session_id = f"feedback_{uuid.uuid4()}"
+        system_message = PROMPTS["ai_feedback"].render(stage_number=request.stage_number)
         
         # Create user message
-        user_message = UserMessage(
-            text=f"""Szenario: {request.scenario_text}
+        user_prompt = f"""Szenario: {request.scenario_text}
             
             User-Antwort: {request.user_response}
             
             Bitte analysiere diese Antwort und gib Feedback."""
-        )
         
         # Get AI response
-        response = await chat.send_message(user_message)
+        response = await llm_gateway.send_message(
+            "ai_feedback",
+            session_id=chat_session_id,
+            system_message=system_message,
+            text=user_prompt
+        )
         
         return {"feedback": response, "success": True}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI feedback failed: {str(e)}")
 
 @api_router.post("/progress", response_model=UserProgress)
 async def save_user_progress(progress_data: UserProgress):
+    """Store one progress record; re-sending a record with the same id returns the stored one"""
     progress_dict = prepare_for_mongo(progress_data.dict())
-    await db.progress.insert_one(progress_dict)
+    try:
+        await db.progress.insert_one(progress_dict)
+    except DuplicateKeyError:
+        stored = await db.progress.find_one({"id": progress_data.id}, {"_id": 0})
+        if stored is None or stored.get("user_id") != progress_data.user_id:
+            raise HTTPException(status_code=409, detail="Progress id already in use")
+        return UserProgress(**stored)
     return progress_data
 
-@api_router.get("/progress/{user_id}")
-async def get_user_progress(user_id: str):
-    progress_list = await db.progress.find({"user_id": user_id}).to_list(length=None)
-    return [UserProgress(**p) for p in progress_list]
+@api_router.post("/progress/batch")
+async def save_user_progress_batch(batch: UserProgressBatch):
+    """Store many progress records in one unordered insert and report a status per record
 
-@api_router.post("/analyze-dialog")
-async def analyze_dialog(request: DialogAnalysisRequest):
-    """Analyze couple's dialog patterns and provide real-time suggestions - requires PRO subscription"""
+    Records keep their client-side id, so re-sending a batch after a timeout
+    reports the already stored records as duplicates instead of storing them twice.
+    """
     try:
-        # Check PRO access for dialog coaching
-        if request.user_id:
-            user = await db.users.find_one({"id": request.user_id})
-            if user:
-                user_obj = User(**user)
-                if not check_feature_access(user_obj, "dialog_coaching"):
-                    raise HTTPException(status_code=403, detail="Dialog-Coaching requires PRO subscription")
-        else:
-            # If no user_id provided, assume non-PRO access
-            raise HTTPException(status_code=403, detail="Dialog-Coaching requires PRO subscription")
+        items = [None] * len(batch.records)
+        documents = []
+        positions = []
+        for index, record in enumerate(batch.records):
+            try:
+                progress = UserProgress(**record)
+            except ValueError as validation_error:
+                items[index] = ProgressBatchItem(index=index, id=record.get("id"), status="invalid", error=str(validation_error))
+                continue
+            items[index] = ProgressBatchItem(index=index, id=progress.id, status="created")
+            documents.append(prepare_for_mongo(progress.dict()))
+            positions.append(index)
+        
+        if documents:
+            try:
+                await db.progress.insert_many(documents, ordered=False)
+            except BulkWriteError as bulk_error:
+                # Unordered: every other document was still written
+                for write_error in bulk_error.details.get("writeErrors", []):
+                    item = items[positions[write_error["index"]]]
+                    item.status = "duplicate" if write_error.get("code") == 11000 else "failed"
+                    item.error = None if item.status == "duplicate" else write_error.get("errmsg")
         
-        # Format the dialog for AI analysis
-        dialog_text = "\n".join([
-            f"{msg['speaker']}: {msg['message']}" 
-            for msg in request.dialog_messages
-        ])
-        
-        # Initialize AI chat for dialog analysis
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"dialog_{uuid.uuid4()}",
-            system_message=f"""Du bist ein hochspezialisierter Paartherapeut und Dialog-Coach mit jahrzehntelanger Erfahrung in Kommunikationsanalyse.
-
-Analysiere das Gespräch zwischen {request.partner1_name} und {request.partner2_name} mit größter Detailtiefe und gib strukturierte, praktische Hilfestellungen.
-
-WICHTIG: Antworte im folgenden JSON-Format für bessere Strukturierung:
-
-{{
-  "communication_scores": {{
-    "overall_score": 7.5,
-    "empathy_level": 6.8,
-    "conflict_potential": 4.2,
-    "emotional_safety": 8.1
-  }},
-  "detailed_analysis": {{
-    "communication_patterns": [
-      "Detaillierte Beschreibung der Gesprächsmuster...",
-      "Reaktionszyklen und Trigger-Punkte..."
-    ],
-    "emotional_dynamics": [
-      "Wie Emotionen zwischen den Partnern fließen...",
-      "Unausgesprochene Gefühle und Bedürfnisse..."
-    ]
-  }},
-  "specific_improvements": [
-    {{
-      "category": "Aktives Zuhören",
-      "problem": "Konkrete Beschreibung des Problems",
-      "solution": "Detaillierte Schritt-für-Schritt Anleitung",
-      "example": "Praktisches Beispiel zur Umsetzung"
-    }}
-  ],
-  "alternative_formulations": [
-    {{
-      "original_statement": "Exakte ursprüngliche Aussage",
-      "speaker": "{request.partner1_name} oder {request.partner2_name}",
-      "improved_version": "Verbesserte empathische Alternative", 
-      "why_better": "Detaillierte Erklärung warum diese Version besser ist",
-      "emotional_impact": "Welche emotionale Wirkung die neue Formulierung hat"
-    }}
-  ],
-  "strengths": [
-    {{
-      "aspect": "Was gut funktioniert",
-      "description": "Detaillierte Erklärung",
-      "how_to_build_on": "Wie man darauf aufbauen kann"
-    }}
-  ],
-  "next_steps": [
-    {{
-      "timeframe": "Sofort/Diese Woche/Längerfristig",
-      "action": "Konkrete Handlung",
-      "goal": "Was damit erreicht werden soll"
-    }}
-  ]
-}}
-
-Analysiere mit Fokus auf:
-- Nonverbale Kommunikation und Subtext
-- Empathische Reaktionsmöglichkeiten
-- Präventive Deeskalationsstrategien
-- Aufbau von emotionaler Sicherheit
-- Verstärkung positiver Kommunikationsmuster"""
-        ).with_model("openai", "gpt-4o")
-        
-        # Create user message with dialog
-        context_info = ""
-        if hasattr(request, 'scenario_context') and request.scenario_context:
-            context_info = f"Kontext/Situation: {request.scenario_context}\n"
-        if hasattr(request, 'relationship_context') and request.relationship_context:
-            context_info += f"Beziehungskontext: {request.relationship_context}\n"
-        
-        user_message = UserMessage(
-            text=f"""Analysiere dieses Gespräch zwischen {request.partner1_name} und {request.partner2_name}:
+        return {
+            "items": items,
+            "created": sum(1 for item in items if item.status == "created"),
+            "failed": sum(1 for item in items if item.status not in ("created", "duplicate"))
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Progress batch failed: {str(e)}")
+
+@api_router.get("/progress/{user_id}")
+async def get_user_progress(
+    user_id: str,
+    response: Response,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """One page of a user's progress, oldest first; the next page's cursor is in X-Next-Cursor"""
+    projection = parse_fields(fields, UserProgress.model_fields)
+    progress_list, next_cursor = await fetch_page(history_db.progress, {"user_id": user_id}, limit, cursor, projection=projection)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if projection:
+        return progress_list
+    return [UserProgress(**p) for p in progress_list]
+
+async def ensure_dialog_coaching_access(user_id: Optional[str]):
+    """Raise 403 unless the user has PRO access to dialog coaching"""
+    if user_id:
+        entitlement = await get_entitlement(user_id)
+        if entitlement:
+            if not check_feature_access(entitlement, "dialog_coaching"):
+                raise HTTPException(status_code=403, detail="Dialog-Coaching requires PRO subscription")
+    else:
+        # If no user_id provided, assume non-PRO access
+        raise HTTPException(status_code=403, detail="Dialog-Coaching requires PRO subscription")
+
+def build_dialog_analysis_prompts(request: DialogAnalysisRequest):
+    """Build the (system_message, user_prompt) pair for dialog analysis"""
+    # Format the dialog for AI analysis
+    dialog_text = "\n".join([
+        f"{msg['speaker']}: {msg['message']}" 
+        for msg in request.dialog_messages
+    ])
+    
+    system_message = PROMPTS["analyze_dialog"].render(
+        partner1_name=request.partner1_name,
+        partner2_name=request.partner2_name
+    )
+    
+    # Create user message with dialog
+    context_info = ""
+    if hasattr(request, 'scenario_context') and request.scenario_context:
+        context_info = f"Kontext/Situation: {request.scenario_context}\n"
+    if hasattr(request, 'relationship_context') and request.relationship_context:
+        context_info += f"Beziehungskontext: {request.relationship_context}\n"
+    
+    user_prompt = f"""Analysiere dieses Gespräch zwischen {request.partner1_name} und {request.partner2_name}:
 
 {context_info}
 
@@ -1283,23 +1648,75 @@ Fokussiere besonders auf:
 2. ALTERNATIVE FORMULIERUNGEN für jede kritische Aussage mit Erklärung warum diese besser sind
 3. EMOTIONALE DYNAMIKEN und unausgesprochene Bedürfnisse
 4. PRAKTISCHE SOFORT-TIPPS für beide Partner"""
-        )
+    
+    return system_message, user_prompt
+
+def parse_dialog_analysis(response: str) -> dict:
+    """Parse the analysis JSON, falling back to structured text"""
+    try:
+        analysis_json = json.loads(response)
+        return {"analysis": analysis_json, "success": True, "format": "json"}
+    except (json.JSONDecodeError, ValueError):
+        # If JSON parsing fails, return structured text
+        return {"analysis": {"detailed_text": response}, "success": True, "format": "text"}
+
+@api_router.post("/analyze-dialog")
+async def analyze_dialog(request: DialogAnalysisRequest):
+    """Analyze couple's dialog patterns and provide real-time suggestions - requires PRO subscription"""
+    try:
+        # Check PRO access for dialog coaching
+        await ensure_dialog_coaching_access(request.user_id)
+        
+        system_message, user_prompt = build_dialog_analysis_prompts(request)
         
         # Get AI response
-        response = await chat.send_message(user_message)
+        response = await llm_gateway.send_message(
+            "analyze_dialog",
+            session_id=f"dialog_{uuid.uuid4()}",
+            system_message=system_message,
+            text=user_prompt,
+            user_tier="pro"
+        )
         
-        # Try to parse JSON response, fallback to structured text if needed
-        try:
-            import json
-            analysis_json = json.loads(response)
-            return {"analysis": analysis_json, "success": True, "format": "json"}
-        except (json.JSONDecodeError, ValueError):
-            # If JSON parsing fails, return structured text
-            return {"analysis": {"detailed_text": response}, "success": True, "format": "text"}
+        return parse_dialog_analysis(response)
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Dialog analysis failed: {str(e)}")
 
+@api_router.post("/analyze-dialog/stream")
+async def analyze_dialog_stream(request: DialogAnalysisRequest):
+    """Stream the dialog analysis as Server-Sent Events - requires PRO subscription"""
+    await ensure_dialog_coaching_access(request.user_id)
+    
+    system_message, user_prompt = build_dialog_analysis_prompts(request)
+    
+    # Admission happens up front so an overload is still a plain 429
+    stream = await llm_gateway.stream_message(
+        "analyze_dialog",
+        session_id=f"dialog_{uuid.uuid4()}",
+        system_message=system_message,
+        text=user_prompt,
+        user_tier="pro"
+    )
+    
+    async def event_stream():
+        chunks = []
+        try:
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield sse_event("token", {"text": chunk})
+            
+            yield sse_event("done", parse_dialog_analysis("".join(chunks)))
+        except Exception as e:
+            logging.error(f"Error in streamed dialog analysis: {str(e)}")
+            yield sse_event("error", {"detail": f"Dialog analysis failed: {str(e)}"})
+        finally:
+            await stream.aclose()
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @api_router.post("/dialog-session", response_model=DialogSession)
 async def save_dialog_session(session_data: DialogSession):
     """Save dialog session with analysis"""
@@ -1315,50 +1732,30 @@ async def generate_weekly_training_plan(request: WeeklyPlanRequest):
         current_week = request.week_number or ((datetime.now().isocalendar()[1]) % 52) + 1
         
         # Initialize AI chat for weekly plan generation
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"weekly_plan_{uuid.uuid4()}",
-            system_message=f"""Du bist ein Experte für Paartherapie, spezialisiert auf EFT (Emotionally Focused Therapy) und die Gottman-Methode. 
-            
-            Erstelle einen wissenschaftlich fundierten, spielerischen Wochentrainingsplan für das Paar {request.partner1_name} und {request.partner2_name}.
-            
-            Der Plan soll folgende Struktur haben:
-            
-            📅 WOCHE {current_week}: [Thema der Woche]
-            
-            🧠 WISSENSCHAFTLICHE BASIS:
-            - EFT oder Gottman Prinzip erklären
-            - Warum diese Übungen neurobiologisch wirken
-            
-            📋 TÄGLICHE ÜBUNGEN (7 Tage):
-            Tag 1-7: Jeweils eine konkrete, umsetzbare Übung pro Tag
-            
-            💫 PAAR-CHALLENGES (2-3 Challenges):
-            - Spielerische Aufgaben für beide Partner
-            - Messbare Ziele
-            
-            🤔 REFLEXIONSFRAGEN:
-            - 3-4 tiefere Fragen zur Woche
-            
-            📊 ERFOLGSMESSUNG:
-            - Konkrete Metriken
-            
-            Mache es spielerisch, motivierend und wissenschaftlich fundiert. Verwende Emojis und eine positive Sprache."""
-        ).with_model("openai", "gpt-4o")
+        chat_session_id = f"weekly_plan_{uuid.uuid4()}"
+        system_message = PROMPTS["weekly_plan"].render(
+            partner1_name=request.partner1_name,
+            partner2_name=request.partner2_name,
+            week_number=current_week
+        )
         
         # Create context message
         context = f"Woche {current_week} für {request.partner1_name} und {request.partner2_name}"
         if request.current_challenges:
             context += f". Aktuelle Herausforderungen: {request.current_challenges}"
         
-        user_message = UserMessage(
-            text=f"""Erstelle einen wissenschaftlich fundierten Wochentrainingsplan für {context}.
+        user_prompt = f"""Erstelle einen wissenschaftlich fundierten Wochentrainingsplan für {context}.
             
             Fokussiere auf EFT und Gottman-Prinzipien und mache es praktisch umsetzbar."""
-        )
         
         # Get AI response
-        response = await chat.send_message(user_message)
+        response = await llm_gateway.send_message(
+            "weekly_plan",
+            session_id=chat_session_id,
+            system_message=system_message,
+            text=user_prompt,
+            user_tier=await resolve_user_tier(request.user_id)
+        )
         
         # Parse the response into structured format (simplified for now)
         plan_data = {
@@ -1385,6 +1782,8 @@ async def generate_weekly_training_plan(request: WeeklyPlanRequest):
         
         return {"plan": response, "structured_data": plan_data, "success": True}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Weekly plan generation failed: {str(e)}")
 
@@ -1425,6 +1824,7 @@ async def set_user_pro_status(request: dict):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        await invalidate_entitlement(user_email)
         
         return {
             "success": True,
@@ -1437,6 +1837,16 @@ async def set_user_pro_status(request: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update user status: {str(e)}")
 
+@api_router.get("/metrics/db")
+async def get_db_metrics():
+    """MongoDB pool settings, checkout wait times, read routing, write-behind buffer and retention sweeps"""
+    return {**mongo_pool.stats(), "write_behind": write_behind.stats(), "retention": retention_sweeper.stats()}
+
+@api_router.get("/metrics/llm")
+async def get_llm_metrics():
+    """LLM gateway metrics (cache, admission control, coalescing, latency budgets, token/cost usage, opening pool)"""
+    return {**llm_gateway.metrics(), "opening_pool": opening_pool.stats(), "entitlements": entitlement_cache.stats()}
+
 @api_router.get("/gefuehlslexikon")
 async def get_gefuehlslexikon(user_id: Optional[str] = None):
     """Get emotions lexicon - limited for free users, full for PRO"""
@@ -1506,10 +1916,9 @@ async def get_gefuehlslexikon(user_id: Optional[str] = None):
         # Check user access level
         has_pro_access = False
         if user_id:
-            user = await db.users.find_one({"id": user_id})
-            if user:
-                user_obj = User(**user)
-                has_pro_access = check_feature_access(user_obj, "full_gefuehlslexikon")
+            entitlement = await get_entitlement(user_id)
+            if entitlement:
+                has_pro_access = check_feature_access(entitlement, "full_gefuehlslexikon")
         
         # Return limited or full lexicon based on subscription
         if has_pro_access:
@@ -1553,23 +1962,12 @@ async def create_community_case(request: CommunityCaseCreate):
             anonymized_messages.append(anonymized_msg)
         
         # Generate AI solution and analysis
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"community_case_{uuid.uuid4()}",
-            system_message="""Du bist ein Experte für Paarkommunikation. Analysiere diesen anonymisierten Dialog und erstelle:
-            
-            1. Eine prägnante Fallbeschreibung
-            2. Konkrete Lösungsvorschläge 
-            3. Kommunikationsmuster-Analyse
-            4. Schwierigkeitsgrad-Einschätzung
-            
-            Fokussiere auf lehrreiche Aspekte für andere Paare."""
-        ).with_model("openai", "gpt-4o")
+        chat_session_id = f"community_case_{uuid.uuid4()}"
+        system_message = PROMPTS["community_case"].render()
         
         dialog_text = "\n".join([f"{msg['speaker']}: {msg['message']}" for msg in anonymized_messages])
         
-        user_message = UserMessage(
-            text=f"""Analysiere diesen anonymisierten Paar-Dialog und erstelle einen Lösungsvorschlag:
+        user_prompt = f"""Analysiere diesen anonymisierten Paar-Dialog und erstelle einen Lösungsvorschlag:
 
 {dialog_text}
 
@@ -1578,9 +1976,14 @@ Erstelle:
 - 3-4 konkrete Lösungsansätze
 - Hauptkommunikationsmuster
 - Schwierigkeitsgrad (Einfach/Mittel/Schwer)"""
-        )
         
-        ai_response = await chat.send_message(user_message)
+        ai_response = await llm_gateway.send_message(
+            "community_case",
+            session_id=chat_session_id,
+            system_message=system_message,
+            text=user_prompt,
+            user_tier=await resolve_user_tier(dialog_session.get("user_id"))
+        )
         
         # Determine category based on content
         category = determine_category(dialog_text)
@@ -1606,6 +2009,8 @@ Erstelle:
         
         return {"success": True, "case_id": community_case.id, "message": "Community Case erfolgreich erstellt"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Community case creation failed: {str(e)}")
 
@@ -1615,10 +2020,9 @@ async def create_community_case_direct(request: CommunityCaseCreateDirect):
     try:
         # Check PRO access for creating own cases
         if request.user_id:
-            user = await db.users.find_one({"id": request.user_id})
-            if user:
-                user_obj = User(**user)
-                if not check_feature_access(user_obj, "own_cases"):
+            entitlement = await get_entitlement(request.user_id)
+            if entitlement:
+                if not check_feature_access(entitlement, "own_cases"):
                     raise HTTPException(status_code=403, detail="Eigene Cases erstellen requires PRO subscription")
         else:
             # If no user_id provided, assume non-PRO access
@@ -1635,23 +2039,12 @@ async def create_community_case_direct(request: CommunityCaseCreateDirect):
             anonymized_messages.append(anonymized_msg)
         
         # Generate AI solution and analysis
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"community_case_{uuid.uuid4()}",
-            system_message="""Du bist ein Experte für Paarkommunikation. Analysiere diesen anonymisierten Dialog und erstelle:
-            
-            1. Eine prägnante Fallbeschreibung
-            2. Konkrete Lösungsvorschläge 
-            3. Kommunikationsmuster-Analyse
-            4. Schwierigkeitsgrad-Einschätzung
-            
-            Fokussiere auf lehrreiche Aspekte für andere Paare."""
-        ).with_model("openai", "gpt-4o")
+        chat_session_id = f"community_case_{uuid.uuid4()}"
+        system_message = PROMPTS["community_case"].render()
         
         dialog_text = "\n".join([f"{msg['speaker']}: {msg['message']}" for msg in anonymized_messages])
         
-        user_message = UserMessage(
-            text=f"""Analysiere diesen anonymisierten Paar-Dialog und erstelle einen Lösungsvorschlag:
+        user_prompt = f"""Analysiere diesen anonymisierten Paar-Dialog und erstelle einen Lösungsvorschlag:
 
 {dialog_text}
 
@@ -1660,9 +2053,14 @@ Erstelle:
 - 3-4 konkrete Lösungsansätze
 - Hauptkommunikationsmuster
 - Schwierigkeitsgrad (Einfach/Mittel/Schwer)"""
-        )
         
-        ai_response = await chat.send_message(user_message)
+        ai_response = await llm_gateway.send_message(
+            "community_case",
+            session_id=chat_session_id,
+            system_message=system_message,
+            text=user_prompt,
+            user_tier="pro"
+        )
         
         # Determine category based on content
         category = determine_category(dialog_text)
@@ -1688,25 +2086,44 @@ Erstelle:
         
         return {"success": True, "case_id": community_case.id, "message": "Community Case erfolgreich erstellt"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Community case creation failed: {str(e)}")
 
 @api_router.get("/community-cases")
-async def get_community_cases(user_id: Optional[str] = None):
-    """Get community cases - requires PRO subscription"""
+async def get_community_cases(
+    response: Response,
+    user_id: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Get community cases, most helpful first - requires PRO subscription
+
+    Pages are keyed on (helpful_count, _id). A case whose count changes while a
+    client pages can move across the cursor and be skipped or shown twice; the
+    counts move slowly, so that drift is accepted to keep the ranking.
+    """
     try:
         # Check PRO access for community cases
         if user_id:
-            user = await db.users.find_one({"id": user_id})
-            if user:
-                user_obj = User(**user)
-                if not check_feature_access(user_obj, "community_cases"):
+            entitlement = await get_entitlement(user_id)
+            if entitlement:
+                if not check_feature_access(entitlement, "community_cases"):
                     raise HTTPException(status_code=403, detail="Community Cases require PRO subscription")
         else:
             # If no user_id provided, assume non-PRO access
             raise HTTPException(status_code=403, detail="Community Cases require PRO subscription")
         
-        cases = await db.community_cases.find().sort("helpful_count", -1).to_list(length=50)
+        projection = parse_fields(fields, CommunityCase.model_fields)
+        cases, next_cursor = await fetch_page(
+            history_db.community_cases, {}, limit, cursor, sort=[("helpful_count", -1)], projection=projection
+        )
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        if projection:
+            return cases
         return [CommunityCase(**case) for case in cases]
     except HTTPException:
         raise
@@ -1715,15 +2132,25 @@ async def get_community_cases(user_id: Optional[str] = None):
 
 @api_router.post("/community-case/{case_id}/helpful")
 async def mark_case_helpful(case_id: str):
-    """Mark a community case as helpful"""
+    """Mark a community case as helpful
+
+    Clicks are merged by the write-behind buffer, so an unknown case_id is
+    only detected (and ignored) at flush time unless community_cases is
+    configured as immediate.
+    """
     try:
-        result = await db.community_cases.update_one(
-            {"id": case_id},
-            {"$inc": {"helpful_count": 1}}
-        )
-        if result.modified_count == 0:
-            raise HTTPException(status_code=404, detail="Case not found")
+        if write_behind.mode_for("community_cases") == IMMEDIATE:
+            result = await db.community_cases.update_one(
+                {"id": case_id},
+                {"$inc": {"helpful_count": 1}}
+            )
+            if result.matched_count == 0:
+                raise HTTPException(status_code=404, detail="Case not found")
+        else:
+            await write_behind.update("community_cases", {"id": case_id}, inc={"helpful_count": 1})
         return {"success": True, "message": "Als hilfreich markiert"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to mark as helpful: {str(e)}")
 
@@ -1790,8 +2217,34 @@ def determine_difficulty(dialog_text: str) -> str:
     else:
         return "Einfach"
 
+entitlement_cache = EntitlementCache.from_env()
+
+async def get_entitlement(user_id: Optional[str]) -> Optional[Entitlement]:
+    """A user's subscription fields (cached), or None for unknown users"""
+    if not user_id:
+        return None
+    return await entitlement_cache.get(user_id, load_entitlement)
+
+async def load_entitlement(user_id: str) -> Optional[Entitlement]:
+    user = await db.users.find_one({"id": user_id}, ENTITLEMENT_PROJECTION)
+    if not user:
+        return None
+    return Entitlement(
+        user_id=user_id,
+        subscription_status=user.get("subscription_status") or "free",
+        subscription_expires_at=parse_datetime(user.get("subscription_expires_at"))
+    )
+
+async def invalidate_entitlement(user_email: Optional[str]):
+    """Drop the cached entitlement after a subscription change for this email"""
+    if not user_email:
+        return
+    user = await db.users.find_one({"email": user_email}, {"_id": 0, "id": 1})
+    if user:
+        entitlement_cache.invalidate(user["id"])
+
 # Helper function to check if user has access to premium features
-def check_premium_access(user: User) -> bool:
+def check_premium_access(user: Union[User, Entitlement]) -> bool:
     """Check if user has active premium subscription"""
     if user.subscription_status != "active":
         return False
@@ -1801,6 +2254,13 @@ def check_premium_access(user: User) -> bool:
         
     return True
 
+async def resolve_user_tier(user_id: Optional[str]) -> str:
+    """Usage-accounting tier for a user (pro, free or anonymous)"""
+    entitlement = await get_entitlement(user_id)
+    if entitlement is None:
+        return "anonymous"
+    return "pro" if check_premium_access(entitlement) else "free"
+
 def get_free_scenarios_limit(stage_number: int) -> int:
     """Get the number of free scenarios available for each stage"""
     if stage_number == 1:
@@ -1811,7 +2271,7 @@ def get_free_emotions_limit() -> int:
     """Get the number of free emotions available in Gefühlslexikon"""
     return 5  # First 5 emotions are free, rest requires PRO
 
-def check_feature_access(user: User, feature: str) -> bool:
+def check_feature_access(user: Union[User, Entitlement], feature: str) -> bool:
     """Check if user has access to specific features"""
     # Free features available to all users
     free_features = [
@@ -2018,6 +2478,7 @@ async def get_checkout_status(session_id: str, request: Request):
                             "updated_at": datetime.now(timezone.utc)
                         }}
                     )
+                    await invalidate_entitlement(user_email)
                     print(f"✅ User {user_email} upgraded to PRO (expires: {expires_at})")
                 
                 update_data["payment_id"] = session_id
@@ -2081,10 +2542,12 @@ async def stripe_webhook(request: Request):
                 "updated_at": datetime.now(timezone.utc)
             }
             
-            await db.payment_transactions.update_one(
+            transaction = await db.payment_transactions.find_one_and_update(
                 {"session_id": session_id},
-                {"$set": prepare_for_mongo(update_data)}
+                {"$set": prepare_for_mongo(update_data)},
+                projection={"_id": 0, "user_email": 1}
             )
+            await invalidate_entitlement((transaction or {}).get("user_email"))
         
         return {"received": True}
         
@@ -2101,9 +2564,20 @@ async def get_weekly_progress(user_id: str, week_number: int):
     return WeeklyProgress(**progress) if progress else None
 
 @api_router.get("/dialog-sessions/{user_id}")
-async def get_dialog_sessions(user_id: str):
-    """Get all dialog sessions for a user"""
-    sessions = await db.dialog_sessions.find({"user_id": user_id}).to_list(length=None)
+async def get_dialog_sessions(
+    user_id: str,
+    response: Response,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """One page of a user's dialog sessions, oldest first; the next page's cursor is in X-Next-Cursor"""
+    projection = parse_fields(fields, DialogSession.model_fields)
+    sessions, next_cursor = await fetch_page(history_db.dialog_sessions, {"user_id": user_id}, limit, cursor, projection=projection)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if projection:
+        return sessions
     return [DialogSession(**session) for session in sessions]
 
 @api_router.post("/generate-scenario")
@@ -2113,35 +2587,23 @@ async def generate_custom_scenario(request: dict):
         stage_number = request.get("stage_number", 1)
         context = request.get("context", "")
         
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"scenario_{uuid.uuid4()}",
-            system_message=f"""Du bist ein Experte für Empathie-Training. 
-            Erstelle ein neues Szenario für Stufe {stage_number} des Trainings.
-            
-            Das Szenario soll:
-            1. Realistisch und nachvollziehbar sein
-            2. Zu Stufe {stage_number} passen
-            3. Eine klare Situation beschreiben
-            4. Eine falsche und eine ideale Reaktion enthalten
-            5. Die positive Wirkung erklären
-            
-            Format:
-            - Situation: [Kurze Beschreibung]
-            - Kontext: [Detaillierte Situationsbeschreibung]
-            - Falsche Reaktion: [Was man nicht tun sollte]
-            - Ideale Reaktion: [Empathische, hilfreiche Antwort]
-            - Wirkung: [Positive Auswirkung der idealen Reaktion]"""
-        ).with_model("openai", "gpt-4o")
-        
-        user_message = UserMessage(
-            text=f"Erstelle ein neues Szenario für Stufe {stage_number}. Kontext: {context}"
-        )
+        chat_session_id = f"scenario_{uuid.uuid4()}"
+        system_message = PROMPTS["generate_scenario"].render(stage_number=stage_number)
         
-        response = await chat.send_message(user_message)
+        user_prompt = f"Erstelle ein neues Szenario für Stufe {stage_number}. Kontext: {context}"
+        
+        response = await llm_gateway.send_message(
+            "generate_scenario",
+            session_id=chat_session_id,
+            system_message=system_message,
+            text=user_prompt,
+            user_tier=await resolve_user_tier(request.get("user_id"))
+        )
         
         return {"scenario": response, "success": True}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Scenario generation failed: {str(e)}")
 
@@ -2412,9 +2874,12 @@ async def register(user_create: UserCreate):
             partner_name=user_create.partner_name
         )
         
-        # Insert into database
+        # Insert into database; the unique email index catches a concurrent registration
         user_dict = new_user.dict()
-        result = await db.users.insert_one(user_dict)
+        try:
+            await db.users.insert_one(user_dict)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Email already registered")
         
         # Return user data (exclude password_hash and MongoDB _id)
         user_dict.pop("password_hash", None)
@@ -2433,7 +2898,7 @@ async def request_password_reset(reset_request: PasswordReset):
     """Request password reset"""
     try:
         # Find user by email
-        user = await db.users.find_one({"email": reset_request.email})
+        user = await db.users.find_one({"email": reset_request.email}, {"_id": 0, "id": 1})
         
         if not user:
             # Don't reveal if email exists or not
@@ -2441,18 +2906,16 @@ async def request_password_reset(reset_request: PasswordReset):
         
         # Generate reset token
         reset_token = generate_reset_token()
-        reset_expires = datetime.now(timezone.utc) + timedelta(hours=1)  # 1 hour expiry
-        
-        # Update user with reset token
-        await db.users.update_one(
-            {"email": reset_request.email},
-            {
-                "$set": {
-                    "password_reset_token": reset_token,
-                    "password_reset_expires": reset_expires
-                }
-            }
-        )
+        reset_expires = datetime.now(timezone.utc) + timedelta(hours=retention_policy.reset_token_hours)
+        
+        # Tokens live in their own TTL collection; a new request replaces older tokens
+        await db.password_reset_tokens.delete_many({"user_id": user["id"]})
+        await db.password_reset_tokens.insert_one({
+            "token_hash": hash_reset_token(reset_token),
+            "user_id": user["id"],
+            "expires_at": reset_expires,
+            "created_at": datetime.now(timezone.utc)
+        })
         
         # In a real app, you would send an email here
         # For testing, we'll return the token (remove this in production)
@@ -2471,29 +2934,26 @@ async def request_password_reset(reset_request: PasswordReset):
 async def confirm_password_reset(reset_confirm: PasswordResetConfirm):
     """Confirm password reset with token"""
     try:
-        # Find user by reset token
-        user = await db.users.find_one({
-            "password_reset_token": reset_confirm.token,
-            "password_reset_expires": {"$gt": datetime.now(timezone.utc)}
+        # Consume the token atomically so it can only be used once; the TTL
+        # index removes it eventually, but it may linger briefly after expiry
+        token = await db.password_reset_tokens.find_one_and_delete({
+            "token_hash": hash_reset_token(reset_confirm.token),
+            "expires_at": {"$gt": datetime.now(timezone.utc)}
         })
         
-        if not user:
+        if not token:
             raise HTTPException(status_code=400, detail="Invalid or expired reset token")
         
         # Hash new password
         new_password_hash = hash_password(reset_confirm.new_password)
         
-        # Update user password and clear reset token
-        await db.users.update_one(
-            {"_id": user["_id"]},
-            {
-                "$set": {"password_hash": new_password_hash},
-                "$unset": {
-                    "password_reset_token": "",
-                    "password_reset_expires": ""
-                }
-            }
+        # Update user password
+        result = await db.users.update_one(
+            {"id": token["user_id"]},
+            {"$set": {"password_hash": new_password_hash}}
         )
+        if result.matched_count == 0:
+            raise HTTPException(status_code=400, detail="Invalid or expired reset token")
         
         return {"message": "Password reset successful"}
         
@@ -2560,6 +3020,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Configure logging
@@ -2569,6 +3030,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_db_indexes():
+    try:
+        report = await ensure_indexes(db, declared_indexes(retention_policy))
+        log_report(report)
+        if has_problems(report):
+            print("⚠️ Some MongoDB indexes could not be created - run `python db_indexes.py` for details")
+        else:
+            print("✅ MongoDB indexes in place")
+    except Exception as e:
+        logger.error(f"Index bootstrap failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_llm_gateway():
+    await llm_gateway.start()
+    await opening_pool.start()
+
+@app.on_event("shutdown")
+async def shutdown_llm_gateway():
+    await opening_pool.close()
+    await llm_gateway.close()
+
+@app.on_event("startup")
+async def start_write_behind():
+    await write_behind.start()
+
+@app.on_event("startup")
+async def start_retention_sweeper():
+    await retention_sweeper.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Stop the sweeper and flush buffered writes while the client is still open
+    await retention_sweeper.close()
+    await write_behind.close()
     client.close()
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""Bucketed storage for training session transcripts
+
+The training_sessions document stays a small header holding counters and
+last-turn metadata; messages live in training_message_buckets, at most
+bucket_size per document, keyed by (session_id, bucket).
+
+Sessions written before buckets existed keep their transcript in an inline
+"messages" array. They are still readable, are migrated on their next turn,
+and can be migrated up front with:
+
+    python training_messages.py --migrate
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import List
+
+from pymongo import ReturnDocument, UpdateOne
+
+from mongo_dates import CODEC_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+
+def last_turn_fields(messages: List[dict]) -> dict:
+    """Header metadata describing the newest message"""
+    last = messages[-1]
+    return {"last_speaker": last.get("speaker"), "last_message_at": last.get("timestamp")}
+
+
+class TrainingMessageStore:
+    """Appends and reads training messages in fixed-size bucket documents"""
+
+    def __init__(self, sessions, buckets, bucket_size: int = 50):
+        self.sessions = sessions
+        self.buckets = buckets
+        self.bucket_size = bucket_size
+
+    @classmethod
+    def from_env(cls, sessions, buckets) -> "TrainingMessageStore":
+        return cls(sessions, buckets, bucket_size=int(os.environ.get("TRAINING_MESSAGE_BUCKET_SIZE", 50)))
+
+    async def create(self, header: dict, messages: List[dict]):
+        """Insert a new session header together with its first messages"""
+        await self.sessions.insert_one({
+            **header,
+            "message_count": len(messages),
+            **(last_turn_fields(messages) if messages else {})
+        })
+        await self._write(header["session_id"], 0, messages)
+
+    async def append(self, session: dict, messages: List[dict]):
+        """Append messages to a session, migrating an inline transcript first"""
+        if "messages" in session:
+            await self.migrate_session(session)
+
+        # Reserve positions atomically so concurrent turns never share a slot
+        header = await self.sessions.find_one_and_update(
+            {"session_id": session["session_id"]},
+            {"$inc": {"message_count": len(messages)}, "$set": last_turn_fields(messages)},
+            projection={"_id": 0, "message_count": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if header is None:
+            return
+        await self._write(session["session_id"], header["message_count"] - len(messages), messages)
+
+    async def load(self, session: dict, start: int = 0) -> List[dict]:
+        """Messages from position start onwards, oldest first"""
+        if "messages" in session:
+            return session["messages"][start:]
+
+        messages = []
+        cursor = self.buckets.find(
+            {"session_id": session["session_id"], "bucket": {"$gte": start // self.bucket_size}},
+            {"_id": 0, "messages": 1}
+        ).sort("bucket", 1)
+        async for bucket in cursor:
+            messages.extend(bucket["messages"])
+        messages.sort(key=lambda message: message["seq"])
+        return [message for message in messages if message["seq"] >= start]
+
+    @staticmethod
+    def message_count(session: dict) -> int:
+        if "messages" in session:
+            return len(session["messages"])
+        return session.get("message_count", 0)
+
+    async def migrate_session(self, session: dict):
+        """Move an inline transcript into buckets; safe to repeat or run concurrently"""
+        messages = session.get("messages") or []
+        await self._write(session["session_id"], 0, messages)
+        await self.sessions.update_one(
+            {"session_id": session["session_id"], "messages": {"$exists": True}},
+            {
+                "$set": {"message_count": len(messages), **(last_turn_fields(messages) if messages else {})},
+                "$unset": {"messages": ""}
+            }
+        )
+
+    async def migrate_all(self, batch_size: int = 100) -> int:
+        """Migrate every session that still has an inline transcript"""
+        migrated = 0
+        cursor = self.sessions.find({"messages": {"$exists": True}}, batch_size=batch_size)
+        async for session in cursor:
+            await self.migrate_session(session)
+            migrated += 1
+            if migrated % batch_size == 0:
+                logger.info(f"Migrated {migrated} training sessions")
+        return migrated
+
+    async def _write(self, session_id: str, first_seq: int, messages: List[dict]):
+        """Add messages numbered from first_seq to their buckets
+
+        $addToSet keeps a repeated write (retry, concurrent migration) from
+        duplicating messages, since seq makes every entry distinct.
+        """
+        by_bucket = {}
+        for offset, message in enumerate(messages):
+            seq = first_seq + offset
+            by_bucket.setdefault(seq // self.bucket_size, []).append({**message, "seq": seq})
+
+        if not by_bucket:
+            return
+        await self.buckets.bulk_write([
+            UpdateOne(
+                {"session_id": session_id, "bucket": bucket},
+                {"$addToSet": {"messages": {"$each": entries}}},
+                upsert=True
+            )
+            for bucket, entries in sorted(by_bucket.items())
+        ], ordered=False)
+
+
+async def _main(batch_size: int) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    mongo_url = os.environ.get('MONGO_URL')
+    if not mongo_url:
+        print("MONGO_URL environment variable is required", file=sys.stderr)
+        return 2
+
+    client = AsyncIOMotorClient(mongo_url, **CODEC_OPTIONS)
+    try:
+        db = client.get_database(os.environ.get('MONGO_DB_NAME', 'app_database'))
+        store = TrainingMessageStore.from_env(db.training_sessions, db.training_message_buckets)
+        migrated = await store.migrate_all(batch_size)
+    finally:
+        client.close()
+
+    print(f"Migrated {migrated} training sessions")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move inline training transcripts into message buckets")
+    parser.add_argument("--migrate", action="store_true", required=True)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(args.batch_size)))
@@ -0,0 +1,212 @@
+"""Write-behind buffer for counter increments, array appends and inserts
+
+Increments and appends aimed at the same document are merged in memory and,
+together with queued inserts, written as one unordered bulk_write per
+collection every flush_interval seconds, when max_pending documents are
+waiting, and on shutdown.
+
+Durability is chosen per collection with WRITE_BEHIND_DURABILITY, e.g.
+"community_cases=buffered,training_late_responses=immediate":
+
+    buffered   merge in memory; a crash loses at most one flush window
+    immediate  write through on every call, as if there were no buffer
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+BUFFERED = "buffered"
+IMMEDIATE = "immediate"
+DURABILITY_MODES = (BUFFERED, IMMEDIATE)
+
+DocumentKey = Tuple[str, Tuple[Tuple[str, Any], ...]]
+
+
+def parse_durability(spec: str) -> Dict[str, str]:
+    """Parse 'collection=mode,...'"""
+    modes = {}
+    for item in spec.split(","):
+        if "=" in item:
+            collection, mode = (part.strip() for part in item.split("=", 1))
+            if mode not in DURABILITY_MODES:
+                raise ValueError(f"Unknown write-behind durability {mode!r} for {collection}")
+            modes[collection] = mode
+    return modes
+
+
+class WriteBehindBuffer:
+    """Merges $inc and $push updates per document and flushes them in bulk"""
+
+    def __init__(
+        self,
+        db,
+        flush_interval: float = 1.0,
+        max_pending: int = 1000,
+        durability: Optional[Dict[str, str]] = None,
+        default_durability: str = BUFFERED,
+    ):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.durability = durability or {}
+        self.default_durability = default_durability
+        self._increments: Dict[DocumentKey, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+        self._appends: Dict[DocumentKey, Dict[str, List]] = defaultdict(lambda: defaultdict(list))
+        self._inserts: Dict[str, List[dict]] = defaultdict(list)
+        self._flusher: Optional[asyncio.Task] = None
+        self._early_flushes = set()
+        self._flush_lock = asyncio.Lock()
+        self._stats = defaultdict(lambda: {"updates": 0, "writes": 0, "flushes": 0, "errors": 0})
+
+    @classmethod
+    def from_env(cls, db) -> "WriteBehindBuffer":
+        """Build the buffer from WRITE_BEHIND_* environment variables"""
+        return cls(
+            db,
+            flush_interval=float(os.environ.get("WRITE_BEHIND_FLUSH_SECONDS", 1.0)),
+            max_pending=int(os.environ.get("WRITE_BEHIND_MAX_PENDING", 1000)),
+            durability=parse_durability(os.environ.get("WRITE_BEHIND_DURABILITY", "")),
+            default_durability=os.environ.get("WRITE_BEHIND_DEFAULT_DURABILITY", BUFFERED),
+        )
+
+    def mode_for(self, collection: str) -> str:
+        return self.durability.get(collection, self.default_durability)
+
+    async def update(
+        self,
+        collection: str,
+        query: dict,
+        inc: Optional[Dict[str, float]] = None,
+        push: Optional[Dict[str, List]] = None,
+    ):
+        """Queue an $inc and/or $push (each value is a list of items to append) for one document"""
+        self._stats[collection]["updates"] += 1
+        if self.mode_for(collection) == IMMEDIATE:
+            update = self._update_document(inc or {}, push or {})
+            await self.db[collection].update_one(query, update)
+            self._stats[collection]["writes"] += 1
+            return
+
+        key = (collection, tuple(sorted(query.items())))
+        for field, amount in (inc or {}).items():
+            self._increments[key][field] += amount
+        for field, items in (push or {}).items():
+            self._appends[key][field].extend(items)
+
+        self._flush_if_full()
+
+    async def insert(self, collection: str, document: dict):
+        """Queue a new document; it is inserted as is, so it must not be shared"""
+        self._stats[collection]["updates"] += 1
+        if self.mode_for(collection) == IMMEDIATE:
+            await self.db[collection].insert_one(document)
+            self._stats[collection]["writes"] += 1
+            return
+
+        self._inserts[collection].append(document)
+        self._flush_if_full()
+
+    def _flush_if_full(self):
+        if self.pending() >= self.max_pending and not self._flush_lock.locked():
+            task = asyncio.create_task(self.flush())
+            self._early_flushes.add(task)
+            task.add_done_callback(self._early_flushes.discard)
+
+    def pending(self) -> int:
+        return len(set(self._increments) | set(self._appends)) + sum(len(docs) for docs in self._inserts.values())
+
+    async def start(self):
+        if self._flusher is None and self.flush_interval > 0:
+            self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def close(self):
+        """Stop the background flusher and write everything still pending"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self):
+        """Write pending updates as one unordered bulk_write per collection"""
+        async with self._flush_lock:
+            increments, self._increments = self._increments, defaultdict(lambda: defaultdict(int))
+            appends, self._appends = self._appends, defaultdict(lambda: defaultdict(list))
+            inserts, self._inserts = self._inserts, defaultdict(list)
+
+            by_collection: Dict[str, List[DocumentKey]] = defaultdict(list)
+            for key in set(increments) | set(appends):
+                by_collection[key[0]].append(key)
+            for collection in inserts:
+                by_collection.setdefault(collection, [])
+
+            for collection, keys in by_collection.items():
+                documents = inserts.get(collection, [])
+                operations = [
+                    UpdateOne(dict(key[1]), self._update_document(increments.get(key, {}), appends.get(key, {})))
+                    for key in keys
+                ] + [InsertOne(document) for document in documents]
+                try:
+                    await self.db[collection].bulk_write(operations, ordered=False)
+                    self._stats[collection]["writes"] += len(operations)
+                    self._stats[collection]["flushes"] += 1
+                    continue
+                except BulkWriteError as e:
+                    # Unordered: only the reported operations failed. A failed insert
+                    # is a duplicate key or invalid document and would fail again
+                    failed_indices = [error["index"] for error in e.details.get("writeErrors", [])]
+                    failed = [keys[index] for index in failed_indices if index < len(keys)]
+                    documents = []
+                    self._stats[collection]["writes"] += len(operations) - len(failed_indices)
+                    logger.warning(
+                        f"Write-behind flush for {collection}: {len(failed_indices)} of {len(operations)} writes failed"
+                    )
+                except Exception as e:
+                    failed = keys
+                    logger.warning(f"Write-behind flush failed for {collection}: {str(e)}")
+                self._stats[collection]["errors"] += 1
+                self._requeue(failed, increments, appends)
+                if documents:
+                    # InsertOne gave each document an _id, so a retry cannot insert it twice
+                    self._inserts[collection][:0] = documents
+
+    def _requeue(self, keys: List[DocumentKey], increments: dict, appends: dict):
+        """Put failed updates back in front of anything queued since the flush began"""
+        for key in keys:
+            for field, amount in increments.get(key, {}).items():
+                self._increments[key][field] += amount
+            for field, items in appends.get(key, {}).items():
+                self._appends[key][field][:0] = items
+
+    @staticmethod
+    def _update_document(inc: Dict[str, float], push: Dict[str, List]) -> dict:
+        update = {}
+        if inc:
+            update["$inc"] = dict(inc)
+        if push:
+            update["$push"] = {field: {"$each": list(items)} for field, items in push.items()}
+        return update
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_documents": self.pending(),
+            "collections": {
+                collection: {**stats, "durability": self.mode_for(collection)}
+                for collection, stats in self._stats.items()
+            },
+        }
@@ -0,0 +1,172 @@
+"""Batch empathy evaluation against the fake LLM provider
+
+Imports server.py, so the backend requirements must be installed. MONGO_URL
+only has to be set: the database is replaced where the endpoint writes.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+server = pytest.importorskip("server")
+
+from llm_admission import LlmOverloadedError  # noqa: E402
+from llm_gateway import LlmGateway  # noqa: E402
+from llm_providers import FAKE_RESPONSES, FakeProvider, FakeProviderError  # noqa: E402
+
+EVALUATION = FAKE_RESPONSES["training_evaluate"][0]
+SCENARIO_ID = 1
+USER_RESPONSES = [
+    "Das klingt wirklich anstrengend.",
+    "Erzähl mir mehr davon.",
+    "Was brauchst du gerade von mir?",
+    "Ich bin für dich da.",
+]
+
+
+class FakeEvaluations:
+    def __init__(self):
+        self.records = []
+
+    async def insert_many(self, records):
+        self.records.extend(records)
+
+
+@pytest.fixture
+def use_provider(monkeypatch):
+    """Route server.py's LLM calls to a fake provider"""
+    def use(**options) -> FakeProvider:
+        provider = FakeProvider(latency="fixed:0", **options)
+        monkeypatch.setattr(server, "llm_gateway", LlmGateway(provider))
+        return provider
+    return use
+
+
+@pytest.fixture
+def evaluations(monkeypatch):
+    store = FakeEvaluations()
+
+    async def free_tier(user_id):
+        return "free"
+
+    monkeypatch.setattr(server, "db", type("FakeDb", (), {"training_evaluations": store})())
+    monkeypatch.setattr(server, "resolve_user_tier", free_tier)
+    return store
+
+
+def batch_request(responses=USER_RESPONSES):
+    return server.BatchEmpathyEvaluation(scenario_id=SCENARIO_ID, user_id="user-1", user_responses=list(responses))
+
+
+def evaluate_chunk(indices):
+    scenario = server.TRAINING_SCENARIOS[SCENARIO_ID]
+    return asyncio.run(server.evaluate_batch_chunk(scenario, batch_request(), indices, "free"))
+
+
+def test_chunk_maps_feedback_to_the_requested_indices(use_provider):
+    use_provider()
+
+    feedback, raw = evaluate_chunk([1, 3])
+
+    assert sorted(feedback) == [1, 3]
+    assert all(item.empathy_score == EVALUATION["empathy_score"] for item in feedback.values())
+    assert raw
+
+
+def test_chunk_ignores_indices_it_did_not_ask_for(use_provider):
+    use_provider(responses={"training_evaluate_batch": [{"evaluations": [
+        {"index": 1, **EVALUATION},
+        {"index": 2, **EVALUATION},
+    ]}]})
+
+    feedback, _ = evaluate_chunk([0, 1])
+
+    # 0 was left out by the model and 2 belongs to another chunk
+    assert sorted(feedback) == [1]
+
+
+def test_chunk_without_valid_json_has_no_feedback(use_provider):
+    use_provider(responses={"training_evaluate_batch": ["Leider kein JSON"]})
+
+    feedback, raw = evaluate_chunk([0, 1])
+
+    assert feedback == {}
+    assert raw == "Leider kein JSON"
+
+
+def test_failed_chunk_call_raises(use_provider):
+    use_provider(error_rate=1.0)
+
+    with pytest.raises(FakeProviderError):
+        evaluate_chunk([0, 1])
+
+
+def test_overloaded_batch_is_a_429_and_stores_nothing(use_provider, evaluations, monkeypatch):
+    use_provider()
+
+    async def overloaded(*args, **kwargs):
+        raise LlmOverloadedError(retry_after=5)
+
+    monkeypatch.setattr(server.llm_gateway, "send_message", overloaded)
+
+    with pytest.raises(LlmOverloadedError) as raised:
+        asyncio.run(server.evaluate_empathy_responses_batch(batch_request()))
+
+    assert raised.value.status_code == 429
+    assert evaluations.records == []
+
+
+def test_chunks_are_evaluated_a_few_at_a_time(use_provider, evaluations, monkeypatch):
+    provider = use_provider()
+    monkeypatch.setattr(server, "EVALUATION_BATCH_TOKEN_BUDGET", 1)
+    running = peak = 0
+    complete = provider.complete
+
+    async def tracked(*args):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(0.01)
+            return await complete(*args)
+        finally:
+            running -= 1
+
+    monkeypatch.setattr(provider, "complete", tracked)
+
+    result = asyncio.run(server.evaluate_empathy_responses_batch(batch_request()))
+
+    assert result["llm_calls"] == len(USER_RESPONSES)
+    assert result["fallback_count"] == 0
+    assert peak == server.EVALUATION_BATCH_CONCURRENCY
+
+
+def test_batch_falls_back_per_item(use_provider, evaluations):
+    use_provider(responses={"training_evaluate_batch": [{"evaluations": [
+        {"index": 0, **EVALUATION},
+        {"index": 2, **EVALUATION},
+    ]}]})
+
+    result = asyncio.run(server.evaluate_empathy_responses_batch(batch_request()))
+
+    assert [item.index for item in result["evaluations"]] == [0, 1, 2, 3]
+    assert [item.fallback for item in result["evaluations"]] == [False, True, False, True]
+    assert result["fallback_count"] == 2
+    fallback = result["evaluations"][1].feedback
+    assert fallback.feedback == server.FALLBACK_EMPATHY_FEEDBACK_TEXT
+    assert [record["fallback"] for record in evaluations.records] == [False, True, False, True]
+
+
+def test_batch_of_valid_evaluations_needs_no_fallback(use_provider, evaluations):
+    use_provider()
+
+    result = asyncio.run(server.evaluate_empathy_responses_batch(batch_request()))
+
+    assert result["fallback_count"] == 0
+    assert len(evaluations.records) == len(USER_RESPONSES)
+    assert {record["batch_id"] for record in evaluations.records} == {result["batch_id"]}
@@ -0,0 +1,145 @@
+"""Admission control for LLM calls, including streams that are never consumed"""
+import asyncio
+import gc
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+pytest.importorskip("fastapi")
+
+from llm_admission import (  # noqa: E402
+    AdmissionController, LlmOverloadedError, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+)
+
+
+def test_slot_is_released_after_use():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1)
+        async with admission.slot(PRIORITY_INTERACTIVE):
+            assert admission.in_flight == 1
+        return admission.in_flight
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_waiters_are_served_by_priority():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_queue=4)
+        served = []
+
+        async def call(name, priority):
+            async with admission.slot(priority):
+                served.append(name)
+                await asyncio.sleep(0)
+
+        await admission.acquire(PRIORITY_INTERACTIVE)
+        waiters = [
+            asyncio.ensure_future(call("batch", PRIORITY_BATCH)),
+            asyncio.ensure_future(call("interactive", PRIORITY_INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        admission.release()
+        await asyncio.gather(*waiters)
+        return served
+
+    assert asyncio.run(scenario()) == ["interactive", "batch"]
+
+
+def test_full_queue_evicts_lower_priority_waiter():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_queue=1)
+        await admission.acquire(PRIORITY_INTERACTIVE)
+        batch = asyncio.ensure_future(admission.acquire(PRIORITY_BATCH))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(admission.acquire(PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        with pytest.raises(LlmOverloadedError):
+            await batch
+        admission.release()
+        await interactive
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["evicted"] == 1
+    assert stats["in_flight"] == 1
+
+
+def test_full_queue_rejects_same_priority_with_retry_after():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_queue=1, retry_after=7)
+        await admission.acquire(PRIORITY_BATCH)
+        waiter = asyncio.ensure_future(admission.acquire(PRIORITY_BATCH))
+        await asyncio.sleep(0)
+        try:
+            await admission.acquire(PRIORITY_BATCH)
+        finally:
+            waiter.cancel()
+
+    with pytest.raises(LlmOverloadedError) as raised:
+        asyncio.run(scenario())
+    assert raised.value.status_code == 429
+    assert raised.value.headers["Retry-After"] == "7"
+
+
+def test_queue_timeout_raises_overloaded():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, queue_timeout=0.01)
+        await admission.acquire(PRIORITY_INTERACTIVE)
+        await admission.acquire(PRIORITY_INTERACTIVE)
+
+    with pytest.raises(LlmOverloadedError):
+        asyncio.run(scenario())
+
+
+class TestAdmittedStream:
+    """stream_message takes the slot up front; it must come back however the stream ends"""
+
+    @pytest.fixture
+    def gateway(self):
+        pytest.importorskip("llm_providers")
+        from llm_gateway import LlmGateway
+        from llm_providers import FakeProvider
+        return LlmGateway(FakeProvider(latency="fixed:0"), admission=AdmissionController(max_in_flight=2))
+
+    def open_stream(self, gateway):
+        return gateway.stream_message("training_respond", session_id="s1", system_message="system", text="hallo")
+
+    def test_consumed_stream_releases_slot(self, gateway):
+        async def scenario():
+            stream = await self.open_stream(gateway)
+            chunks = [chunk async for chunk in stream]
+            await stream.aclose()
+            return chunks
+
+        assert asyncio.run(scenario())
+        assert gateway.admission.in_flight == 0
+
+    def test_unstarted_stream_releases_slot_on_aclose(self, gateway):
+        async def scenario():
+            stream = await self.open_stream(gateway)
+            assert gateway.admission.in_flight == 1
+            await stream.aclose()
+            await stream.aclose()
+
+        asyncio.run(scenario())
+        assert gateway.admission.in_flight == 0
+
+    def test_abandoned_unstarted_stream_releases_slot(self, gateway):
+        async def scenario():
+            await self.open_stream(gateway)
+            gc.collect()
+
+        asyncio.run(scenario())
+        assert gateway.admission.in_flight == 0
+
+    def test_partially_read_stream_releases_slot_on_aclose(self, gateway):
+        async def scenario():
+            stream = await self.open_stream(gateway)
+            await stream.__anext__()
+            await stream.aclose()
+
+        asyncio.run(scenario())
+        assert gateway.admission.in_flight == 0
@@ -0,0 +1,41 @@
+"""Token-budget chunking used to pack batch evaluations into LLM calls"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from llm_context import chunk_by_token_budget, count_tokens  # noqa: E402
+
+RESPONSE = "Das klingt wirklich anstrengend, erzähl mir mehr davon."
+
+
+def test_every_index_lands_in_exactly_one_chunk_in_order():
+    texts = [f"{RESPONSE} {index}" for index in range(25)]
+
+    chunks = chunk_by_token_budget(texts, token_budget=5 * count_tokens(texts[0]) + 5)
+
+    assert [index for chunk in chunks for index in chunk] == list(range(25))
+    assert len(chunks) > 1
+
+
+def test_chunks_stay_within_budget_including_overhead():
+    texts = [RESPONSE] * 10
+    budget = 200
+    overhead = 40
+
+    chunks = chunk_by_token_budget(texts, budget, overhead)
+
+    for chunk in chunks:
+        assert sum(count_tokens(texts[index]) + overhead for index in chunk) <= budget
+
+
+def test_oversized_item_gets_its_own_chunk():
+    texts = [RESPONSE, RESPONSE * 50, RESPONSE]
+
+    chunks = chunk_by_token_budget(texts, token_budget=3 * count_tokens(RESPONSE))
+
+    assert chunks == [[0], [1], [2]]
+
+
+def test_empty_input_has_no_chunks():
+    assert chunk_by_token_budget([], token_budget=100) == []
@@ -0,0 +1,55 @@
+"""Response caching in the LLM gateway when a fallback tier answers"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+pytest.importorskip("llm_providers")
+
+from llm_gateway import LlmGateway  # noqa: E402
+from llm_providers import FakeProvider  # noqa: E402
+from llm_router import model_name  # noqa: E402
+
+ENDPOINT = "training_evaluate"
+
+
+class DictCache:
+    def __init__(self):
+        self.entries = {}
+
+    def enabled_for(self, endpoint):
+        return True
+
+    async def get(self, endpoint, key):
+        return self.entries.get(key)
+
+    async def set(self, endpoint, key, response):
+        self.entries[key] = response
+
+
+def send(gateway):
+    return asyncio.run(gateway.send_message(ENDPOINT, session_id="s1", system_message="system", text="hallo"))
+
+
+def test_primary_answer_is_cached():
+    cache = DictCache()
+    gateway = LlmGateway(FakeProvider(latency="fixed:0"), cache=cache)
+
+    assert send(gateway)
+    assert len(cache.entries) == 1
+
+
+def test_fallback_answer_is_not_cached_under_the_primary_key():
+    cache = DictCache()
+    provider = FakeProvider(latency="fixed:0")
+    gateway = LlmGateway(provider, cache=cache)
+    models = gateway.router.models_for(ENDPOINT)
+    if len(models) < 2:
+        pytest.skip("route has no fallback tier")
+    provider.failing_models = {model_name(models[0])}
+
+    assert send(gateway)
+    assert cache.entries == {}
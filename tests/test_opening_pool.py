@@ -0,0 +1,36 @@
+"""Name templating for pooled training openings"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from opening_pool import render_names, to_template  # noqa: E402
+
+
+def test_names_round_trip_through_a_template():
+    text = "Anna, ich bin so müde. Weißt du, Jonas, die Arbeit ist einfach zu viel."
+
+    template = to_template(text, "Jonas", "Anna")
+
+    assert template == "{partner_name}, ich bin so müde. Weißt du, {user_name}, die Arbeit ist einfach zu viel."
+    assert render_names(template, "Mia", "Leon") == text.replace("Anna", "Leon").replace("Jonas", "Mia")
+
+
+def test_only_whole_words_are_replaced():
+    template = to_template("Max, du bist maximal gestresst. Maxi hat angerufen.", "Max", "Lena")
+
+    assert template == "{user_name}, du bist maximal gestresst. Maxi hat angerufen."
+
+
+def test_names_with_regex_characters_are_matched_literally():
+    template = to_template("Hallo Jean-Luc (ehrlich), wie geht's?", "Jean-Luc", "Lena")
+
+    assert template == "Hallo {user_name} (ehrlich), wie geht's?"
+
+
+def test_short_or_empty_names_are_not_templated():
+    text = "Al, ich brauche also wirklich eine Pause."
+
+    assert to_template(text, "Al", "Lena") is None
+    assert to_template(text, "Jonas", "") is None
+    assert to_template(text, "Jonas", "   ") is None
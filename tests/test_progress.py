@@ -0,0 +1,61 @@
+"""Re-sent single progress records
+
+Imports server.py, so the backend requirements must be installed. MONGO_URL
+only has to be set: the progress collection is replaced.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+server = pytest.importorskip("server")
+
+from pymongo.errors import DuplicateKeyError  # noqa: E402
+
+
+class FakeProgress:
+    """Enforces the unique index on id"""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def insert_one(self, document):
+        if document["id"] in self.documents:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        self.documents[document["id"]] = dict(document)
+
+    async def find_one(self, query, projection=None):
+        return self.documents.get(query["id"])
+
+
+@pytest.fixture
+def progress(monkeypatch):
+    collection = FakeProgress()
+    monkeypatch.setattr(server, "db", type("FakeDb", (), {"progress": collection})())
+    return collection
+
+
+def record(**overrides):
+    values = {"id": "p1", "user_id": "u1", "stage_number": 1, "scenario_id": "1", "user_response": "Ich höre dir zu.", "score": 7}
+    return server.UserProgress(**{**values, **overrides})
+
+
+def test_resent_record_returns_the_stored_one(progress):
+    first = asyncio.run(server.save_user_progress(record()))
+    again = asyncio.run(server.save_user_progress(record(score=3)))
+
+    assert again.score == first.score == 7
+    assert len(progress.documents) == 1
+
+
+def test_id_of_another_user_is_a_conflict(progress):
+    asyncio.run(server.save_user_progress(record()))
+
+    with pytest.raises(server.HTTPException) as raised:
+        asyncio.run(server.save_user_progress(record(user_id="u2")))
+    assert raised.value.status_code == 409
@@ -0,0 +1,62 @@
+"""Static-prefix report for the LLM prompt template registry
+
+Run with `pytest -s tests/test_prompt_templates.py` to see the table.
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from prompt_templates import PROMPTS  # noqa: E402
+
+# Stand-in for the pydantic JSON schema server.py binds into the evaluation prompts
+SAMPLE_SCHEMA = json.dumps({
+    "properties": {
+        "empathy_score": {"type": "number", "minimum": 0, "maximum": 10},
+        "feedback": {"type": "string"},
+        "improvements": {"type": "array", "items": {"type": "string"}},
+        "alternative_responses": {"type": "array", "items": {"type": "string"}},
+        "emotional_awareness": {"type": "string"},
+        "next_level_tip": {"type": "string"},
+    },
+    "required": ["empathy_score", "feedback", "improvements", "alternative_responses", "emotional_awareness", "next_level_tip"],
+    "type": "object",
+})
+
+MIN_STATIC_PREFIX_RATIO = 0.6
+
+
+def bound(template):
+    return template.bind(schema=SAMPLE_SCHEMA)
+
+
+def test_static_prefix_ratios():
+    print()
+    print(f"{'template':<28} {'static':>7} {'total':>7} {'ratio':>6}")
+    low = []
+    for name, template in sorted(PROMPTS.items()):
+        template = bound(template)
+        rendered = template.render(**template.sample)
+        ratio = template.static_prefix_ratio()
+        print(f"{name:<28} {len(template.static):>7} {len(rendered):>7} {ratio:>6.1%}")
+        if ratio < MIN_STATIC_PREFIX_RATIO:
+            low.append(name)
+    assert not low, f"Static prefix below {MIN_STATIC_PREFIX_RATIO:.0%}: {low}"
+
+
+def test_static_prefix_has_no_request_values():
+    for name, template in PROMPTS.items():
+        template = bound(template)
+        assert "{schema}" not in template.static, f"{name}: unbound schema slot"
+        for value in template.sample.values():
+            if len(str(value)) > 3:
+                assert str(value) not in template.static, f"{name}: sample value {value!r} appears in the static prefix"
+
+
+def test_samples_cover_all_fields():
+    for name, template in PROMPTS.items():
+        missing = set(template.fields) - set(template.sample)
+        assert not missing, f"{name}: sample lacks {sorted(missing)}"
+        rendered = template.render(**template.sample)
+        assert rendered.startswith(template.static)
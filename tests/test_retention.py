@@ -0,0 +1,138 @@
+"""Abandoned-session sweep and TTL declarations"""
+import asyncio
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+pytest.importorskip("pymongo")
+
+from retention import RetentionPolicy, RetentionSweeper  # noqa: E402
+
+NOW = datetime.now(timezone.utc)
+STALE = NOW - timedelta(hours=72)
+RECENT = NOW - timedelta(hours=1)
+
+
+def matches(document: dict, query: dict) -> bool:
+    """The subset of MongoDB query semantics the sweeper uses"""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+        elif isinstance(condition, dict):
+            for operator, value in condition.items():
+                if operator == "$lt" and not (field in document and document[field] < value):
+                    return False
+                if operator == "$exists" and (field in document) != value:
+                    return False
+        elif document.get(field) != condition:
+            return False
+    return True
+
+
+class DeleteResult:
+    def __init__(self, deleted_count: int):
+        self.deleted_count = deleted_count
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents[:length]
+
+
+class FakeCollection:
+    def __init__(self, documents=(), before_delete=None):
+        self.documents = [dict(document) for document in documents]
+        self.before_delete = before_delete
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(document) for document in self.documents if matches(document, query)])
+
+    async def find_one_and_delete(self, query, projection=None):
+        if self.before_delete is not None:
+            self.before_delete(self)
+            self.before_delete = None
+        for document in self.documents:
+            if matches(document, query):
+                self.documents.remove(document)
+                return document
+        return None
+
+    async def delete_many(self, query):
+        kept = [document for document in self.documents if not matches(document, query)]
+        deleted = len(self.documents) - len(kept)
+        self.documents = kept
+        return DeleteResult(deleted)
+
+
+class FakeDb:
+    def __init__(self, sessions, before_delete=None):
+        self.training_sessions = FakeCollection(sessions, before_delete)
+        session_ids = [session["session_id"] for session in sessions]
+        self.training_message_buckets = FakeCollection({"session_id": session_id, "bucket": 0} for session_id in session_ids)
+        self.training_late_responses = FakeCollection({"session_id": session_id} for session_id in session_ids)
+
+
+def remaining(collection: FakeCollection):
+    return sorted(document["session_id"] for document in collection.documents)
+
+
+def sweep(db, batch_size=500):
+    sweeper = RetentionSweeper(db, RetentionPolicy(abandoned_session_hours=48, sweep_batch_size=batch_size))
+    asyncio.run(sweeper.sweep())
+    return sweeper.stats()
+
+
+def test_sweep_deletes_abandoned_sessions_with_their_buckets():
+    db = FakeDb([
+        {"session_id": "stale", "status": "active", "last_message_at": STALE},
+        {"session_id": "stale-without-turns", "status": "active", "created_at": STALE},
+        {"session_id": "recent", "status": "active", "last_message_at": RECENT},
+        {"session_id": "completed", "status": "completed", "last_message_at": STALE},
+    ])
+
+    stats = sweep(db, batch_size=1)
+
+    assert remaining(db.training_sessions) == ["completed", "recent"]
+    assert remaining(db.training_message_buckets) == ["completed", "recent"]
+    assert remaining(db.training_late_responses) == ["completed", "recent"]
+    assert stats["sessions_deleted"] == 2
+    assert stats["buckets_deleted"] == 2
+
+
+def test_sweep_keeps_session_that_gets_a_turn_during_the_sweep():
+    def new_turn(sessions):
+        # A turn for "b" lands after the find but before its delete
+        next(session for session in sessions.documents if session["session_id"] == "b")["last_message_at"] = NOW
+
+    db = FakeDb([
+        {"session_id": "a", "status": "active", "last_message_at": STALE},
+        {"session_id": "b", "status": "active", "last_message_at": STALE},
+    ], before_delete=new_turn)
+
+    stats = sweep(db)
+
+    assert remaining(db.training_sessions) == ["b"]
+    assert remaining(db.training_message_buckets) == ["b"]
+    assert stats["sessions_deleted"] == 1
+
+
+def test_ttl_indexes_follow_the_policy():
+    policy = RetentionPolicy(connection_test_seconds=60, pending_payment_hours=2)
+
+    indexes = {
+        collection: [model.document for model in models]
+        for collection, models in policy.ttl_indexes().items()
+    }
+
+    assert {"key": {"timestamp": 1}, "name": "timestamp_1", "expireAfterSeconds": 60} in indexes["connection_test"]
+    [pending] = indexes["payment_transactions"]
+    assert pending["expireAfterSeconds"] == 7200
+    assert pending["partialFilterExpression"] == {"payment_status": "pending"}
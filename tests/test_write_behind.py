@@ -0,0 +1,151 @@
+"""Merging and flushing in the write-behind buffer"""
+import asyncio
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+pytest.importorskip("pymongo")
+
+from pymongo import InsertOne, UpdateOne  # noqa: E402
+from pymongo.errors import BulkWriteError  # noqa: E402
+
+from write_behind import IMMEDIATE, WriteBehindBuffer, parse_durability  # noqa: E402
+
+
+class FakeCollection:
+    def __init__(self):
+        self.bulk_writes = []
+        self.updates = []
+        self.inserts = []
+        self.failures = []
+
+    async def bulk_write(self, operations, ordered):
+        assert ordered is False
+        self.bulk_writes.append(operations)
+        if self.failures:
+            raise self.failures.pop(0)
+
+    async def update_one(self, query, update):
+        self.updates.append((query, update))
+
+    async def insert_one(self, document):
+        self.inserts.append(document)
+
+
+class FakeDb(defaultdict):
+    def __init__(self):
+        super().__init__(FakeCollection)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_updates_to_one_document_are_merged():
+    db = FakeDb()
+    buffer = WriteBehindBuffer(db, flush_interval=0)
+
+    async def scenario():
+        await buffer.update("community_cases", {"id": "a"}, inc={"helpful_count": 1})
+        await buffer.update("community_cases", {"id": "a"}, inc={"helpful_count": 2})
+        await buffer.update("community_cases", {"id": "b"}, inc={"helpful_count": 1})
+        assert buffer.pending() == 2
+        await buffer.flush()
+
+    run(scenario())
+    [operations] = db["community_cases"].bulk_writes
+    assert sorted(operations, key=repr) == [
+        UpdateOne({"id": "a"}, {"$inc": {"helpful_count": 3}}),
+        UpdateOne({"id": "b"}, {"$inc": {"helpful_count": 1}}),
+    ]
+    assert buffer.pending() == 0
+
+
+def test_appends_keep_their_order():
+    db = FakeDb()
+    buffer = WriteBehindBuffer(db, flush_interval=0)
+
+    async def scenario():
+        await buffer.update("sessions", {"session_id": "s"}, push={"events": [1]})
+        await buffer.update("sessions", {"session_id": "s"}, push={"events": [2, 3]})
+        await buffer.flush()
+
+    run(scenario())
+    assert db["sessions"].bulk_writes == [
+        [UpdateOne({"session_id": "s"}, {"$push": {"events": {"$each": [1, 2, 3]}}})]
+    ]
+
+
+def test_inserts_are_flushed_with_updates():
+    db = FakeDb()
+    buffer = WriteBehindBuffer(db, flush_interval=0)
+
+    async def scenario():
+        await buffer.insert("late", {"session_id": "s", "text": "a"})
+        await buffer.insert("late", {"session_id": "s", "text": "b"})
+        await buffer.flush()
+
+    run(scenario())
+    assert db["late"].bulk_writes == [
+        [InsertOne({"session_id": "s", "text": "a"}), InsertOne({"session_id": "s", "text": "b"})]
+    ]
+
+
+def test_failed_flush_is_requeued_before_newer_updates():
+    db = FakeDb()
+    db["sessions"].failures.append(ConnectionError("down"))
+    buffer = WriteBehindBuffer(db, flush_interval=0)
+
+    async def scenario():
+        await buffer.update("sessions", {"session_id": "s"}, inc={"n": 1}, push={"events": [1]})
+        await buffer.flush()
+        await buffer.update("sessions", {"session_id": "s"}, inc={"n": 1}, push={"events": [2]})
+        await buffer.flush()
+
+    run(scenario())
+    assert db["sessions"].bulk_writes[-1] == [
+        UpdateOne({"session_id": "s"}, {"$inc": {"n": 2}, "$push": {"events": {"$each": [1, 2]}}})
+    ]
+    assert buffer.stats()["collections"]["sessions"]["errors"] == 1
+
+
+def test_partial_bulk_failure_requeues_only_failed_documents():
+    db = FakeDb()
+    buffer = WriteBehindBuffer(db, flush_interval=0)
+
+    async def scenario():
+        await buffer.update("cases", {"id": "a"}, inc={"n": 1})
+        await buffer.update("cases", {"id": "b"}, inc={"n": 1})
+        # Fail whichever document was written first
+        db["cases"].failures.append(BulkWriteError({"writeErrors": [{"index": 0}]}))
+        await buffer.flush()
+        return db["cases"].bulk_writes[0][0]
+
+    failed = run(scenario())
+    assert buffer.pending() == 1
+    run(buffer.flush())
+    assert db["cases"].bulk_writes[-1] == [failed]
+
+
+def test_immediate_durability_writes_through():
+    db = FakeDb()
+    buffer = WriteBehindBuffer(db, flush_interval=0, durability={"cases": IMMEDIATE})
+
+    async def scenario():
+        await buffer.update("cases", {"id": "a"}, inc={"n": 1})
+        await buffer.insert("cases", {"id": "b"})
+
+    run(scenario())
+    assert db["cases"].updates == [({"id": "a"}, {"$inc": {"n": 1}})]
+    assert db["cases"].inserts == [{"id": "b"}]
+    assert buffer.pending() == 0
+
+
+def test_parse_durability():
+    assert parse_durability("cases=buffered, late = immediate") == {"cases": "buffered", "late": "immediate"}
+    with pytest.raises(ValueError):
+        parse_durability("cases=eventually")